@@ -0,0 +1,146 @@
+"""Single-pass aggregation of reduced flight data"""
+import itertools
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+
+def aggregate(reduced_data, airports, passenger_summary=None):
+    """Aggregate reduced flight data in a single pass
+
+    Each reduced row is split once and used to update every aggregate,
+    rather than re-scanning the reduced data once per airport.
+
+    Args:
+        reduced_data (list): reduced data rows, flight string at index 0
+        airports (list): list of airports
+        passenger_summary: summary to count passengers into, such as
+            heavy_hitters.HeavyHitters, rather than counting every passenger
+    Returns:
+        dict: airports to number of flights from those airports
+        dict: airports to number of passengers flying to those airports
+        Counter: passengers to number of flights taken, or the summary
+    """
+    flight_counts = dict.fromkeys(airports, 0)
+    passenger_counts = dict.fromkeys(airports, 0)
+    passenger_flights = Counter() if passenger_summary is None else passenger_summary
+
+    for row in reduced_data:
+        # Split the flight string once for every aggregate
+        elements = row[0].split(",")
+        # Flight key is prefixed with the from airport
+        from_airport = elements[0][:3]
+        if from_airport in flight_counts:
+            flight_counts[from_airport] += 1
+        if elements[1] in passenger_counts:
+            passenger_counts[elements[1]] += len(elements) - 4
+        passenger_flights.update(elements[4:])
+
+    return flight_counts, passenger_counts, passenger_flights
+
+
+def count_by(values, weights=None):
+    """Count, or sum weights, for each distinct value of an array
+
+    Args:
+        values (np.ndarray): fixed-width bytes array
+        weights (np.ndarray): weight of each value, counts values if None
+    Returns:
+        dict: decoded distinct values to counts
+    """
+    names, inverse = np.unique(values, return_inverse=True)
+    counts = np.bincount(inverse, weights=weights, minlength=len(names))
+    return dict(zip(np.char.decode(names, "ascii").tolist(), counts.astype(np.int64).tolist()))
+
+
+def aggregate_columnar(columns, airports, passenger_summary=None, count_passengers=True):
+    """Aggregate columnar reduced flight data with array operations
+
+    Args:
+        columns (dict): column arrays loaded by columnar.load
+        airports (list): list of airports
+        passenger_summary: summary to count passenger indices into, such
+            as heavy_hitters.HeavyHitters, rather than counting every passenger
+        count_passengers (bool): count passengers, False when the reducers
+            already summarized them
+    Returns:
+        dict: airports to number of flights from those airports
+        dict: airports to number of passengers flying to those airports
+        dict: passengers to number of flights taken, or the summary
+    """
+    from_counts = count_by(columns["from_airport"])
+    to_counts = count_by(columns["to_airport"], np.diff(columns["passenger_offsets"]))
+    flight_counts = {airport: from_counts.get(airport, 0) for airport in airports}
+    passenger_counts = {airport: to_counts.get(airport, 0) for airport in airports}
+
+    if passenger_summary is not None or not count_passengers:
+        if count_passengers:
+            passenger_summary.update(np.asarray(columns["passenger_ids"]))
+        return flight_counts, passenger_counts, passenger_summary
+
+    # Passenger ids index the distinct passengers, so counts are one bincount
+    counts = np.bincount(columns["passenger_ids"], minlength=len(columns["passengers"]))
+    passenger_flights = dict(zip(np.char.decode(columns["passengers"], "ascii").tolist(), counts.tolist()))
+
+    return flight_counts, passenger_counts, passenger_flights
+
+
+def aggregate_encoded(flights, dictionaries, airports, passenger_summary=None, count_passengers=True):
+    """Aggregate dictionary encoded reduced flights with array operations
+
+    Counts are taken over integer codes, only the counted airports and
+    passengers are decoded.
+
+    Args:
+        flights (list): reduced EncodedFlight objects
+        dictionaries (dict): airport, flight and passenger dictionaries
+        airports (list): list of airports
+        passenger_summary: summary to count passenger codes into, such as
+            heavy_hitters.HeavyHitters, rather than counting every passenger
+        count_passengers (bool): count passengers, False when the reducers
+            already summarized them
+    Returns:
+        dict: airports to number of flights from those airports
+        dict: airports to number of passengers flying to those airports
+        dict: passengers to number of flights taken, or the summary
+    """
+    from_airports = np.fromiter((flight.from_airport for flight in flights), np.int64, len(flights))
+    to_airports = np.fromiter((flight.to_airport for flight in flights), np.int64, len(flights))
+    sizes = np.fromiter((len(flight.passengers) for flight in flights), np.int64, len(flights))
+    passengers = np.fromiter(
+        itertools.chain.from_iterable(flight.passengers for flight in flights), np.int64, sizes.sum()
+    )
+
+    airport_values = dictionaries["airport"].values
+    from_counts = dict(zip(airport_values, np.bincount(from_airports, minlength=len(airport_values)).tolist()))
+    to_counts = dict(zip(
+        airport_values, np.bincount(to_airports, sizes, minlength=len(airport_values)).astype(np.int64).tolist()
+    ))
+    flight_counts = {airport: from_counts.get(airport, 0) for airport in airports}
+    passenger_counts = {airport: to_counts.get(airport, 0) for airport in airports}
+
+    if passenger_summary is not None or not count_passengers:
+        if count_passengers:
+            passenger_summary.update(passengers)
+        return flight_counts, passenger_counts, passenger_summary
+
+    passenger_values = dictionaries["passenger"].values
+    counts = np.bincount(passengers, minlength=len(passenger_values))
+    passenger_flights = dict(zip(passenger_values, counts.tolist()))
+
+    return flight_counts, passenger_counts, passenger_flights
+
+
+def rank(counts, columns):
+    """Order counts by value descending, ties broken by key ascending
+
+    Args:
+        counts (dict): keys to counts
+        columns (list): column names for key and count
+    Returns:
+        pd.DataFrame: ranked counts
+    """
+    # One stable sort on a composite (-count, key) key
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return pd.DataFrame(ranked, columns=columns)
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""Benchmarks for the MapReduce stages and tasks
+
+Usage:
+    python benchmark.py [benchmark ...] [--sizes N ...] [--workers N ...]
+        [--skew S] [--seed N] [--report FILE] [--baseline FILE]
+"""
+import argparse
+import functools
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import aggregator
+import buffers
+import columnar
+import combiner
+import encoding
+import flight
+import generator
+import mapper
+import partitioning
+import reducer
+import sorter
+from executor import Executor
+from main import get_reduced_data
+
+
+def airport_codes(count):
+    """Distinct synthetic airport codes
+
+    Args:
+        count (int): number of airports
+    Returns:
+        list: airport codes
+    """
+    return generator.generate_airport_data(count)["airport_code"].tolist()
+
+
+def make_reduced_rows(flight_count, airports, passengers=500, per_flight=15, seed=0):
+    """Generate synthetic reduced rows in the format of get_reduced_data
+
+    Args:
+        flight_count (int): number of reduced flights
+        airports (list): airport codes
+        passengers (int): number of distinct passengers
+        per_flight (int): passengers per flight
+        seed (int): random seed
+    Returns:
+        list: reduced data rows
+    """
+    rng = np.random.default_rng(seed)
+    passenger_ids = generator.random_codes(rng, passengers, "XXXnnnnXXn")
+    flight_ids = generator.random_codes(rng, flight_count, "XXXnnnnX")
+    rows = []
+    for flight_id in flight_ids:
+        from_airport, to_airport = rng.choice(airports, 2, replace=False)
+        fields = [
+            from_airport + "_" + flight_id,
+            to_airport,
+            str(rng.integers(1420563000, 1420566000)),
+            str(rng.integers(100, 2500)),
+        ]
+        fields.extend(rng.choice(passenger_ids, per_flight, replace=False))
+        rows.append([",".join(fields)])
+    return rows
+
+
+def make_passenger_rows(row_count, flight_count, airports, passengers=500, seed=0):
+    """Generate synthetic passenger data rows in the passenger data schema
+
+    Args:
+        row_count (int): number of passenger rows
+        flight_count (int): number of distinct flights
+        airports (list): airport codes
+        passengers (int): number of distinct passengers
+        seed (int): random seed
+    Returns:
+        list: comma separated passenger data rows
+    """
+    data = generator.generate_passenger_data(row_count, flight_count, airports, passengers, seed=seed)
+    return data.astype(str).agg(",".join, axis=1).tolist()
+
+
+class LegacyFlight:
+    """Flight with a per-instance __dict__ and string fields, as the
+    pipeline used before Flight gained __slots__, kept for comparison"""
+
+    def __init__(self, flight_data):
+        (
+            flight_from,
+            self.to_airport,
+            self.depart_time,
+            self.total_flight_time,
+            self.passenger_list,
+        ) = flight_data.strip().split(",", 4)
+
+        self.flight_id, self.from_airport = flight_from.split("_")
+        self.passenger_list = list(set(self.passenger_list.strip().split(",")))
+
+
+def legacy_map(data):
+    """Map passenger data through a DataFrame.to_string round-trip, as the
+    mapper did before the map stage was vectorized, kept for comparison
+
+    Args:
+        data (pd.DataFrame): passenger data with headers
+    Returns:
+        list: a Flight for every passenger row
+    """
+    rows = data.to_string(header=False, index=False, index_names=False).split("\n")
+    flights = []
+    for row in rows:
+        elements = row.split()
+        elements = elements[-5:] + elements[:-5]
+        flight_data = [elements[1] + "_" + elements[0]]
+        flight_data.extend(elements[2:])
+        flights.append(flight.Flight(",".join(flight_data)))
+    return flights
+
+
+def bytes_per_object(cls, rows):
+    """Average bytes allocated per object built from rows
+
+    Args:
+        cls (type): class constructed from a row string
+        rows (list): row strings
+    Returns:
+        float: bytes allocated per object
+    """
+    tracemalloc.start()
+    objects = [cls(row) for row in rows]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(objects)
+
+
+def time_call(func, *args, repeat=3):
+    """Best wall time of repeated calls
+
+    Args:
+        func (callable): function to time
+        repeat (int): number of calls
+    Returns:
+        float: fastest call in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_aggregate(sizes=(10_000, 100_000, 1_000_000)):
+    """Time single-pass aggregation over growing reduced data
+
+    Time per row staying flat as the row count grows shows the
+    aggregation scales linearly with input size.
+
+    Args:
+        sizes (tuple): reduced row counts to benchmark
+    """
+    airports = airport_codes(300)
+    print("[*]\tAggregate")
+    print("Rows\t\t| Seconds\t| ns/row")
+    for size in sizes:
+        rows = make_reduced_rows(size, airports)
+        seconds = time_call(aggregator.aggregate, rows, airports)
+        print(f"{size:<12}\t| {seconds:.4f}\t| {seconds / size * 1e9:.0f}")
+
+
+def benchmark_flight(size=200_000):
+    """Compare memory and serialization of Flight against LegacyFlight
+
+    Args:
+        size (int): number of flights, each from a mapped row
+    """
+    airports = airport_codes(30)
+    # Mapped rows carry a single passenger each
+    rows = [row[0] for row in make_reduced_rows(size, airports, per_flight=1)]
+    legacy = [LegacyFlight(row) for row in rows]
+    flights = [flight.Flight(row) for row in rows]
+
+    print("[*]\tFlight")
+    print("Format\t\t| Bytes/flight\t| Serialized bytes/flight\t| Flights/s")
+    results = [
+        ("legacy pickle", LegacyFlight, pickle.dumps, legacy),
+        ("slots pickle", flight.Flight, pickle.dumps, flights),
+        ("slots binary", flight.Flight, flight.serialize, flights),
+    ]
+    for name, cls, dump, objects in results:
+        memory = bytes_per_object(cls, rows)
+        serialized = len(dump(objects))
+        seconds = time_call(dump, objects)
+        print(f"{name:<12}\t| {memory:.0f}\t\t| {serialized / size:.1f}\t\t\t\t| {size / seconds:,.0f}")
+
+
+def benchmark_map(rows=10_000_000, flights=100_000):
+    """Compare the vectorized map stage against the to_string mapper
+
+    Args:
+        rows (int): number of synthetic passenger rows
+        flights (int): number of distinct flights
+    """
+    airports = airport_codes(30)
+    data = generator.generate_passenger_data(rows, flights, airports, max(rows // 25, 1))
+
+    print("[*]\tMap")
+    print("Mapper\t\t| Seconds\t| Rows/s")
+    results = [
+        ("to_string", time_call(legacy_map, data, repeat=1)),
+        ("vectorized", time_call(mapper._map, data, 0, repeat=1)),
+    ]
+    for name, seconds in results:
+        print(f"{name:<12}\t| {seconds:.2f}\t| {rows / seconds:,.0f}")
+    print(f"Speedup: {results[0][1] / results[1][1]:.1f}x")
+
+
+def benchmark_sort(scales=(1, 10, 100), memory_limit=1024 * 1024):
+    """Compare in-memory and external sorting of mapped lines
+
+    Args:
+        scales (tuple): data-set sizes as multiples of the sample data
+        memory_limit (int): memory ceiling of an external sort run, in bytes
+    """
+    airports = airport_codes(30)
+
+    print("[*]\tSort")
+    print("Scale\t| Rows\t\t| In-memory seconds\t| External seconds")
+    for scale in scales:
+        rows = make_passenger_rows(500 * scale, 30 * scale, airports)
+        lines = [mapper.map_line(row) + "\n" for row in rows]
+        in_memory = time_call(lambda: sorted(lines, key=sorter.get_key), repeat=1)
+        external = time_call(lambda: list(sorter.external_sort(lines, memory_limit)), repeat=1)
+        print(f"{scale}x\t| {len(lines):<12}\t| {in_memory:.4f}\t\t| {external:.4f}")
+
+
+def benchmark_columnar(flights=1_000_000):
+    """Compare loading and aggregating reduced csv against columnar output
+
+    Args:
+        flights (int): number of reduced flights
+    """
+    airports = airport_codes(30)
+    rows = make_reduced_rows(flights, airports)
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file = os.path.join(directory, "reduced_data.csv")
+        with open(csv_file, "w", encoding="utf-8") as file:
+            file.writelines(row[0] + "\n" for row in rows)
+        columnar_dir = os.path.join(directory, "reduced_columnar")
+        columnar.save(columnar.read_reduced(csv_file), columnar_dir)
+
+        print("[*]\tColumnar")
+        print("Format\t\t| Load seconds\t| Aggregate seconds")
+        results = [
+            ("csv", get_reduced_data, csv_file, aggregator.aggregate),
+            ("columnar", columnar.load, columnar_dir, aggregator.aggregate_columnar),
+        ]
+        for name, load, path, aggregate in results:
+            load_seconds = time_call(load, path, repeat=1)
+            aggregate_seconds = time_call(aggregate, load(path), airports, repeat=1)
+            print(f"{name:<12}\t| {load_seconds:.4f}\t| {aggregate_seconds:.4f}")
+
+
+def shuffle_bytes(rows, splits):
+    """Bytes each map task would shuffle without and with the combiner
+
+    Args:
+        rows (list): passenger data rows
+        splits (int): number of map tasks the rows are split between
+    Returns:
+        int: bytes of mapped lines
+        int: bytes of combined lines
+    """
+    mapped_bytes = combined_bytes = 0
+    for split in range(splits):
+        # Hadoop sorts each map task's output by key before combining
+        mapped = sorted((mapper.map_line(row) for row in rows[split::splits]), key=sorter.get_key)
+        mapped_bytes += sum(len(line) + 1 for line in mapped)
+        combined_bytes += sum(len(line) + 1 for line in combiner.combine(mapped))
+    return mapped_bytes, combined_bytes
+
+
+def benchmark_combiner(scale=1000, splits=4):
+    """Measure shuffle bytes saved by the combiner
+
+    Args:
+        scale (int): synthetic data-set size as a multiple of the sample data
+        splits (int): number of map tasks
+    """
+    with open("data/AComp_Passenger_data_no_error.csv", encoding="utf-8") as file:
+        sample = [line.strip() for line in file if line.strip()]
+    airports = airport_codes(30)
+    datasets = [
+        ("sample", sample),
+        (f"synthetic x{scale}", make_passenger_rows(len(sample) * scale, 30 * scale, airports)),
+    ]
+
+    print("[*]\tCombiner")
+    print("Data-set\t\t| Mapped bytes\t| Combined bytes\t| Saved")
+    for name, rows in datasets:
+        mapped_bytes, combined_bytes = shuffle_bytes(rows, splits)
+        saved = 1 - combined_bytes / mapped_bytes
+        print(f"{name:<16}\t| {mapped_bytes:<12}\t| {combined_bytes:<12}\t| {saved:.1%}")
+
+
+def time_stage(results, stage, records, workers, func, *args):
+    """Time one pipeline stage and record its throughput
+
+    Args:
+        results (list): stage results to append to
+        stage (str): stage name
+        records (int): number of records the stage processes
+        workers (int): number of worker processes
+        func (callable): stage function
+    Returns:
+        output of the stage function
+    """
+    start = time.perf_counter()
+    output = func(*args)
+    seconds = time.perf_counter() - start
+    results.append({
+        "stage": stage,
+        "workers": workers,
+        "records": records,
+        "seconds": seconds,
+        "records_per_second": records / seconds,
+    })
+    return output
+
+
+def run_pipeline(data, airports, workers):
+    """Time each stage of one MapReduce run and the tasks on its output
+
+    Args:
+        data (pd.DataFrame): passenger data with headers
+        airports (list): airport codes
+        workers (int): number of worker processes, 1 runs stages in-process
+    Returns:
+        list: stage results
+    """
+    results = []
+    rows = len(data)
+    # NOTE: Stages run on dictionary encoded data, as in main.py
+    encoded, dictionaries = time_stage(results, "encode", rows, workers, encoding.encode_frame, data, airports)
+    flight.EncodedFlight.dictionaries = dictionaries
+    if workers == 1:
+        mapped = time_stage(results, "map", rows, workers, mapper._map, encoded, 0)
+        flights = time_stage(results, "sort", len(mapped), workers, sorter._sort, mapped, 0)
+        reduced = time_stage(results, "reduce", len(flights), workers, reducer._reduce, flights, 0)
+
+        # Hadoop streaming combiner over sorted mapped lines
+        lines = sorted((mapper.map_line(",".join(map(str, row))) for row in data.itertuples(index=False)), key=sorter.get_key)
+        time_stage(results, "combine", rows, workers, lambda: list(combiner.combine(lines)))
+    else:
+        with Executor(workers) as executor:
+            partitions, partitioner = time_stage(
+                results, "partition", rows, workers, partitioning.plan, encoded, workers,
+            )
+            map_results = time_stage(
+                results, "map", rows, workers,
+                executor.run, functools.partial(mapper.shuffle_map, partitioner=partitioner), partitions, True,
+            )
+            # NOTE: Each reducer sorts its own buckets, so sort is timed with
+            #   reduce, the sort stage is only timed on one worker
+            reduced = time_stage(
+                results, "sort_reduce", rows, workers, reducer.multithread_reduce, map_results, executor,
+            )
+            reduced = reducer.merge_split_keys(buffers.load(reduced), partitioner.hot_keys)
+            reduced = [flight for flights in reduced for flight in flights]
+
+    time_stage(
+        results, "tasks", len(reduced), workers,
+        lambda: [
+            aggregator.rank(counts, ["key", "count"])
+            for counts in aggregator.aggregate_encoded(reduced, dictionaries, airports)
+        ],
+    )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Find stages whose throughput regressed against a baseline report
+
+    Args:
+        results (list): stage results
+        baseline (dict): baseline benchmark report
+        tolerance (float): allowed fractional drop in throughput
+    Returns:
+        list: (result, baseline result) pairs of regressed stages
+    """
+    key = lambda result: (result["stage"], result["rows"], result["workers"])
+    baseline_results = {key(result): result for result in baseline["results"]}
+    return [
+        (result, baseline_results[key(result)])
+        for result in results
+        if key(result) in baseline_results
+        and result["records_per_second"] < baseline_results[key(result)]["records_per_second"] * (1 - tolerance)
+    ]
+
+
+def benchmark_pipeline(sizes=(10_000, 100_000, 1_000_000), workers=(1, os.cpu_count()), skew=0.0, seed=0,
+                       report="benchmark_report.json", baseline=None, tolerance=0.2):
+    """Time every pipeline stage across data-set sizes and worker counts
+
+    Args:
+        sizes (tuple): passenger row counts
+        workers (tuple): worker process counts
+        skew (float): flight key skew of the synthetic data
+        seed (int): random seed of the synthetic data
+        report (str): file to write the JSON report to
+        baseline (str): JSON report to check for throughput regressions against
+        tolerance (float): allowed fractional drop in throughput
+    Returns:
+        list: regressed stages
+    """
+    # NOTE: Each worker count is run once, the default's cpu count may be 1
+    workers = sorted(set(workers))
+    airports = airport_codes(30)
+    results = []
+    for size in sizes:
+        data = generator.generate_passenger_data(size, max(size // 25, 1), airports, max(size // 25, 1), skew, seed)
+        for worker_count in workers:
+            for result in run_pipeline(data, airports, worker_count):
+                results.append({"rows": size, **result})
+
+    print("[*]\tPipeline")
+    print("Rows\t\t| Workers\t| Stage\t\t| Seconds\t| Records/s")
+    for result in results:
+        print(f"{result['rows']:<12}\t| {result['workers']}\t\t| {result['stage']:<8}\t| "
+              f"{result['seconds']:.4f}\t| {result['records_per_second']:,.0f}")
+
+    with open(report, "w", encoding="utf-8") as file:
+        json.dump({
+            "parameters": {"sizes": list(sizes), "workers": list(workers), "skew": skew, "seed": seed},
+            "results": results,
+        }, file, indent=2)
+
+    if baseline is None:
+        return []
+    with open(baseline, "r", encoding="utf-8") as file:
+        regressions = compare(results, json.load(file), tolerance)
+    for result, baseline_result in regressions:
+        print(f"[!]\tRegression: {result['stage']} at {result['rows']} rows, {result['workers']} workers, "
+              f"{result['records_per_second']:,.0f} records/s against {baseline_result['records_per_second']:,.0f}")
+    return regressions
+
+
+BENCHMARKS = {
+    "aggregate": benchmark_aggregate,
+    "flight": benchmark_flight,
+    "combiner": benchmark_combiner,
+    "map": benchmark_map,
+    "sort": benchmark_sort,
+    "columnar": benchmark_columnar,
+}
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Run MapReduce benchmarks")
+    parser.add_argument("benchmarks", nargs="*", help="benchmarks to run, defaults to every benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="pipeline passenger row counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()],
+                        help="pipeline worker process counts")
+    parser.add_argument("--skew", type=float, default=0.0, help="pipeline flight key skew")
+    parser.add_argument("--seed", type=int, default=0, help="pipeline random seed")
+    parser.add_argument("--report", default="benchmark_report.json", help="pipeline JSON report file")
+    parser.add_argument("--baseline", help="pipeline JSON report to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed fractional throughput drop")
+    args = parser.parse_args()
+
+    benchmarks = dict(BENCHMARKS, pipeline=functools.partial(
+        benchmark_pipeline, args.sizes, args.workers, args.skew, args.seed,
+        args.report, args.baseline, args.tolerance,
+    ))
+    regressions = []
+    for name in args.benchmarks or list(benchmarks):
+        regressions.extend(benchmarks[name]() or [])
+    # Fail when throughput regressed, so the runner can gate changes
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
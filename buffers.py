@@ -0,0 +1,143 @@
+"""Shared memory partition buffers passed between MapReduce stages"""
+from multiprocessing import shared_memory
+
+import flight
+import instrument
+
+
+class PartitionBuffer:
+    """Handle to a serialized partition of flights held in shared memory
+
+    Only the handle is pickled between the parent and worker processes,
+    the flights themselves are written once and read once.
+
+    Attributes:
+        name (str): shared memory block name
+        size (int): number of bytes of serialized flights in the block
+        encoded (bool): whether the flights are dictionary encoded
+    """
+
+    def __init__(self, name, size, encoded=False):
+        """Initialise partition buffer handle
+
+        Args:
+            name (str): shared memory block name
+            size (int): number of bytes of serialized flights in the block
+            encoded (bool): whether the flights are dictionary encoded
+        """
+        self.name = name
+        self.size = size
+        self.encoded = encoded
+
+    @classmethod
+    def write(cls, flights):
+        """Serialize flights into a new shared memory block
+
+        Args:
+            flights (list): list of Flight objects
+        Returns:
+            PartitionBuffer: handle to the written partition
+        """
+        encoded = bool(flights) and isinstance(flights[0], flight.EncodedFlight)
+        data = flight.serialize_encoded(flights) if encoded else flight.serialize(flights)
+        # NOTE: Shared memory blocks can't be empty
+        block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        block.buf[:len(data)] = data
+        buffer = cls(block.name, len(data), encoded)
+        block.close()
+        return buffer
+
+    def read(self, unlink=True):
+        """Deserialize flights from shared memory
+
+        Args:
+            unlink (bool): free the shared memory block once read
+        Returns:
+            list: list of Flight objects
+        """
+        block = shared_memory.SharedMemory(name=self.name)
+        data = bytes(block.buf[:self.size])
+        block.close()
+        if unlink:
+            block.unlink()
+        return flight.deserialize_encoded(data) if self.encoded else flight.deserialize(data)
+
+
+def load(partition, unlink=True):
+    """Resolve partition buffers, or lists of them, to flights
+
+    Args:
+        partition: PartitionBuffer, list of partitions or plain data
+        unlink (bool): free shared memory blocks once read
+    Returns:
+        list of Flight objects, or the partition unchanged if not buffered
+    """
+    if isinstance(partition, PartitionBuffer):
+        return partition.read(unlink)
+    if isinstance(partition, list):
+        return [load(item, unlink) for item in partition]
+    return partition
+
+
+def free(partition):
+    """Free the shared memory blocks of partition buffers, or lists of them
+
+    Args:
+        partition: PartitionBuffer, list of partitions or plain data,
+            blocks already freed are skipped
+    """
+    if isinstance(partition, PartitionBuffer):
+        try:
+            block = shared_memory.SharedMemory(name=partition.name)
+        except FileNotFoundError:
+            return
+        block.close()
+        block.unlink()
+    elif isinstance(partition, list):
+        for item in partition:
+            free(item)
+
+
+def size_of(partition):
+    """Bytes of shared memory held by partition buffers
+
+    Args:
+        partition: PartitionBuffer, list of partitions or plain data
+    Returns:
+        int: serialized bytes, 0 for plain data
+    """
+    if isinstance(partition, PartitionBuffer):
+        return partition.size
+    if isinstance(partition, list):
+        return sum(size_of(item) for item in partition)
+    return 0
+
+
+def exchange(func, partition, procnum, shuffle=False):
+    """Run a stage function on a worker, reading and writing buffers
+
+    Args:
+        func (callable): stage function called as func(data, procnum)
+        partition: partition buffer(s) or plain data to run the stage on
+        procnum (int): thread/process number
+        shuffle (bool): stage returns one list of flights per reducer
+    Returns:
+        PartitionBuffer: handle to the stage's output partition, or a
+            list of handles, one per reducer, when shuffling
+    """
+    # NOTE: Stage functions may be wrapped in functools.partial
+    name = getattr(func, "func", func).__name__
+    with instrument.stage(name, procnum) as fields:
+        # NOTE: Inputs are freed by the executor once the task succeeds, so
+        #   a retried or speculative attempt can read them again
+        data = load(partition, unlink=False)
+        fields["records_in"] = instrument.count_records(data)
+        fields["bytes_in"] = size_of(partition)
+        result = func(data, procnum)
+        fields["records_out"] = instrument.count_records(result)
+        if shuffle:
+            output = [PartitionBuffer.write(bucket) for bucket in result]
+        else:
+            output = PartitionBuffer.write(result)
+        fields["bytes_out"] = size_of(output)
+    return output
@@ -0,0 +1,242 @@
+"""Content-addressed cache of MapReduce stage outputs
+
+Entries are keyed by a hash of the input data, the source of the
+pipeline modules and the settings that change the output, so rerunning
+on identical input restores the outputs instead of recomputing them and
+any change to the input, code or settings misses. The cache is bounded
+in size, evicting the least recently used entries first.
+
+Each entry records the modification time and size its outputs were
+stored with. An output since rewritten by something other than a cached
+run, such as an incremental run, is never overwritten by a restore, the
+run misses and recomputes its outputs instead.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+MANIFEST = "manifest.json"
+
+
+def hash_file(file_name, digest=None):
+    """Hash a file's content in fixed-size chunks
+
+    Args:
+        file_name (str): file to hash
+        digest (hashlib object): digest to update, a new sha256 if None
+    Returns:
+        hashlib object: updated digest
+    """
+    digest = digest or hashlib.sha256()
+    with open(file_name, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest
+
+
+def size_of(path):
+    """Bytes on disk of a file or directory tree
+
+    Args:
+        path (str): file or directory
+    Returns:
+        int: size in bytes
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def fingerprint(path):
+    """Modification time and size of a file or directory tree
+
+    Args:
+        path (str): file or directory
+    Returns:
+        list: latest modification time in nanoseconds and size in bytes,
+            None if the path doesn't exist or holds no files
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    if not os.path.isdir(path):
+        return None
+    # NOTE: Directory mtimes change as trees are copied, only their files' are kept
+    stats = [
+        os.stat(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    ]
+    if not stats:
+        return None
+    return [max(stat.st_mtime_ns for stat in stats), sum(stat.st_size for stat in stats)]
+
+
+def copy(source, destination):
+    """Copy a file or directory tree, replacing the destination
+
+    Args:
+        source (str): file or directory to copy
+        destination (str): path to copy to
+    """
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination)
+    else:
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        shutil.copy2(source, destination)
+
+
+class StageCache:
+    """Size-bounded LRU cache of stage output files
+
+    Attributes:
+        directory (str): directory cache entries are stored in
+        max_bytes (int): total size entries are evicted down to
+    """
+
+    def __init__(self, directory, max_bytes):
+        """Initialise cache
+
+        Args:
+            directory (str): directory cache entries are stored in
+            max_bytes (int): total size entries are evicted down to
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, input_files, code_files, settings):
+        """Content address of a run
+
+        Args:
+            input_files (list): data files the run reads
+            code_files (list): source files of the pipeline modules
+            settings (dict): settings that change the run's output
+        Returns:
+            str: cache key
+        """
+        digest = hashlib.sha256()
+        for file_name in [*input_files, *code_files]:
+            digest = hash_file(file_name, digest)
+        digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def restore(self, key):
+        """Copy a cached entry's outputs back to where the run wrote them
+
+        Args:
+            key (str): cache key
+        Returns:
+            bool: True on a cache hit
+        """
+        entry = os.path.join(self.directory, key)
+        manifest = self._manifest(entry)
+        if manifest is None:
+            return False
+        current = [fingerprint(output) for output in manifest["outputs"]]
+        # NOTE: Outputs no cached run wrote are newer than any entry, so
+        #   restoring over them would roll them back
+        cached = self._fingerprints()
+        for output, stat in zip(manifest["outputs"], current):
+            if stat is not None and stat not in cached.get(os.path.abspath(output), []):
+                print(f"[*]\tCached outputs are older than {output}")
+                return False
+        for index, output in enumerate(manifest["outputs"]):
+            # Outputs left by this entry's own restore or run needn't be copied
+            if current[index] != manifest["fingerprints"][index]:
+                copy(os.path.join(entry, str(index)), output)
+        # NOTE: Entry modification time records when it was last used
+        os.utime(entry)
+        return True
+
+    def store(self, key, outputs):
+        """Cache a run's outputs, then evict down to the size bound
+
+        Args:
+            key (str): cache key
+            outputs (list): output files and directories of the run
+        """
+        outputs = [output for output in outputs if output and os.path.exists(output)]
+        # NOTE: Build the entry aside and rename it in, so a crash never
+        #   leaves a partial entry that would be restored as a hit
+        staging = tempfile.mkdtemp(dir=self.directory)
+        for index, output in enumerate(outputs):
+            copy(output, os.path.join(staging, str(index)))
+        # NOTE: Copies keep their modification times, so restored outputs
+        #   match the fingerprints of the outputs they were copied from
+        manifest = {"outputs": outputs, "fingerprints": [fingerprint(output) for output in outputs]}
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.replace(staging, entry)
+        self.evict()
+
+    def invalidate(self, output):
+        """Remove every entry with an output another process is rewriting
+
+        Args:
+            output (str): output file or directory being rewritten
+        """
+        output = os.path.abspath(output)
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            manifest = self._manifest(entry)
+            if manifest is not None and output in map(os.path.abspath, manifest["outputs"]):
+                shutil.rmtree(entry)
+
+    def _manifest(self, entry):
+        """Outputs of an entry and the fingerprints they were stored with
+
+        Args:
+            entry (str): entry directory
+        Returns:
+            dict: outputs and fingerprints lists, None if not a complete entry
+        """
+        try:
+            with open(os.path.join(entry, MANIFEST), "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        # NOTE: Entries from before fingerprints were kept are never restored
+        return manifest if isinstance(manifest, dict) else None
+
+    def _fingerprints(self):
+        """Fingerprints of every output any entry can restore
+
+        Returns:
+            dict: absolute output paths to the fingerprints cached for them
+        """
+        cached = {}
+        for name in os.listdir(self.directory):
+            manifest = self._manifest(os.path.join(self.directory, name))
+            if manifest is None:
+                continue
+            for output, stat in zip(manifest["outputs"], manifest["fingerprints"]):
+                cached.setdefault(os.path.abspath(output), []).append(stat)
+        return cached
+
+    def evict(self):
+        """Remove least recently used entries until within max_bytes"""
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        entries = sorted(
+            (entry for entry in entries if os.path.isdir(entry)),
+            key=os.path.getmtime,
+        )
+        sizes = {entry: size_of(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry)
+            total -= sizes[entry]
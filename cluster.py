@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""Multi-node MapReduce over TCP, a local replacement for Hadoop
+
+A coordinator splits the dictionary encoded passenger data and hands out
+map and reduce tasks to worker processes that connect to it over TCP,
+which may be on other machines. Map tasks run mapper.shuffle_map and keep
+their reducer buckets on the worker; each worker also serves its buckets,
+so reduce tasks fetch their shuffle partitions straight from the workers
+that mapped them and run reducer.shuffle_reduce. Only the reduced flights
+are sent back to the coordinator, which writes the reduced output and
+prints Task 1 and Task 2.
+
+Tasks and buckets are pickled over the network, so cluster.py refuses to
+listen beyond loopback while CLUSTER_AUTHKEY is still the default key.
+
+Usage:
+    python cluster.py coordinator --workers N
+    python cluster.py worker [--coordinator HOST:PORT] [--host HOST]
+    python cluster.py local --workers N
+"""
+import argparse
+import ipaddress
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+
+from dotenv import load_dotenv
+
+import aggregator
+import encoding
+import flight
+import mapper
+import mileage
+import partitioning
+import reducer
+from main import (
+    get_airport_data,
+    get_airports,
+    get_passenger_with_most_flights,
+    get_total_airport_flights,
+    get_valid_passenger_data,
+    init_settings,
+    invalidate_cached,
+    print_task_1_results,
+    print_task_2_results,
+)
+
+# Seconds a worker keeps retrying to connect to a coordinator that isn't up yet
+CONNECT_TIMEOUT = 60
+# Seconds a reducer waits for a bucket from another worker
+FETCH_TIMEOUT = 300
+# Committed CLUSTER_AUTHKEY, only trusted on loopback
+DEFAULT_AUTHKEY = b"mapreduce"
+
+
+def serve_connections(listener, authkey, handle, stopped):
+    """Authenticate and handle each connection to a listener in its own
+    thread, so a stray or stalled client can't stop or block the others
+
+    Args:
+        listener (Listener): listener created without an authkey
+        authkey (bytes): key clients must authenticate with
+        handle (callable): called with each authenticated connection
+        stopped (threading.Event): set before the listener is closed
+    """
+    while True:
+        try:
+            connection = listener.accept()
+        except OSError:
+            if stopped.is_set():
+                return
+            continue
+        threading.Thread(target=_authenticate, args=(connection, authkey, handle), daemon=True).start()
+
+
+def _authenticate(connection, authkey, handle):
+    """Authenticate a connection like an authenticated Listener, then handle it
+
+    Args:
+        connection (Connection): accepted connection
+        authkey (bytes): key the client must authenticate with
+        handle (callable): called with the authenticated connection
+    """
+    try:
+        deliver_challenge(connection, authkey)
+        answer_challenge(connection, authkey)
+        handle(connection)
+    except Exception as error:
+        # NOTE: Covers clients that disconnect, fail authentication or
+        #   send a bad request, none of which affect other connections
+        print(f"[*]\tDropped connection: {error!r}")
+        connection.close()
+
+
+def is_loopback(host):
+    """Whether a host resolves to a loopback address
+
+    Args:
+        host (str): host name or address
+    Returns:
+        bool: True if only reachable from this machine
+    """
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+class Coordinator:
+    """Hands out map and reduce tasks to connected workers
+
+    Attributes:
+        address (tuple): host and port workers connect to
+        workers (int): number of workers to wait for
+        task_timeout (float): seconds a worker may take over a task, 0 for no limit
+    """
+
+    def __init__(self, address, authkey, workers, task_timeout=0):
+        """Initialise coordinator
+
+        Args:
+            address (tuple): host and port to listen on
+            authkey (bytes): key workers must authenticate with
+            workers (int): number of workers to wait for
+            task_timeout (float): seconds a worker may take over a task, 0 for no limit
+        """
+        self.address = address
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self._authkey = authkey
+        self._listener = None
+        self._stopped = threading.Event()
+        self._connections = []
+        self._shuffle_addresses = []
+
+    def __enter__(self):
+        """Wait for every worker to connect and register
+
+        Returns:
+            Coordinator: this coordinator
+        """
+        # NOTE: Connections are authenticated by serve_connections
+        self._listener = Listener(self.address)
+        print(f"[*]\tCoordinator on {self.address[0]}:{self.address[1]}, waiting for {self.workers} workers")
+        registered = queue.Queue()
+        threading.Thread(
+            target=serve_connections,
+            args=(self._listener, self._authkey, lambda connection: registered.put((connection, connection.recv())),
+                  self._stopped),
+            daemon=True,
+        ).start()
+        for _ in range(self.workers):
+            connection, (_, shuffle_address) = registered.get()
+            self._connections.append(connection)
+            self._shuffle_addresses.append(shuffle_address)
+            print(f"[*]\tWorker {len(self._connections) - 1} registered, serving shuffle on {shuffle_address}")
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop every worker"""
+        for connection in self._connections:
+            try:
+                connection.send(("stop",))
+            except OSError:
+                pass
+            connection.close()
+        self._stopped.set()
+        self._listener.close()
+
+    def run(self, tasks):
+        """Run tasks on the workers, each worker taking the next task when free
+
+        Args:
+            tasks (list): task tuples, the task's id second
+        Returns:
+            dict: task ids to (index of the worker that ran it, result)
+        """
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+        results = {}
+        errors = []
+
+        def drive(worker, connection):
+            """Send a worker tasks until none are left"""
+            while not errors:
+                try:
+                    task = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    connection.send(task)
+                    if self.task_timeout and not connection.poll(self.task_timeout):
+                        raise TimeoutError(f"no result after {self.task_timeout}s")
+                    status, result = connection.recv()
+                except (EOFError, OSError) as error:
+                    errors.append(f"worker {worker} lost running {task[0]} task {task[1]}: {error}")
+                    return
+                if status != "done":
+                    errors.append(f"worker {worker} failed {task[0]} task {task[1]}: {result}")
+                    return
+                results[task[1]] = (worker, result)
+
+        threads = [
+            threading.Thread(target=drive, args=(worker, connection))
+            for worker, connection in enumerate(self._connections)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return results
+
+    def mapreduce(self, partitions, partitioner, coordinates=None):
+        """Map every partition, then reduce every reducer's shuffle partitions
+
+        Args:
+            partitions (list): encoded passenger data partitions
+            partitioner (partitioning.SkewPartitioner): routes flights to reducers
+            coordinates (pd.DataFrame): airport coordinate table broadcast to
+                the mappers to join flight distances from
+        Returns:
+            list: reduced flights of each reducer
+        """
+        mapped = self.run([
+            ("map", task, partition, partitioner, coordinates) for task, partition in enumerate(partitions)
+        ])
+        # NOTE: Reducers fetch each map task's bucket from the worker that ran it
+        locations = [(task, self._shuffle_addresses[worker]) for task, (worker, _) in sorted(mapped.items())]
+        reduced = self.run([("reduce", partition, locations) for partition in range(partitioner.partitions)])
+        return [flight.deserialize_encoded(reduced[partition][1]) for partition in range(partitioner.partitions)]
+
+
+class Worker:
+    """Runs map and reduce tasks for a coordinator and serves its map output
+
+    Attributes:
+        shuffle_address (tuple): host and port reducers fetch buckets from
+    """
+
+    def __init__(self, coordinator_address, authkey, host="127.0.0.1"):
+        """Initialise worker
+
+        Args:
+            coordinator_address (tuple): host and port of the coordinator
+            authkey (bytes): key shared with the coordinator and workers
+            host (str): host other workers reach this worker's buckets on
+        """
+        self._coordinator_address = coordinator_address
+        self._authkey = authkey
+        # NOTE: Port 0 lets the OS pick a free port, reported to the coordinator,
+        #   connections are authenticated by serve_connections
+        self._listener = Listener((host, 0))
+        self._stopped = threading.Event()
+        self.shuffle_address = self._listener.address
+        # Map task ids to serialized reducer buckets
+        self._buckets = {}
+
+    def serve(self):
+        """Register with the coordinator and run its tasks until stopped"""
+        threading.Thread(
+            target=serve_connections, args=(self._listener, self._authkey, self._send_bucket, self._stopped),
+            daemon=True,
+        ).start()
+        with self._connect() as connection:
+            connection.send(("register", self.shuffle_address))
+            while True:
+                try:
+                    task = connection.recv()
+                except EOFError:
+                    break
+                if task[0] == "stop":
+                    break
+                try:
+                    result = getattr(self, task[0] + "_task")(*task[1:])
+                    connection.send(("done", result))
+                except Exception as error:
+                    connection.send(("failed", repr(error)))
+        self._stopped.set()
+        self._listener.close()
+
+    def _connect(self):
+        """Connect to the coordinator, waiting for it to start listening
+
+        Returns:
+            Connection: connection to the coordinator
+        """
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                return Client(self._coordinator_address, authkey=self._authkey)
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def map_task(self, task, data, partitioner, coordinates):
+        """Map a partition, keeping each reducer's bucket to be fetched
+
+        Args:
+            task (int): map task id
+            data (pd.DataFrame): encoded passenger data partition
+            partitioner (partitioning.SkewPartitioner): routes flights to reducers
+            coordinates (pd.DataFrame): airport coordinate table
+        Returns:
+            list: bytes of each reducer's bucket
+        """
+        buckets = mapper.shuffle_map(data, task, partitioner, coordinates)
+        self._buckets[task] = [flight.serialize_encoded(bucket) for bucket in buckets]
+        return [len(bucket) for bucket in self._buckets[task]]
+
+    def reduce_task(self, partition, locations):
+        """Fetch a reducer's bucket from every map task and reduce them
+
+        Args:
+            partition (int): reducer index
+            locations (list): (map task id, shuffle address) of every map task
+        Returns:
+            bytes: serialized reduced flights
+        """
+        buckets = [flight.deserialize_encoded(self._fetch(address, task, partition)) for task, address in locations]
+        return flight.serialize_encoded(reducer.shuffle_reduce(buckets, partition))
+
+    def _fetch(self, address, task, partition):
+        """Serialized bucket of a map task for a reducer
+
+        Args:
+            address (tuple): shuffle address of the worker that ran the map task
+            task (int): map task id
+            partition (int): reducer index
+        Returns:
+            bytes: serialized bucket
+        """
+        if address == self.shuffle_address:
+            return self._buckets[task][partition]
+
+        # NOTE: Fetched on a daemon thread, so a worker that stops responding
+        #   fails this reduce task rather than hanging it
+        fetched = queue.Queue(1)
+
+        def fetch():
+            """Download the bucket"""
+            try:
+                with Client(address, authkey=self._authkey) as connection:
+                    connection.send((task, partition))
+                    fetched.put((True, connection.recv_bytes()))
+            except Exception as error:
+                fetched.put((False, error))
+
+        threading.Thread(target=fetch, daemon=True).start()
+        try:
+            ok, bucket = fetched.get(timeout=FETCH_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(f"no bucket from {address[0]}:{address[1]} after {FETCH_TIMEOUT}s") from None
+        if not ok:
+            raise bucket
+        return bucket
+
+    def _send_bucket(self, connection):
+        """Send a requested bucket to another worker's reducer
+
+        Args:
+            connection (Connection): authenticated connection from the reducer
+        """
+        with connection:
+            task, partition = connection.recv()
+            connection.send_bytes(self._buckets[task][partition])
+
+
+def parse_address(address):
+    """Parse a HOST:PORT address
+
+    Args:
+        address (str): HOST:PORT
+    Returns:
+        tuple: host and integer port
+    """
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def run_job(address, authkey, workers):
+    """Run the MapReduce job on connected workers and print Task 1 and Task 2
+
+    Args:
+        address (tuple): host and port workers connect to
+        authkey (bytes): key workers must authenticate with
+        workers (int): number of workers to wait for
+    """
+    init_settings()
+    airports = get_airports(get_airport_data())
+    passenger_file = f"{os.getenv('DATA_DIR')}/{os.getenv('PASSENGER_DATA', 'AComp_Passenger_data_no_error.csv')}"
+    passenger_data, dictionaries = encoding.encode_frame(get_valid_passenger_data(passenger_file, airports), airports)
+    flight.EncodedFlight.dictionaries = dictionaries
+    coordinates = mileage.coordinate_table(airports, dictionaries["airport"])
+    partitions, partitioner = partitioning.plan(
+        passenger_data,
+        workers,
+        int(os.getenv("PARTITION_BYTES", str(partitioning.PARTITION_BYTES))),
+        int(os.getenv("SKEW_SAMPLE_ROWS", str(partitioning.SAMPLE_ROWS))),
+    )
+
+    with Coordinator(address, authkey, workers, float(os.getenv("TASK_TIMEOUT", "0"))) as coordinator:
+        reduce_results = coordinator.mapreduce(partitions, partitioner, coordinates)
+    reduce_results = reducer.merge_split_keys(reduce_results, partitioner.hot_keys, passenger_data)
+    # NOTE: Sorted by flight key, so the output doesn't depend on the number of reducers
+    reduced = sorted(
+        (reduced_flight for flights in reduce_results for reduced_flight in flights),
+        key=lambda reduced_flight: reduced_flight.get_flight_key(),
+    )
+    # NOTE: A cached run restoring its older output would overwrite this one
+    invalidate_cached(os.getenv("REDUCED_DATA_DIR"))
+    reducer.save_reduced_results([reduced], os.getenv("REDUCED_DATA_DIR"))
+
+    print(f"[*]\t{len(partitions)} map tasks, {partitioner.partitions} reduce tasks, "
+          f"{len(reduced)} flights written to {os.getenv('REDUCED_DATA_DIR')}")
+    flight_counts, _, passenger_flights = aggregator.aggregate_encoded(reduced, dictionaries, airports)
+    print_task_1_results(get_total_airport_flights(flight_counts))
+    print_task_2_results(*get_passenger_with_most_flights(passenger_flights))
+
+
+def main():
+    """Main function"""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Multi-node MapReduce over TCP")
+    parser.add_argument("role", choices=["coordinator", "worker", "local"])
+    parser.add_argument("--workers", type=int, default=2, help="workers the coordinator waits for")
+    parser.add_argument(
+        "--coordinator",
+        default=f"{os.getenv('CLUSTER_HOST', '127.0.0.1')}:{os.getenv('CLUSTER_PORT', '6000')}",
+        help="coordinator HOST:PORT",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="host other workers reach this worker on")
+    args = parser.parse_args()
+    address = parse_address(args.coordinator)
+    authkey = os.getenv("CLUSTER_AUTHKEY", DEFAULT_AUTHKEY.decode("utf-8")).encode("utf-8")
+    # NOTE: Anyone holding the key can have a worker unpickle, and run, their tasks
+    listen_host = args.host if args.role == "worker" else address[0]
+    if authkey == DEFAULT_AUTHKEY and not is_loopback(listen_host):
+        parser.error(f"refusing to listen on {listen_host} with the default CLUSTER_AUTHKEY, set a secret key first")
+
+    if args.role == "worker":
+        Worker(address, authkey, args.host).serve()
+        return
+    if args.role == "coordinator":
+        run_job(address, authkey, args.workers)
+        return
+
+    # NOTE: Local mode starts the workers on this machine, as separate processes
+    processes = [
+        subprocess.Popen([sys.executable, __file__, "worker", "--coordinator", args.coordinator])
+        for _ in range(args.workers)
+    ]
+    try:
+        run_job(address, authkey, args.workers)
+    finally:
+        for process in processes:
+            process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
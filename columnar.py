@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Columnar reduced flight format
+
+Reduced flights are stored as a directory of NumPy .npy arrays, one per
+column, with each flight's passengers stored CSR-style: passenger_offsets
+holds where each flight's slice of passenger_ids starts and ends, and
+passenger_ids index into the passengers array of distinct passenger ids.
+Every array has a fixed-width dtype so the whole data-set can be memory
+mapped rather than parsed. A directory converted from a reduced csv file
+records the file's stat, so it's rebuilt once the file changes.
+
+Usage:
+    python columnar.py <reduced csv file> <columnar directory>
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+from flight import Flight
+
+COLUMNS = [
+    "from_airport",
+    "flight_id",
+    "to_airport",
+    "depart_time",
+    "total_flight_time",
+    "passenger_offsets",
+    "passenger_ids",
+    "passengers",
+]
+
+# File in a directory recording the reduced csv file it was built from
+SOURCE_FILE = "source.json"
+
+
+def save(flights, directory):
+    """Save reduced flights in columnar format
+
+    Args:
+        flights (iterable): reduced Flight objects
+        directory (str): directory to write column arrays to
+    """
+    from_airports, flight_ids, to_airports, depart_times, flight_times = [], [], [], [], []
+    offsets = [0]
+    passengers = []
+    for flight in flights:
+        from_airports.append(flight.from_airport)
+        flight_ids.append(flight.flight_id)
+        to_airports.append(flight.to_airport)
+        depart_times.append(flight.depart_time)
+        flight_times.append(flight.total_flight_time)
+        passengers.extend(flight.passengers)
+        offsets.append(len(passengers))
+
+    # Dictionary encode passenger ids as indices into the distinct passengers
+    names, ids = np.unique(np.array(passengers, dtype="S"), return_inverse=True)
+    columns = {
+        "from_airport": np.array(from_airports, dtype="S"),
+        "flight_id": np.array(flight_ids, dtype="S"),
+        "to_airport": np.array(to_airports, dtype="S"),
+        "depart_time": np.array(depart_times, dtype=np.int64),
+        "total_flight_time": np.array(flight_times, dtype=np.int32),
+        "passenger_offsets": np.array(offsets, dtype=np.int64),
+        "passenger_ids": ids.astype(np.int32),
+        "passengers": names,
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(directory, name + ".npy"), column)
+
+
+def load(directory):
+    """Memory map reduced flights saved in columnar format
+
+    Args:
+        directory (str): directory of column arrays
+    Returns:
+        dict: column names to read-only memory mapped arrays
+    """
+    return {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+
+
+def source_stat(file_name):
+    """Path, modification time and size of a reduced csv file
+
+    Args:
+        file_name (str): reduced csv file
+    Returns:
+        list: absolute path, modification time in ns and size, None if missing
+    """
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    return [os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size]
+
+
+def stamp(directory, file_name):
+    """Record the reduced csv file a directory was built from
+
+    Args:
+        directory (str): columnar or index directory
+        file_name (str): reduced csv file the directory holds
+    """
+    with open(os.path.join(directory, SOURCE_FILE), "w", encoding="utf-8") as file:
+        json.dump(source_stat(file_name), file)
+
+
+def is_current(directory, file_name):
+    """Whether a directory was built from a reduced csv file as it is now
+
+    Args:
+        directory (str): columnar or index directory
+        file_name (str): reduced csv file
+    Returns:
+        bool: False if the directory is missing, unstamped or stale
+    """
+    try:
+        with open(os.path.join(directory, SOURCE_FILE), "r", encoding="utf-8") as file:
+            recorded = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return False
+    return recorded is not None and recorded == source_stat(file_name)
+
+
+def read_reduced(file_name):
+    """Read reduced flights from a reduced csv file a line at a time
+
+    Args:
+        file_name (str): reduced csv file, including Hadoop's output
+    Yields:
+        Flight: reduced flight of each line
+    """
+    with open(file_name, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield Flight(line)
+
+
+def main():
+    """Convert a reduced csv file to columnar format"""
+    save(read_reduced(sys.argv[1]), sys.argv[2])
+    stamp(sys.argv[2], sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
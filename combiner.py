@@ -1,54 +1,28 @@
-"""Combiner"""
-import multiprocessing
+#!/usr/bin/env python3
+"""Combiner for map-side pre-aggregation of mapped flights"""
+import sys
 
-
-def combine(data, ret=None, procnum=None, hadoop_mode=False):
-    """ Combines two partitions/lists of data into a single partition/list
-    NOTE: this function is only called by multithread_combine
-    Args:
-        data (list): list of two lists containing flight data
-        ret (list): list of lists we are writing combined data to
-        procnum (int): index of ret / thread number
-    """
-    print("[*]\tCombine\tThread " + str(procnum))
-    if hadoop_mode:
-        # Write reduced data to stdout
-        print(*[item for sublist in data for item in sublist], sep="\n")
-    else:
-        # Assign 1D list to ret at index procnum
-        ret[procnum] = [item for sublist in data for item in sublist]
+import reducer
 
 
-def multithread_combine(data, ret):
-    """ Multithreaded combine function
+def combine(lines):
+    """Merge consecutive mapped lines sharing a flight key into one line
+    NOTE: Hadoop sorts each map task's output by key before combining
     Args:
-        data (list): list of lists
-        ret (list): list of lists
+        lines (iterable): sorted tab separated key/value lines
+    Yields:
+        str: tab separated key/value line with the combined passenger list
     """
-    jobs = []
-    # Calculate list index values
-    lists = zip(range(0, len(ret)*2, 2), range(1, len(ret)*2+1, 2))
-    # Split data into condensed partitions
-    parts = [data[s[0]:s[1]+1] for s in lists]
-    # For each part in parts
-    for procnum, data in enumerate(parts):
-        # x = lambda data, ret, procnum : ret[procnum] = [item for sublist in data for item in sublist]
-        p = multiprocessing.Process(target=combine, args=(data, ret, procnum))
-        # p = multiprocessing.Process(target=combine, args=(data, ret, procnum))
-        jobs.append(p)
-        p.start()
-
-    for p in jobs:
-        p.join()
-
-    for p in jobs:
-        p.terminate()
+    for flight in reducer.stream_reduce(reducer.read_flights(lines)):
+        key, value = str(flight).split(",", 1)
+        yield key + "\t" + value
 
 
 def main():
-    # TODO: Implement combine function to be compatible with actual hadoop
-    # combine(hadoop_mode=True)
-    pass
+    """Main function"""
+    # Combine system input a key group at a time, writing each line as we go
+    for line in combine(sys.stdin):
+        sys.stdout.write(line + "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+"""Dictionary encoding of airport codes, flight ids and passenger ids
+
+Every distinct value is mapped once at ingest to a dense integer code, so
+the MapReduce stages hash, sort, compare and shuffle integers rather than
+strings, and values are only decoded when results are written. Each
+dictionary holds its values in sorted order, so ordering by code is the
+same as ordering by value.
+"""
+import numpy as np
+import pandas as pd
+
+
+class Dictionary:
+    """Distinct values of a field, each value's code is its index
+
+    Attributes:
+        values (list): distinct values in sorted order
+    """
+
+    def __init__(self, values):
+        """Initialise dictionary
+
+        Args:
+            values (iterable): distinct values in sorted order
+        """
+        self.values = list(values)
+        self._index = pd.Index(self.values)
+
+    def __len__(self):
+        """Returns:
+            int: number of distinct values
+        """
+        return len(self.values)
+
+    def encode(self, values):
+        """Codes of values
+
+        Args:
+            values (iterable): values in the dictionary
+        Returns:
+            np.ndarray: integer code of each value
+        """
+        codes = self._index.get_indexer(values)
+        if (codes < 0).any():
+            raise KeyError("values missing from the dictionary")
+        return codes.astype(np.int64)
+
+    def decode(self, codes):
+        """Values of codes
+
+        Args:
+            codes (iterable): integer codes
+        Returns:
+            list: value of each code
+        """
+        return [self.values[code] for code in codes]
+
+
+def encode_frame(data, airport_codes=()):
+    """Dictionary encode passenger data
+
+    Args:
+        data (pd.DataFrame): passenger data with headers
+        airport_codes (iterable): airport codes to include in the airport
+            dictionary, such as airports no flight departs from
+    Returns:
+        pd.DataFrame: passenger data with integer coded airports, flight
+            ids and passenger ids
+        dict: airport, flight and passenger dictionaries
+    """
+    rows = len(data)
+    # NOTE: Origin and destination airports share one dictionary
+    airports = pd.concat(
+        [data["from_airport"], data["to_airport"], pd.Series(list(airport_codes), dtype=object)],
+        ignore_index=True,
+    )
+    airport_ids, airport_values = pd.factorize(airports, sort=True)
+    flight_ids, flight_values = pd.factorize(data["flight_id"], sort=True)
+    passenger_ids, passenger_values = pd.factorize(data["passenger_id"], sort=True)
+
+    encoded = data.assign(
+        passenger_id=passenger_ids.astype(np.int64),
+        flight_id=flight_ids.astype(np.int64),
+        from_airport=airport_ids[:rows].astype(np.int64),
+        to_airport=airport_ids[rows:2 * rows].astype(np.int64),
+    )
+    dictionaries = {
+        "airport": Dictionary(airport_values),
+        "flight": Dictionary(flight_values),
+        "passenger": Dictionary(passenger_values),
+    }
+    return encoded, dictionaries
+
+
+def is_encoded(data):
+    """Whether passenger data has been dictionary encoded
+
+    Args:
+        data (pd.DataFrame): passenger data with headers
+    Returns:
+        bool: True if flight ids are integer codes
+    """
+    return pd.api.types.is_integer_dtype(data["flight_id"])
@@ -0,0 +1,342 @@
+"""Persistent worker pool shared by every MapReduce stage"""
+import itertools
+import multiprocessing
+import os
+import signal
+import statistics
+import threading
+import time
+from multiprocessing import resource_tracker
+
+import buffers
+
+# Task start events sent by workers, set in each worker process
+_events = None
+
+
+def _init_worker(events):
+    """Initialise a worker process
+
+    Args:
+        events (multiprocessing.SimpleQueue): queue to send task events to
+    """
+    global _events
+    _events = events
+
+
+def _attempt(func, args, attempt):
+    """Run one attempt of a task on a worker, first reporting which worker
+    and when it started
+
+    Args:
+        func (callable): task function
+        args (tuple): task function arguments
+        attempt (int): attempt id
+    Returns:
+        result of the task function
+    """
+    # NOTE: Timed on the worker, the parent only reads events when it next wakes
+    _events.put((attempt, os.getpid(), time.time()))
+    return func(*args)
+
+
+class Attempt:
+    """One run of a task on the pool
+
+    Attributes:
+        task (int): index of the task
+        result (multiprocessing.pool.AsyncResult): pending result
+        pid (int): worker process running the attempt, None until started
+        started (float): time the attempt started on its worker, None until started
+    """
+
+    def __init__(self, task, result):
+        """Initialise attempt
+
+        Args:
+            task (int): index of the task
+            result (multiprocessing.pool.AsyncResult): pending result
+        """
+        self.task = task
+        self.result = result
+        self.pid = None
+        self.started = None
+
+
+class Executor:
+    """Pool of worker processes reused across map, sort, reduce and combine
+
+    Worker processes are started once when the executor is entered and
+    joined when it exits, so process startup is paid once per job rather
+    than once per partition per stage. Partitions are exchanged with the
+    workers as shared memory buffer handles rather than pickled flights.
+
+    Every task attempt reports the worker process running it, which is
+    checked to still be alive every heartbeat interval. Attempts that fail,
+    whose worker died, or that run past the task timeout are retried, and a
+    task running far longer than the stage's median gets a speculative
+    duplicate, the first attempt to finish being kept.
+
+    Attributes:
+        workers (int): number of worker processes
+        task_timeout (float): seconds an attempt may run, 0 for no limit
+        heartbeat_interval (float): seconds between checks that running
+            attempts' workers are alive
+        retries (int): times a task is retried before its stage fails
+        speculation (float): multiple of the stage's median task time a
+            task may run before it's duplicated, 0 disables speculation
+        speculation_min (float): seconds a task must run before it's duplicated
+    """
+
+    def __init__(self, workers=None, task_timeout=0, heartbeat_interval=1, retries=2, speculation=2,
+                 speculation_min=1):
+        """Initialise executor
+
+        Args:
+            workers (int): number of worker processes, defaults to cpu count
+            task_timeout (float): seconds an attempt may run, 0 for no limit
+            heartbeat_interval (float): seconds between checks that running
+                attempts' workers are alive
+            retries (int): times a task is retried before its stage fails
+            speculation (float): multiple of the stage's median task time a
+                task may run before it's duplicated, 0 disables speculation
+            speculation_min (float): seconds a task must run before it's duplicated
+        """
+        self.workers = workers or os.cpu_count()
+        self.task_timeout = task_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.retries = retries
+        self.speculation = speculation
+        self.speculation_min = speculation_min
+        self._pool = None
+        self._events = None
+        # Current stage's attempt ids to attempts
+        self._attempts = {}
+        # NOTE: Attempt ids run on across stages, so a late result from an
+        #   earlier stage's losing attempt is never taken for a current one
+        self._attempt_ids = itertools.count()
+        # Results of attempts of every stage not yet known to have finished
+        self._outstanding = []
+
+    def __enter__(self):
+        """Start worker processes
+
+        Returns:
+            Executor: this executor
+        """
+        # NOTE: Workers must share the parent's resource tracker so shared
+        #   memory created by one process can be freed by another
+        resource_tracker.ensure_running()
+        # NOTE: SimpleQueue writes straight to its pipe, a Queue's feeder
+        #   thread could lose the start event of a worker that then crashes
+        self._events = multiprocessing.SimpleQueue()
+        self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self._events,))
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop worker processes"""
+        # NOTE: Closing waits for every result, which never arrives from a
+        #   dead or killed worker, and losing speculative attempts needn't finish
+        if any(not result.ready() for result in self._outstanding):
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def run(self, func, partitions, shuffle=False):
+        """Run a stage function over each partition on the pool
+
+        Args:
+            func (callable): stage function called as func(partition, procnum)
+            partitions (list): list of partitions or partition buffers
+            shuffle (bool): stage returns one list of flights per reducer
+        Returns:
+            list: partition buffer(s) of each result, in partition order
+        """
+        results = self._execute(
+            buffers.exchange,
+            [(func, partition, procnum, shuffle) for procnum, partition in enumerate(partitions)],
+            discard=buffers.free,
+        )
+        # Inputs are kept until every task succeeds, for retried attempts
+        buffers.free(partitions)
+        return results
+
+    def map(self, func, partitions):
+        """Run a function over each partition on the pool, for stages whose
+        partitions aren't flights, such as ingest validation
+
+        Args:
+            func (callable): function called as func(partition, procnum)
+            partitions (list): list of picklable partitions
+        Returns:
+            list: result of each partition, in partition order
+        """
+        return self._execute(func, [(partition, procnum) for procnum, partition in enumerate(partitions)])
+
+    def _execute(self, func, tasks, discard=None):
+        """Run every task to completion, retrying and speculating attempts
+
+        Args:
+            func (callable): task function
+            tasks (list): arguments of each task
+            discard (callable): frees the result of an attempt that finished
+                after its task was already done
+        Returns:
+            list: result of each task, in task order
+        """
+        # NOTE: Attempt callbacks run on the pool's result thread, and
+        #   wake the loop below as soon as an attempt finishes
+        finished = threading.Condition()
+        results = [None] * len(tasks)
+        done = [False] * len(tasks)
+        failures = [0] * len(tasks)
+        errors = []
+        durations = []
+        self._attempts = {}
+        self._outstanding = [result for result in self._outstanding if not result.ready()]
+
+        def submit(task):
+            """Start an attempt of a task"""
+            attempt = next(self._attempt_ids)
+            result = self._pool.apply_async(
+                _attempt,
+                (func, tasks[task], attempt),
+                callback=lambda value: settle(attempt, value),
+                error_callback=lambda error: fail(attempt, error),
+            )
+            self._attempts[attempt] = Attempt(task, result)
+            self._outstanding.append(result)
+
+        def settle(attempt, value):
+            """Keep the first successful attempt of a task"""
+            with finished:
+                # NOTE: The attempt's start event was sent before its result
+                self._drain_events()
+                state = self._attempts.get(attempt)
+                if state is None or done[state.task]:
+                    if discard is not None:
+                        discard(value)
+                    return
+                results[state.task] = value
+                done[state.task] = True
+                if state.started is not None:
+                    durations.append(time.time() - state.started)
+                finished.notify()
+
+        def fail(attempt, error):
+            """Record a failed attempt"""
+            with finished:
+                errors.append((attempt, error))
+                finished.notify()
+
+        with finished:
+            for task in range(len(tasks)):
+                submit(task)
+
+        while True:
+            with finished:
+                self._drain_events()
+                if all(done):
+                    return results
+                now = time.time()
+                live = [
+                    (attempt, state) for attempt, state in self._attempts.items()
+                    if not done[state.task] and not state.result.ready()
+                ]
+
+                # Retry failed, dead and timed out attempts
+                # NOTE: Hung attempts are left to the task timeout, a long
+                #   call holding the GIL is indistinguishable from a hang
+                lost, errors[:] = list(errors), []
+                for attempt, state in live:
+                    if state.started is None:
+                        continue
+                    if not is_alive(state.pid):
+                        lost.append((attempt, ChildProcessError(f"worker {state.pid} died")))
+                    elif self.task_timeout and now - state.started > self.task_timeout:
+                        lost.append((attempt, TimeoutError(f"running over {self.task_timeout}s")))
+                for attempt, error in lost:
+                    self._retry(attempt, error, failures, done, submit)
+
+                # Duplicate stragglers once half the tasks have finished
+                if self.speculation and durations and sum(done) >= len(tasks) / 2:
+                    self._speculate(live, statistics.median(durations), now, submit)
+
+                # NOTE: Results and errors are checked before waiting, so a
+                #   notify sent meanwhile isn't missed
+                if not errors and not all(done):
+                    finished.wait(self.heartbeat_interval)
+
+    def _retry(self, attempt, error, failures, done, submit):
+        """Abandon a lost attempt and start another, unless out of retries
+
+        Args:
+            attempt (int): attempt id
+            error (Exception): why the attempt was lost
+            failures (list): number of lost attempts of each task
+            done (list): whether each task is done
+            submit (callable): starts an attempt of a task
+        """
+        state = self._attempts.pop(attempt, None)
+        if state is None or done[state.task]:
+            return
+        if not state.result.ready() and state.pid is not None:
+            # NOTE: The pool replaces a killed worker with a new one
+            try:
+                os.kill(state.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        failures[state.task] += 1
+        if failures[state.task] > self.retries:
+            raise RuntimeError(f"Task {state.task} failed {failures[state.task]} times") from error
+        # A task with a speculative attempt still running needn't be restarted
+        if any(other.task == state.task for other in self._attempts.values()):
+            return
+        print(f"[*]\tRetrying task {state.task} after {error!r}")
+        submit(state.task)
+
+    def _speculate(self, live, median, now, submit):
+        """Duplicate every task running far longer than the stage's median
+
+        Args:
+            live (list): (attempt id, Attempt) of every running attempt
+            median (float): median seconds of the stage's finished tasks
+            now (float): current time
+            submit (callable): starts an attempt of a task
+        """
+        running = {}
+        for _, state in live:
+            running.setdefault(state.task, []).append(state)
+        for task, states in running.items():
+            # NOTE: A task is duplicated at most once, once it has started
+            if len(states) > 1 or states[0].started is None:
+                continue
+            elapsed = now - states[0].started
+            if elapsed > max(self.speculation * median, self.speculation_min):
+                print(f"[*]\tSpeculating task {task}, running {elapsed:.1f}s against a median of {median:.1f}s")
+                submit(task)
+
+    def _drain_events(self):
+        """Record the workers that started attempts"""
+        while not self._events.empty():
+            attempt, pid, started = self._events.get()
+            state = self._attempts.get(attempt)
+            if state is not None:
+                state.pid, state.started = pid, started
+
+
+def is_alive(pid):
+    """Whether a process is still running
+
+    Args:
+        pid (int): process id
+    Returns:
+        bool: False once the process has exited and been reaped
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
@@ -1,4 +1,16 @@
 """Flight object"""
+import array
+import math
+import struct
+import sys
+
+# Binary record header: departure time, flight time, distance and byte
+#   length of the comma separated string fields that follow
+RECORD = struct.Struct("<qidI")
+# Binary record header of dictionary encoded flights: departure time,
+#   flight time, distance, flight id, from and to airport codes and
+#   passenger count
+ENCODED_RECORD = struct.Struct("<qidIIII")
 
 
 class Flight:
@@ -7,11 +19,25 @@ class Flight:
         flight_id (str): flight id
         from_airport (str): from airport
         to_airport (str): to airport
-        depart_time (str): departure time
+        depart_time (int): departure time (epochs time)
         total_flight_time (int): total flight time
-        passenger_list (list): list of passengers
+        passengers (dict): insertion ordered set of passengers, values unused
+        distance (float): great-circle distance in miles, NaN if the
+            airport coordinates weren't joined
         """
 
+    # NOTE: No per-instance __dict__, millions of flights are created and
+    #   passed between processes
+    __slots__ = (
+        "flight_id",
+        "from_airport",
+        "to_airport",
+        "depart_time",
+        "total_flight_time",
+        "passengers",
+        "distance",
+    )
+
     def __init__(self, flight_data):
         """Initialise flight object
 
@@ -20,14 +46,91 @@ class Flight:
         """
         (
             flight_from,
+            to_airport,
+            depart_time,
+            total_flight_time,
+            passenger_list,
+        ) = flight_data.strip().split(",", 4)
+
+        # NOTE: Flight keys are the from airport followed by the flight id
+        from_airport, flight_id = flight_from.split("_")
+        self._set_fields(
+            flight_id,
+            from_airport,
+            to_airport,
+            int(depart_time),
+            int(total_flight_time),
+            passenger_list.strip().split(","),
+        )
+
+    @classmethod
+    def from_fields(cls, flight_id, from_airport, to_airport, depart_time, total_flight_time, passengers,
+                    distance=math.nan):
+        """Initialise flight object from already parsed fields
+
+        Args:
+            flight_id (str): flight id
+            from_airport (str): from airport
+            to_airport (str): to airport
+            depart_time (int): departure time
+            total_flight_time (int): total flight time
+            passengers (iterable): passenger ids
+            distance (float): great-circle distance in miles
+        Returns:
+            Flight: flight object
+        """
+        flight = cls.__new__(cls)
+        flight._set_fields(flight_id, from_airport, to_airport, depart_time, total_flight_time, passengers, distance)
+        return flight
+
+    def _set_fields(self, flight_id, from_airport, to_airport, depart_time, total_flight_time, passengers,
+                    distance=math.nan):
+        """Set flight attributes, interning repeated strings
+
+        Airport codes, flight ids and passenger ids repeat across many
+        flights, so each distinct value is stored once.
+
+        Args:
+            flight_id (str): flight id
+            from_airport (str): from airport
+            to_airport (str): to airport
+            depart_time (int): departure time
+            total_flight_time (int): total flight time
+            passengers (iterable): passenger ids
+            distance (float): great-circle distance in miles
+        """
+        self.flight_id = sys.intern(flight_id)
+        self.from_airport = sys.intern(from_airport)
+        self.to_airport = sys.intern(to_airport)
+        self.depart_time = depart_time
+        self.total_flight_time = total_flight_time
+        # NOTE: dict keys de-duplicate in O(1) and keep first-seen order
+        self.passengers = dict.fromkeys(sys.intern(passenger) for passenger in passengers)
+        self.distance = distance
+
+    def __getstate__(self):
+        """Compact pickle state
+
+        Returns:
+            tuple: flight attribute values
+        """
+        return (
+            self.flight_id,
+            self.from_airport,
             self.to_airport,
             self.depart_time,
             self.total_flight_time,
-            self.passenger_list,
-        ) = flight_data.strip().split(",", 4)
+            tuple(self.passengers),
+            self.distance,
+        )
 
-        self.flight_id, self.from_airport = flight_from.split("_")
-        self.passenger_list = list(set(self.passenger_list.strip().split(",")))
+    def __setstate__(self, state):
+        """Restore flight from pickle state
+
+        Args:
+            state (tuple): flight attribute values
+        """
+        self._set_fields(*state)
 
     def __str__(self):
         """Converts each element in this flight object to a string and returns
@@ -41,16 +144,11 @@ class Flight:
         results = [
             self.get_flight_key(),
             self.to_airport,
-            self.depart_time,
+            str(self.depart_time),
             str(self.total_flight_time),
         ]
 
-        # If passenger_list has more than 1 passenger, extend to results
-        if len(self.passenger_list) > 1:
-            results.extend(self.passenger_list)
-        else:
-            # Otherwise, just add to results
-            results += self.passenger_list
+        results.extend(self.passengers)
         # List to tab separated string
         return ",".join(results)
 
@@ -60,19 +158,36 @@ class Flight:
         Returns:
             int: length of passengers
         """
-        return 5 + len(self.passenger_list)
+        return 5 + len(self.passengers)
+
+    @property
+    def passenger_list(self):
+        """List of passengers in the order they were added
+
+        Returns:
+            list: list of passengers
+        """
+        return list(self.passengers)
 
     def add_passenger(self, passenger):
-        """Add passenger to flight
+        """Add passenger to flight, ignoring passengers already on it
+
+        Returns:
+            dict_keys: updated passengers
+        """
+        self.passengers[passenger] = None
+        return self.passengers.keys()
+
+    def merge(self, flight):
+        """Add every passenger of another record of this flight
 
+        Args:
+            flight (Flight): record with the same flight key
         Returns:
-            list: updated passenger list
+            dict_keys: updated passengers
         """
-        # If passenger already in self.passenger_list, return self.passenger_list
-        if passenger in self.passenger_list:
-            return self.passenger_list
-        self.passenger_list.append(passenger)
-        return self.passenger_list
+        self.passengers.update(flight.passengers)
+        return self.passengers.keys()
 
     def get_flight_key(self):
         """get key for flight data
@@ -80,15 +195,180 @@ class Flight:
         Returns:
             str: flight key
         """
-        key = self.flight_id + "_" + self.from_airport
+        key = self.from_airport + "_" + self.flight_id
         return key
 
 
+class EncodedFlight(Flight):
+    """Flight whose flight id, airports and passengers are dictionary codes
+
+    Attributes:
+        dictionaries (dict): airport, flight and passenger dictionaries
+            flights are decoded with when written, set at ingest
+    """
+
+    __slots__ = ()
+    dictionaries = None
+
+    def _set_fields(self, flight_id, from_airport, to_airport, depart_time, total_flight_time, passengers,
+                    distance=math.nan):
+        """Set flight attributes
+
+        Args:
+            flight_id (int): flight id code
+            from_airport (int): from airport code
+            to_airport (int): to airport code
+            depart_time (int): departure time
+            total_flight_time (int): total flight time
+            passengers (iterable): passenger id codes
+            distance (float): great-circle distance in miles
+        """
+        self.flight_id = flight_id
+        self.from_airport = from_airport
+        self.to_airport = to_airport
+        self.depart_time = depart_time
+        self.total_flight_time = total_flight_time
+        self.passengers = dict.fromkeys(passengers)
+        self.distance = distance
+
+    def __str__(self):
+        """Decoded flight as a reduced csv line
+
+        Returns:
+            str: comma separated flight elements
+        """
+        return str(self.decode(self.dictionaries))
+
+    def decode(self, dictionaries):
+        """Decode flight codes to their values
+
+        Args:
+            dictionaries (dict): airport, flight and passenger dictionaries
+        Returns:
+            Flight: decoded flight
+        """
+        airports = dictionaries["airport"].values
+        return Flight.from_fields(
+            dictionaries["flight"].values[self.flight_id],
+            airports[self.from_airport],
+            airports[self.to_airport],
+            self.depart_time,
+            self.total_flight_time,
+            dictionaries["passenger"].decode(self.passengers),
+            self.distance,
+        )
+
+    def get_flight_key(self):
+        """get key for flight data
+
+        Dictionaries are sorted, so keys order flights as the from
+        airport/flight id string keys do.
+
+        Returns:
+            int: flight key
+        """
+        return self.from_airport << 32 | self.flight_id
+
+
+def serialize(flights):
+    """Serialize flights to compact binary records
+
+    Each record is a fixed header of the numeric fields followed by the
+    string fields, so numbers are never formatted or parsed as text.
+
+    Args:
+        flights (list): list of Flight objects
+    Returns:
+        bytes: serialized flights
+    """
+    records = []
+    for flight in flights:
+        fields = ",".join(
+            [flight.flight_id, flight.from_airport, flight.to_airport, *flight.passengers]
+        ).encode("ascii")
+        records.append(RECORD.pack(flight.depart_time, flight.total_flight_time, flight.distance, len(fields)))
+        records.append(fields)
+    return b"".join(records)
+
+
+def deserialize(data):
+    """Deserialize flights from binary records written by serialize
+
+    Args:
+        data (bytes): serialized flights
+    Returns:
+        list: list of Flight objects
+    """
+    flights = []
+    offset = 0
+    while offset < len(data):
+        depart_time, total_flight_time, distance, size = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        flight_id, from_airport, to_airport, *passengers = (
+            data[offset:offset + size].decode("ascii").split(",")
+        )
+        offset += size
+        flights.append(
+            Flight.from_fields(flight_id, from_airport, to_airport, depart_time, total_flight_time, passengers, distance)
+        )
+    return flights
+
+
+def serialize_encoded(flights):
+    """Serialize dictionary encoded flights to compact binary records
+
+    Each record is a fixed header of the flight's codes and times followed
+    by its passenger codes as 4 byte integers.
+
+    Args:
+        flights (list): list of EncodedFlight objects
+    Returns:
+        bytes: serialized flights
+    """
+    records = []
+    for flight in flights:
+        records.append(ENCODED_RECORD.pack(
+            flight.depart_time,
+            flight.total_flight_time,
+            flight.distance,
+            flight.flight_id,
+            flight.from_airport,
+            flight.to_airport,
+            len(flight.passengers),
+        ))
+        records.append(array.array("I", flight.passengers).tobytes())
+    return b"".join(records)
+
+
+def deserialize_encoded(data):
+    """Deserialize dictionary encoded flights written by serialize_encoded
+
+    Args:
+        data (bytes): serialized flights
+    Returns:
+        list: list of EncodedFlight objects
+    """
+    flights = []
+    offset = 0
+    while offset < len(data):
+        depart_time, total_flight_time, distance, flight_id, from_airport, to_airport, count = (
+            ENCODED_RECORD.unpack_from(data, offset)
+        )
+        offset += ENCODED_RECORD.size
+        passengers = array.array("I")
+        passengers.frombytes(data[offset:offset + count * passengers.itemsize])
+        offset += count * passengers.itemsize
+        flights.append(EncodedFlight.from_fields(
+            flight_id, from_airport, to_airport, depart_time, total_flight_time, passengers.tolist(), distance
+        ))
+    return flights
+
+
 def main():
     """Main function to test flight class"""
-    flight = Flight("SQU6245R_DEN,FRA,1420564460,1049,UES9151GS5")
+    flight = Flight("DEN_SQU6245R,FRA,1420564460,1049,UES9151GS5")
     print(flight)
-    flight = Flight("SQU6245R_DEN,FRA,1420564460,1049,test1,test2,test3")
+    flight = Flight("DEN_SQU6245R,FRA,1420564460,1049,test1,test2,test3")
     print(flight)
 
 
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Seeded synthetic passenger and airport data generator
+
+Writes data-sets in the same schema as the passenger and airport data
+files so the MapReduce pipeline can be run at any scale.
+
+Usage:
+    python generator.py <output dir> [--rows N] [--flights N] [--airports N]
+        [--passengers N] [--skew S] [--seed N]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+PASSENGER_COLUMNS = [
+    "passenger_id",
+    "flight_id",
+    "from_airport",
+    "to_airport",
+    "departure_time",
+    "flight_duration",
+]
+
+
+def random_codes(rng, count, pattern):
+    """Generate random codes matching a README format pattern
+
+    Args:
+        rng (np.random.Generator): random number generator
+        count (int): number of codes
+        pattern (str): format, X for uppercase letters and n for digits
+    Returns:
+        np.ndarray: codes as strings
+    """
+    characters = np.stack(
+        [
+            rng.integers(0, 26, count) + ord("A") if c == "X" else rng.integers(0, 10, count) + ord("0")
+            for c in pattern
+        ],
+        axis=1,
+    ).astype(np.uint8)
+    return characters.view(f"S{len(pattern)}").ravel().astype(str)
+
+
+def generate_airport_data(airports, seed=0):
+    """Generate airport data with distinct airport codes
+
+    Args:
+        airports (int): number of airports, at most 26^3
+        seed (int): random seed
+    Returns:
+        pd.DataFrame: airport data with headers
+    """
+    rng = np.random.default_rng(seed)
+    # Draw distinct codes as distinct base 26 numbers
+    numbers = rng.choice(26 ** 3, airports, replace=False)
+    codes = ["".join(chr(ord("A") + number // 26 ** i % 26) for i in (2, 1, 0)) for number in numbers]
+    return pd.DataFrame({
+        "airport": ["AIRPORT " + code for code in codes],
+        "airport_code": codes,
+        # Uniformly distributed over the globe's surface
+        "lat": np.degrees(np.arcsin(rng.uniform(-1, 1, airports))).round(6),
+        "long": rng.uniform(-180, 180, airports).round(6),
+    })
+
+
+def generate_passenger_data(rows, flights, airport_codes, passengers, skew=0.0, seed=0):
+    """Generate passenger data
+
+    Flight popularity follows a Zipf-like distribution, the flight with
+    popularity rank r is picked with weight 1 / r^skew, so a skew of 0
+    spreads rows evenly over flights and larger skews concentrate them
+    on a few hot flights.
+
+    Args:
+        rows (int): number of passenger rows
+        flights (int): number of distinct flights
+        airport_codes (list): airport codes flights fly between
+        passengers (int): number of distinct passengers
+        skew (float): flight key skew
+        seed (int): random seed
+    Returns:
+        pd.DataFrame: passenger data with headers
+    """
+    rng = np.random.default_rng(seed)
+    airport_codes = np.asarray(airport_codes)
+
+    # Flight attributes, each flight flies between two different airports
+    flight_ids = random_codes(rng, flights, "XXXnnnnX")
+    from_airports = rng.integers(0, len(airport_codes), flights)
+    to_airports = (from_airports + rng.integers(1, len(airport_codes), flights)) % len(airport_codes)
+    departure_times = rng.integers(1420563000, 1420566000, flights)
+    flight_durations = rng.integers(100, 2500, flights)
+
+    weights = 1 / np.arange(1, flights + 1) ** skew
+    flight_rows = rng.choice(flights, rows, p=weights / weights.sum())
+    passenger_rows = rng.integers(0, passengers, rows)
+
+    return pd.DataFrame({
+        "passenger_id": random_codes(rng, passengers, "XXXnnnnXXn")[passenger_rows],
+        "flight_id": flight_ids[flight_rows],
+        "from_airport": airport_codes[from_airports[flight_rows]],
+        "to_airport": airport_codes[to_airports[flight_rows]],
+        "departure_time": departure_times[flight_rows],
+        "flight_duration": flight_durations[flight_rows],
+    })
+
+
+def generate(directory, rows, flights, airports=30, passengers=None, skew=0.0, seed=0):
+    """Write a synthetic passenger and airport data-set
+
+    Args:
+        directory (str): directory to write the data files to
+        rows (int): number of passenger rows
+        flights (int): number of distinct flights
+        airports (int): number of airports
+        passengers (int): number of distinct passengers, defaults to rows / 25
+        skew (float): flight key skew
+        seed (int): random seed
+    Returns:
+        str: passenger data file name
+        str: airport data file name
+    """
+    passengers = passengers or max(rows // 25, 1)
+    airport_data = generate_airport_data(airports, seed)
+    passenger_data = generate_passenger_data(
+        rows, flights, airport_data["airport_code"], passengers, skew, seed
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    passenger_file = os.path.join(directory, "AComp_Passenger_data_no_error.csv")
+    airport_file = os.path.join(directory, "Top30_airports_LatLong.csv")
+    passenger_data.to_csv(passenger_file, header=False, index=False)
+    airport_data.to_csv(airport_file, header=False, index=False)
+    return passenger_file, airport_file
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Generate a synthetic passenger data-set")
+    parser.add_argument("directory", help="directory to write the data files to")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="passenger rows")
+    parser.add_argument("--flights", type=int, default=10_000, help="distinct flights")
+    parser.add_argument("--airports", type=int, default=30, help="airports")
+    parser.add_argument("--passengers", type=int, help="distinct passengers")
+    parser.add_argument("--skew", type=float, default=0.0, help="flight key skew")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+    generate(args.directory, args.rows, args.flights, args.airports, args.passengers, args.skew, args.seed)
+
+
+if __name__ == "__main__":
+    main()
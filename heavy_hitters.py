@@ -0,0 +1,337 @@
+"""Mergeable summaries of the passengers with the most flights (Task 2)
+
+ExactTopK counts every passenger exactly and selects the top K with a
+heap. HeavyHitters bounds memory whatever the number of passengers: a
+Count-Min Sketch estimates every passenger's count and a Space-Saving
+summary tracks the candidates for the top K, both overestimating counts.
+Every summary can be updated a partition at a time and merged, so each
+reducer summarizes its own flights and the summaries are merged after.
+"""
+import heapq
+import math
+import zlib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Items buffered by HeavyHitters before they are counted as one batch
+BATCH_SIZE = 1 << 16
+
+
+def top_k(counts, k):
+    """Items with the highest counts, ties broken by item ascending
+
+    Items tied with the k-th count are included too, so every item tied
+    for the highest count is always returned.
+
+    Args:
+        counts (dict): items to counts
+        k (int): number of items
+    Returns:
+        list: (item, count) pairs, highest count first
+    """
+    top = heapq.nsmallest(k, counts.items(), key=lambda item: (-item[1], item[0]))
+    # NOTE: Nothing to tie with when k is 0 or there are no counts
+    if not top or len(top) < k:
+        return top
+    ties = sorted(item for item, count in counts.items() if count == top[-1][1] and item > top[-1][0])
+    return top + [(item, top[-1][1]) for item in ties]
+
+
+def item_keys(items):
+    """Unsigned integer keys of items for hashing
+
+    Args:
+        items (np.ndarray): integer codes or strings
+    Returns:
+        np.ndarray: uint64 key of each item
+    """
+    if items.dtype.kind in "iu":
+        return items.astype(np.uint64)
+    # NOTE: zlib.crc32 is used over hash() as str hashes are salted per process
+    return np.fromiter((zlib.crc32(str(item).encode("utf-8")) for item in items), np.uint64, len(items))
+
+
+class ExactTopK:
+    """Exact counts of every item, the top K selected with a heap
+
+    Attributes:
+        counts (Counter): items to counts
+    """
+
+    def __init__(self):
+        """Initialise summary"""
+        self.counts = Counter()
+
+    def update(self, items):
+        """Count items
+
+        Args:
+            items (iterable): items, such as passenger ids or codes
+        """
+        if isinstance(items, np.ndarray):
+            values, counts = np.unique(items, return_counts=True)
+            self.counts.update(dict(zip(values.tolist(), counts.tolist())))
+        else:
+            self.counts.update(items)
+
+    def merge(self, other):
+        """Add another summary's counts
+
+        Args:
+            other (ExactTopK): summary of other items
+        Returns:
+            ExactTopK: this summary
+        """
+        self.counts.update(other.counts)
+        return self
+
+    def top(self, k):
+        """Items with the highest counts
+
+        Args:
+            k (int): number of items
+        Returns:
+            list: (item, count) pairs, highest count first
+        """
+        return top_k(self.counts, k)
+
+
+class CountMinSketch:
+    """Count-Min Sketch of item counts
+
+    Estimates are never below the true count, and exceed it by at most
+    epsilon times the total count with probability 1 - delta.
+
+    Attributes:
+        table (np.ndarray): depth x width counters
+        total (int): total count of all items
+    """
+
+    def __init__(self, epsilon, delta, seed=0):
+        """Initialise sketch
+
+        Args:
+            epsilon (float): error as a fraction of the total count
+            delta (float): probability of exceeding the error
+            seed (int): hash seed, sketches can only be merged with the same seed
+        """
+        # Width is rounded up to a power of two for multiply-shift hashing
+        self._bits = max(math.ceil(math.log2(math.e / epsilon)), 1)
+        depth = max(math.ceil(math.log(1 / delta)), 1)
+        rng = np.random.default_rng(seed)
+        # NOTE: Multipliers must be odd for multiply-shift hashing
+        self._multipliers = rng.integers(0, 1 << 63, depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._increments = rng.integers(0, 1 << 63, depth, dtype=np.uint64)
+        self.table = np.zeros((depth, 1 << self._bits), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, keys):
+        """Column of each key in every row
+
+        Args:
+            keys (np.ndarray): uint64 item keys
+        Returns:
+            np.ndarray: depth x len(keys) columns
+        """
+        with np.errstate(over="ignore"):
+            hashes = keys[None, :] * self._multipliers[:, None] + self._increments[:, None]
+        return (hashes >> np.uint64(64 - self._bits)).astype(np.int64)
+
+    def update(self, items, counts=None):
+        """Count items
+
+        Args:
+            items (np.ndarray): integer codes or strings
+            counts (np.ndarray): count of each item, 1 each if None
+        """
+        counts = np.ones(len(items), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        for row, columns in enumerate(self._columns(item_keys(items))):
+            self.table[row] += np.bincount(columns, counts, minlength=self.table.shape[1]).astype(np.int64)
+        self.total += int(counts.sum())
+
+    def estimate(self, items):
+        """Estimated counts of items
+
+        Args:
+            items (np.ndarray): integer codes or strings
+        Returns:
+            np.ndarray: estimated count of each item
+        """
+        columns = self._columns(item_keys(items))
+        return self.table[np.arange(len(self.table))[:, None], columns].min(axis=0)
+
+    def merge(self, other):
+        """Add another sketch's counts
+
+        Args:
+            other (CountMinSketch): sketch with the same shape and seed
+        Returns:
+            CountMinSketch: this sketch
+        """
+        self.table += other.table
+        self.total += other.total
+        return self
+
+
+class SpaceSaving:
+    """Space-Saving summary of the items with the highest counts
+
+    At most capacity items are tracked, each with a count that is never
+    below its true count and an error bounding how far above it may be.
+
+    Attributes:
+        capacity (int): number of items tracked
+        counts (pd.Series): items to overestimated counts
+        errors (pd.Series): items to maximum overestimate
+    """
+
+    def __init__(self, capacity):
+        """Initialise summary
+
+        Args:
+            capacity (int): number of items tracked
+        """
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.errors = pd.Series(dtype=np.int64)
+
+    def minimum(self):
+        """Count an untracked item may have
+
+        Returns:
+            int: smallest tracked count once full, otherwise 0
+        """
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def update(self, items):
+        """Count a batch of items
+
+        Args:
+            items (np.ndarray): integer codes or strings
+        """
+        counts = pd.Series(items).value_counts()
+        self._combine(counts, pd.Series(0, index=counts.index, dtype=np.int64), 0)
+
+    def merge(self, other):
+        """Merge another summary into this one
+
+        Args:
+            other (SpaceSaving): summary of other items
+        Returns:
+            SpaceSaving: this summary
+        """
+        self._combine(other.counts, other.errors, other.minimum())
+        return self
+
+    def _combine(self, counts, errors, minimum):
+        """Add counts, then keep the capacity items with the highest counts
+
+        Items missing from either side may have had up to that side's
+        minimum count, which is added to both their count and error.
+
+        Args:
+            counts (pd.Series): items to counts
+            errors (pd.Series): items to errors
+            minimum (int): count an item missing from counts may have
+        """
+        index = self.counts.index.union(counts.index)
+        own_minimum = self.minimum()
+        merged = self.counts.reindex(index, fill_value=own_minimum) + counts.reindex(index, fill_value=minimum)
+        merged_errors = self.errors.reindex(index, fill_value=own_minimum) + errors.reindex(index, fill_value=minimum)
+        keep = merged.sort_index().sort_values(ascending=False, kind="stable").index[:self.capacity]
+        self.counts = merged[keep].astype(np.int64)
+        self.errors = merged_errors[keep].astype(np.int64)
+
+
+class HeavyHitters:
+    """Approximate top K items in bounded memory
+
+    Attributes:
+        sketch (CountMinSketch): estimated counts of every item
+        candidates (SpaceSaving): items that may have the highest counts
+    """
+
+    def __init__(self, epsilon=1e-4, delta=0.01, capacity=1000, seed=0):
+        """Initialise summary
+
+        Args:
+            epsilon (float): sketch error as a fraction of the total count
+            delta (float): probability of exceeding the sketch error
+            capacity (int): number of candidate items tracked
+            seed (int): hash seed, summaries can only be merged with the same seed
+        """
+        self.sketch = CountMinSketch(epsilon, delta, seed)
+        self.candidates = SpaceSaving(capacity)
+        self.epsilon = epsilon
+        self._buffer = []
+
+    def update(self, items):
+        """Count items, a batch at a time
+
+        Args:
+            items (iterable): items, such as passenger ids or codes
+        """
+        if isinstance(items, np.ndarray):
+            self._flush()
+            self._count(items)
+            return
+        self._buffer.extend(items)
+        if len(self._buffer) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Count buffered items"""
+        if self._buffer:
+            items, self._buffer = self._buffer, []
+            self._count(np.array(items))
+
+    def _count(self, items):
+        """Count a batch of items in the sketch and candidates
+
+        Args:
+            items (np.ndarray): integer codes or strings
+        """
+        if len(items):
+            self.sketch.update(items)
+            self.candidates.update(items)
+
+    def merge(self, other):
+        """Merge another summary into this one
+
+        Args:
+            other (HeavyHitters): summary with the same parameters and seed
+        Returns:
+            HeavyHitters: this summary
+        """
+        self._flush()
+        other._flush()
+        self.sketch.merge(other.sketch)
+        self.candidates.merge(other.candidates)
+        return self
+
+    def error(self):
+        """Bound on how far any count may be overestimated
+
+        Returns:
+            int: error in counts, with probability 1 - delta
+        """
+        self._flush()
+        return math.floor(self.epsilon * self.sketch.total)
+
+    def top(self, k):
+        """Items with the highest estimated counts
+
+        Args:
+            k (int): number of items
+        Returns:
+            list: (item, estimated count) pairs, highest count first
+        """
+        self._flush()
+        counts = self.candidates.counts
+        if counts.empty:
+            return []
+        # NOTE: Both estimates only overestimate, the smaller is closer
+        estimates = np.minimum(counts.to_numpy(), self.sketch.estimate(counts.index.to_numpy()))
+        return top_k(dict(zip(counts.index.tolist(), estimates.tolist())), k)
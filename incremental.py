@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""Incremental MapReduce over daily passenger data deltas
+
+Reduced flights and the Task 1/Task 2 aggregates are kept in an indexed
+SQLite state file. A delta is mapped on its own and only the flight keys
+it touches are looked up, re-reduced and written back, with the
+aggregates updated by the difference, so applying a delta costs time
+proportional to the delta rather than to the history. The merged flights
+are exported back to the reduced csv file when asked, once after every
+given delta is merged, for the full pipeline's analysis, the columnar
+format, the passenger index and the query service.
+
+Usage:
+    python incremental.py [--export] [<delta passenger csv> ...]
+"""
+import argparse
+import json
+import os
+import sqlite3
+
+import pandas as pd
+from dotenv import load_dotenv
+
+import columnar
+import main as mapreduce
+import mapper
+import validator
+from flight import Flight
+from main import (
+    get_airport_data,
+    get_airports,
+    get_passenger_data,
+    get_total_airport_flights,
+    init_settings,
+    invalidate_cached,
+    print_task_1_results,
+    print_task_2_results,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (key TEXT PRIMARY KEY, flight TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS airports (
+    airport TEXT PRIMARY KEY,
+    flights INTEGER NOT NULL DEFAULT 0,
+    passengers INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS passengers (passenger TEXT PRIMARY KEY, flights INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS passengers_by_flights ON passengers (flights);
+CREATE TABLE IF NOT EXISTS source (stat TEXT NOT NULL);
+"""
+
+
+class IncrementalState:
+    """Reduced flights and task aggregates persisted between deltas
+
+    Attributes:
+        file_name (str): SQLite state file
+    """
+
+    def __init__(self, file_name):
+        """Open, creating if needed, the state file
+
+        Args:
+            file_name (str): SQLite state file
+        """
+        self.file_name = file_name
+        self._connection = sqlite3.connect(file_name)
+        self._connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        """Returns:
+            IncrementalState: this state
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the state file"""
+        self._connection.close()
+
+    def is_current(self, file_name):
+        """Whether the state was seeded from, or exported to, a reduced csv
+        file as it is now
+
+        Args:
+            file_name (str): reduced csv file
+        Returns:
+            bool: False if the state is unstamped or the file has changed since
+        """
+        row = self._connection.execute("SELECT stat FROM source").fetchone()
+        return row is not None and json.loads(row[0]) == columnar.source_stat(file_name)
+
+    def stamp(self, file_name):
+        """Record the reduced csv file the state matches
+
+        Args:
+            file_name (str): reduced csv file
+        """
+        with self._connection as connection:
+            connection.execute("DELETE FROM source")
+            connection.execute("INSERT INTO source (stat) VALUES (?)", (json.dumps(columnar.source_stat(file_name)),))
+
+    def seed(self, file_name):
+        """Replace the state with a reduced csv file's flights in one transaction
+
+        Args:
+            file_name (str): reduced csv file
+        """
+        with self._connection as connection:
+            for table in ("flights", "airports", "passengers", "source"):
+                connection.execute(f"DELETE FROM {table}")
+            for flight in columnar.read_reduced(file_name):
+                self._merge_flight(connection, flight)
+        # NOTE: Stamped after the flights commit, a state left unstamped is reseeded
+        self.stamp(file_name)
+
+    def merge(self, flights):
+        """Merge mapped or reduced flights into the state in one transaction
+
+        Args:
+            flights (iterable): flights, may share flight keys
+        Returns:
+            int: number of flight keys changed
+        """
+        changed = set()
+        with self._connection as connection:
+            for flight in flights:
+                if self._merge_flight(connection, flight):
+                    changed.add(flight.get_flight_key())
+        return len(changed)
+
+    def _merge_flight(self, connection, flight):
+        """Re-reduce one flight key against the stored flight
+
+        Args:
+            connection (sqlite3.Connection): connection in a transaction
+            flight (Flight): flight to merge
+        Returns:
+            bool: whether the flight key is new or gained passengers
+        """
+        key = flight.get_flight_key()
+        row = connection.execute("SELECT flight FROM flights WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            stored = flight
+            new_passengers = list(flight.passengers)
+            connection.execute(
+                "INSERT INTO airports (airport, flights) VALUES (?, 1) "
+                "ON CONFLICT (airport) DO UPDATE SET flights = flights + 1",
+                (flight.from_airport,),
+            )
+        else:
+            stored = Flight(row[0])
+            new_passengers = [passenger for passenger in flight.passengers if passenger not in stored.passengers]
+            stored.merge(flight)
+
+        if row is not None and not new_passengers:
+            return False
+        connection.execute("INSERT OR REPLACE INTO flights (key, flight) VALUES (?, ?)", (key, str(stored)))
+        connection.execute(
+            "INSERT INTO airports (airport, passengers) VALUES (?, ?) "
+            "ON CONFLICT (airport) DO UPDATE SET passengers = passengers + excluded.passengers",
+            (stored.to_airport, len(new_passengers)),
+        )
+        connection.executemany(
+            "INSERT INTO passengers (passenger, flights) VALUES (?, 1) "
+            "ON CONFLICT (passenger) DO UPDATE SET flights = flights + 1",
+            [(passenger,) for passenger in new_passengers],
+        )
+        return True
+
+    def flight_counts(self, airports):
+        """Task 1 aggregate
+
+        Args:
+            airports (list): list of airports
+        Returns:
+            dict: airports to number of flights from those airports
+        """
+        flight_counts = dict.fromkeys(airports, 0)
+        for airport, flights in self._connection.execute("SELECT airport, flights FROM airports"):
+            if airport in flight_counts:
+                flight_counts[airport] = flights
+        return flight_counts
+
+    def passenger_counts(self, airports):
+        """Passengers per airport aggregate
+
+        Args:
+            airports (list): list of airports
+        Returns:
+            dict: airports to number of passengers flying to those airports
+        """
+        passenger_counts = dict.fromkeys(airports, 0)
+        for airport, passengers in self._connection.execute("SELECT airport, passengers FROM airports"):
+            if airport in passenger_counts:
+                passenger_counts[airport] = passengers
+        return passenger_counts
+
+    def passengers_with_most_flights(self):
+        """Task 2 aggregate, read from the flight count index
+
+        Returns:
+            list: passengers with most flights, in order, empty if none
+            int: number of flights
+        """
+        (max_flights,) = self._connection.execute("SELECT MAX(flights) FROM passengers").fetchone()
+        if max_flights is None:
+            return [], 0
+        passengers = self._connection.execute(
+            "SELECT passenger FROM passengers WHERE flights = ? ORDER BY passenger", (max_flights,)
+        )
+        return [passenger for (passenger,) in passengers], max_flights
+
+    def export(self, file_name):
+        """Write every reduced flight to a reduced csv file
+
+        Args:
+            file_name (str): reduced csv file
+        """
+        # NOTE: Written aside then renamed, so readers never see a partial file
+        partial = file_name + ".partial"
+        with open(partial, "w", encoding="utf-8") as file:
+            for (flight,) in self._connection.execute("SELECT flight FROM flights ORDER BY key"):
+                file.write(flight + "\n")
+        os.replace(partial, file_name)
+
+
+def apply_delta(state, delta_data):
+    """Map a passenger data delta and merge it into the state
+
+    Args:
+        state (IncrementalState): reduced state
+        delta_data (pd.DataFrame): new passenger data rows
+    Returns:
+        int: number of flight keys changed
+    """
+    # NOTE: map_flights groups the delta's rows, one flight per key
+    return state.merge(mapper.map_flights(delta_data))
+
+
+def get_valid_delta(file_name, airports):
+    """Load a passenger data delta, validated like a full run's input
+
+    Args:
+        file_name (str): delta passenger csv file
+        airports (dict): known airports
+    Returns:
+        pd.DataFrame: valid passenger data
+        pd.DataFrame: file, line number, reasons and row of each rejected
+            row, None if VALIDATE_INPUT is off
+    """
+    if not mapreduce.VALIDATE:
+        return get_passenger_data(file_name), None
+    valid, rejected = validator.validate(file_name, airports)
+    rejected.insert(0, "file", file_name)
+    return valid, rejected
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Merge passenger data deltas into the reduced data")
+    parser.add_argument("deltas", nargs="*", help="delta passenger csv files, merged in order")
+    parser.add_argument(
+        "--export", action="store_true", help="write the merged flights to REDUCED_DATA_DIR once every delta is merged"
+    )
+    args = parser.parse_args()
+    init_settings()
+    load_dotenv()
+    state_file = os.getenv("INCREMENTAL_STATE_FILE", "mapreduce_output/incremental.sqlite")
+    # NOTE: Resolved by init_settings, Hadoop's output if USE_HADOOP_OUTPUT
+    reduced_file = mapreduce.REDUCED_DATA_DIR
+
+    with IncrementalState(state_file) as state:
+        # NOTE: Reseeded whenever the reduced file is no longer the one the
+        #   state was seeded from or exported to, such as after a full run,
+        #   otherwise exporting would overwrite it with stale flights
+        if os.path.exists(reduced_file) and not state.is_current(reduced_file):
+            print("[*]\tSeeding state from " + reduced_file)
+            state.seed(reduced_file)
+
+        airports = get_airports(get_airport_data())
+        rejected = []
+        for file_name in args.deltas:
+            delta_data, delta_rejected = get_valid_delta(file_name, airports)
+            if delta_rejected is not None:
+                rejected.append(delta_rejected)
+            delta_changed = apply_delta(state, delta_data)
+            print(f"[*]\tMerged {file_name}, {delta_changed} flight keys changed")
+        if rejected:
+            rejected = pd.concat(rejected, ignore_index=True)
+            validator.quarantine(rejected, mapreduce.QUARANTINE_FILE)
+            print(f"[*]\t{len(rejected)} delta rows quarantined to {mapreduce.QUARANTINE_FILE}")
+
+        # Publish the merged flights as the reduced output
+        # NOTE: Exporting rewrites every flight, so it's done once per run
+        #   and only when asked, rather than after every delta
+        if args.export:
+            # NOTE: A cached run restoring its older output would drop the deltas
+            invalidate_cached(reduced_file)
+            state.export(reduced_file)
+            state.stamp(reduced_file)
+            print(f"[*]\tExported merged flights to {reduced_file}")
+
+        print_task_1_results(get_total_airport_flights(state.flight_counts(airports)))
+        print_task_2_results(*state.passengers_with_most_flights())
+
+
+if __name__ == "__main__":
+    main()
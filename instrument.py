@@ -0,0 +1,185 @@
+"""Per-stage instrumentation and profiling hooks
+
+Stages are timed with the stage context manager. When the TRACE_FILE
+setting is set, each stage is appended to it as one JSON line, which is
+also a Chrome trace complete event, so a job's trace file can be turned
+into a trace viewable in chrome://tracing or Perfetto with
+write_chrome_trace. When the PROFILE_STAGES setting is cprofile or
+tracemalloc, each stage is also profiled and the profile written to
+PROFILE_DIR, in whichever process, parent or worker, ran the stage.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # NOTE: resource is unix only, peak RSS isn't reported on Windows
+    resource = None
+
+# Number of stages currently running in this process
+_depth = 0
+
+
+def peak_rss():
+    """Peak resident set size of this process since it started
+
+    NOTE: This is the process's high-water mark, not the stage's, so a
+    stage is only charged for memory when it raises the process's peak
+
+    Returns:
+        int: peak RSS in KiB, or None where unsupported
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # NOTE: macOS reports bytes, Linux reports KiB
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def count_records(data):
+    """Number of records in a stage's input or output
+
+    Args:
+        data: DataFrame, list of records, or list of lists of records
+    Returns:
+        int: number of records
+    """
+    if isinstance(data, list) and data and isinstance(data[0], list):
+        return sum(len(item) for item in data)
+    return len(data)
+
+
+def emit(event):
+    """Append an event to the trace file, if tracing is enabled
+
+    Args:
+        event (dict): Chrome trace event
+    """
+    trace_file = os.getenv("TRACE_FILE")
+    if not trace_file:
+        return
+    # NOTE: One short appended line per write, so workers don't interleave
+    with open(trace_file, "a", encoding="utf-8") as file:
+        file.write(json.dumps(event) + "\n")
+
+
+def reset():
+    """Truncate the trace file at the start of a job"""
+    trace_file = os.getenv("TRACE_FILE")
+    if trace_file:
+        open(trace_file, "w", encoding="utf-8").close()
+
+
+@contextlib.contextmanager
+def stage(name, procnum=None):
+    """Instrument a stage
+
+    Args:
+        name (str): stage name
+        procnum (int): thread/process number running the stage
+    Yields:
+        dict: stage fields the caller fills in, such as records_in,
+            records_out, bytes_in and bytes_out
+    """
+    global _depth
+    fields = {}
+    profile = os.getenv("PROFILE_STAGES")
+    if not os.getenv("TRACE_FILE") and not profile:
+        yield fields
+        return
+    # NOTE: Only one profiler can run at a time, nested stages are
+    #   profiled as part of the outermost stage
+    if _depth:
+        profile = None
+
+    profiler = None
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == "tracemalloc":
+        tracemalloc.start()
+
+    start = time.time()
+    cpu_start = time.process_time()
+    _depth += 1
+    try:
+        yield fields
+    finally:
+        _depth -= 1
+        wall = time.time() - start
+        cpu = time.process_time() - cpu_start
+        if profile == "tracemalloc":
+            # Peak Python allocations of this stage alone, unlike peak RSS
+            fields["stage_peak_traced_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+        save_profile(profiler, profile, name, procnum)
+        emit({
+            "name": name,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": wall * 1e6,
+            "pid": os.getpid(),
+            "tid": 0 if procnum is None else procnum,
+            "args": {"wall_seconds": wall, "cpu_seconds": cpu, "process_peak_rss_kib": peak_rss(), **fields},
+        })
+
+
+def save_profile(profiler, profile, name, procnum):
+    """Stop profiling a stage and write its profile to PROFILE_DIR
+
+    Args:
+        profiler (cProfile.Profile): running profiler, if profiling with cprofile
+        profile (str): cprofile, tracemalloc or None
+        name (str): stage name
+        procnum (int): thread/process number running the stage
+    """
+    if profile not in ("cprofile", "tracemalloc"):
+        return
+    directory = os.getenv("PROFILE_DIR", "mapreduce_output/profiles")
+    os.makedirs(directory, exist_ok=True)
+    file_name = os.path.join(directory, f"{name}-{procnum}-{os.getpid()}")
+
+    if profile == "cprofile":
+        profiler.disable()
+        profiler.dump_stats(file_name + ".prof")
+    else:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        snapshot.dump(file_name + ".tracemalloc")
+
+
+def record_skew(name, sizes):
+    """Record how evenly a stage's output is spread over its partitions
+
+    Args:
+        name (str): stage name
+        sizes (list): bytes of each partition
+    """
+    mean = sum(sizes) / len(sizes) if sizes else 0
+    emit({
+        "name": name + " skew",
+        "ph": "i",
+        "s": "g",
+        "ts": time.time() * 1e6,
+        "pid": os.getpid(),
+        "tid": 0,
+        "args": {"partition_bytes": sizes, "max_over_mean": max(sizes) / mean if mean else 0},
+    })
+
+
+def write_chrome_trace(trace_file, file_name):
+    """Convert a JSON lines trace file to a Chrome trace file
+
+    Args:
+        trace_file (str): JSON lines trace file
+        file_name (str): Chrome trace file to write
+    """
+    with open(trace_file, "r", encoding="utf-8") as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    with open(file_name, "w", encoding="utf-8") as file:
+        json.dump({"traceEvents": events}, file)
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
-import multiprocessing
-import operator
+import contextlib
 import os
 from distutils.util import strtobool
 
@@ -8,137 +7,85 @@ import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 
-import combiner
+import aggregator
+import buffers
+import cache
+import columnar
+import encoding
+import instrument
 import flight
+import heavy_hitters
 import mapper
+import mileage
+import partitioning
+import passenger_index
 import reducer
-import sorter
+import validator
+from executor import Executor
+
+# Modules whose source is part of the cache key of a MapReduce run
+PIPELINE_MODULES = [
+    "encoding.py",
+    "flight.py",
+    "mapper.py",
+    "sorter.py",
+    "reducer.py",
+    "buffers.py",
+    "executor.py",
+    "columnar.py",
+    "mileage.py",
+    "validator.py",
+    "partitioning.py",
+    "passenger_index.py",
+    "cache.py",
+]
 
 
 # Tasks
-def get_total_airport_flights(reduced_data, airports):
+def get_total_airport_flights(flight_counts):
     """Get total number of flights from each airport
     
     Args:
-        reduced_data (pd.DataFrame): reduced data
-        airports (list): list of airports
+        flight_counts (dict): airports to number of flights from those airports
     Return:
-        dict: airports to number of flights from those airports
+        pd.DataFrame: airport flight counts, most flights first
     """
-    flight_counts = {}
-    # For each unique airport
-    for airport in airports:
-        flight_counts[airport] = 0
-        # Split each row in reduced_data
-        for row in reduced_data:
-            row = row[0].split(",")
-            # If airport is the same as row
-            if airport == row[0][:3]:
-                # Increment flight count for this airport in dictionary
-                flight_counts[airport] += 1
-    
-    # Sort dictionary by values
-    flight_counts = sorted(flight_counts.items(), key=lambda x: x[1], reverse=True)
-    # flight_counts to dataframe
-    flight_counts = pd.DataFrame(flight_counts, columns=["airport", "flights"])
-    dataframes = []
-    # For each unique number of flights in flight_counts
-    for i in flight_counts["flights"].unique():
-        # Create temp dataframe with same flights value
-        temp = flight_counts[flight_counts["flights"] == i]
-        # Sort temp by airport
-        temp = temp.sort_values(by="airport")
-        # Append temp to dataframes
-        dataframes.append(temp)
-    flight_counts = pd.concat(dataframes)
+    # NOTE: Keep results consistent, order by airport too
+    flight_counts = aggregator.rank(flight_counts, ["airport", "flights"])
 
     flight_counts.to_csv(f"{TASK_RESULT_DIR}/flight_count.csv", index=False)
 
     return flight_counts
 
 
-def get_passengers_per_airport(reduced_data, airports):
-    """Get total number of flights from each airport 
+def get_passengers_per_airport(passenger_counts):
+    """Get total number of passengers flying to each airport 
     NOTE: Fancied playing around with the data
 
     Args:
-        reduced_data (pd.DataFrame): reduced data
-        airports (list): list of airports
+        passenger_counts (dict): airports to number of passengers
     Return:
-        dict: airports to number of flights from those airports
+        pd.DataFrame: airport passenger counts, most passengers first
     """
-    flight_counts = {}
-    for airport in airports:
-        # Initialise flight count for airport entry in dictionary
-        flight_counts[airport] = 0
-        for from_airport in reduced_data:
-            # comma separated string to list
-            from_airport = from_airport[0].split(",")
-            # If airport is the same as from_airport
-            if airport == from_airport[1]:
-                # Increment flight count for this airport in dictionary
-                flight_counts[airport] += len(from_airport) - 4
-
-    # order flight_counts in descending order
-    flight_counts = sorted(flight_counts.items(), key=lambda x: x[1], reverse=True)
-
     # NOTE: Keep results consistent, order by airport too
-    # flight_counts to dataframe
-    flight_counts = pd.DataFrame(flight_counts, columns=["airport", "flights"])
-    dataframes = []
-    # For each unique number of flights in flight_counts
-    for i in flight_counts["flights"].unique():
-        # Create temp dataframe with same flights value
-        temp = flight_counts[flight_counts["flights"] == i]
-        # Sort temp by airport
-        temp = temp.sort_values(by="airport")
-        # Append temp to dataframes
-        dataframes.append(temp)
-    flight_counts = pd.concat(dataframes)
+    flight_counts = aggregator.rank(passenger_counts, ["airport", "flights"])
 
     flight_counts.to_csv(f"{TASK_RESULT_DIR}/flight_count.csv", index=False)
 
     return flight_counts
 
 
-def get_passenger_with_most_flights(data):
+def get_passenger_with_most_flights(passenger_flights):
     """Get passenger with most flights (Task 2)
 
     Args:
-        data (pd.DataFrame): reduced data
+        passenger_flights (dict): passengers to number of flights
     Return:
-        str: passenger with most flights
+        list: passengers with most flights
         int: number of flights
     """
-    passengers = {}
-    for f in data:
-        f = f[0].split(",")
-        for passenger in f[4:]:
-            if passenger in passengers:
-                passengers[passenger] += 1
-            else:
-                passengers[passenger] = 1
-
-    # Get dictionary entry with highest value
-    max_passenger = max(passengers.items(), key=operator.itemgetter(1))[0]
-    flight_count = passengers[max_passenger]
-
-    # order passengers in descending order
-    passengers = sorted(passengers.items(), key=lambda x: x[1], reverse=True)
-
     # NOTE: Keep results consistent, order by passenger too
-    # from_count to dataframe
-    passengers = pd.DataFrame(passengers, columns=["passenger", "flights"])
-    dataframes = []
-    # For each unique number of flights in passengers
-    for i in passengers["flights"].unique():
-        # Create temp dataframe with same flights value
-        temp = passengers[passengers["flights"] == i]
-        # Sort temp by passenger
-        temp = temp.sort_values(by="passenger")
-        # Append temp to dataframes
-        dataframes.append(temp)
-    passengers = pd.concat(dataframes)
+    passengers = aggregator.rank(passenger_flights, ["passenger", "flights"])
 
     passengers.to_csv(f"{TASK_RESULT_DIR}/passengers.csv", index=False)
 
@@ -151,6 +98,82 @@ def get_passenger_with_most_flights(data):
     return max_passenger_list, max_flight_count
 
 
+def get_top_passengers(passenger_summary, names=None):
+    """Get passengers with most flights from a passenger summary (Task 2)
+
+    Only the top passengers are ranked and saved, rather than every
+    passenger.
+
+    Args:
+        passenger_summary: ExactTopK or HeavyHitters summary of passengers
+        names (list): passenger of each summarized code, None if the
+            summary counted passengers themselves
+    Return:
+        list: passengers with most flights
+        int: number of flights
+    """
+    top = passenger_summary.top(TOP_PASSENGERS)
+    if names is not None:
+        top = [(names[code], count) for code, count in top]
+    if isinstance(passenger_summary, heavy_hitters.HeavyHitters):
+        print(f"[*]\tApproximate passenger counts, overestimated by at most {passenger_summary.error()}")
+
+    return rank_top_passengers(top)
+
+
+def get_indexed_passengers(index):
+    """Get passengers with most flights from the passenger index (Task 2)
+
+    Flight counts are read from the index offsets, no flights are scanned.
+
+    Args:
+        index (passenger_index.PassengerIndex): passenger to flights index
+    Return:
+        list: passengers with most flights
+        int: number of flights
+    """
+    return rank_top_passengers(index.top(TOP_PASSENGERS))
+
+
+def rank_top_passengers(top):
+    """Save the top passengers and find those with most flights
+
+    Args:
+        top (list): (passenger, flights) pairs of the top passengers
+    Return:
+        list: passengers with most flights
+        int: number of flights
+    """
+    # NOTE: Keep results consistent, order by passenger too
+    passengers = aggregator.rank(dict(top), ["passenger", "flights"])
+
+    passengers.to_csv(f"{TASK_RESULT_DIR}/passengers.csv", index=False)
+
+    max_flight_count = passengers["flights"].max()
+    max_passenger_list = passengers[passengers["flights"] == max_flight_count]["passenger"].tolist()
+
+    return max_passenger_list, max_flight_count
+
+
+def get_passenger_mileage(flight_distances, passenger_miles):
+    """Get flight distances and the passengers who flew furthest (Task 3)
+
+    Args:
+        flight_distances (pd.DataFrame): distance of each flight
+        passenger_miles (dict): passengers to miles flown
+    Return:
+        pd.DataFrame: top passengers by miles flown
+    """
+    flight_distances.to_csv(f"{TASK_RESULT_DIR}/flight_distances.csv", index=False)
+
+    # NOTE: Keep results consistent, order by passenger too
+    passengers = aggregator.rank(passenger_miles, ["passenger", "miles"])
+    passengers["miles"] = passengers["miles"].round(1)
+    passengers.to_csv(f"{TASK_RESULT_DIR}/passenger_miles.csv", index=False)
+
+    return passengers.head(TOP_TRAVELLERS)
+
+
 def print_task_1_results(airport_flights):
     """Prints results for Task 1
 
@@ -177,6 +200,9 @@ def print_task_2_results(passengers, flight_count):
         flight_count (int): number of flights
     """
     print("\n[*]\tTask 2\n")
+    if not passengers:
+        print("No passengers have taken a flight")
+        return
     # If there's more than 1 passenger with most flights
     if len(passengers) > 1:
         print("Passengers")
@@ -188,14 +214,29 @@ def print_task_2_results(passengers, flight_count):
     print(f"{passengers[0]} has the most number of flights ({flight_count})")
 
 
+def print_task_3_results(travellers):
+    """Prints results for Task 3
+
+    Args:
+        travellers (pd.DataFrame): top passengers by miles flown
+    """
+    print("\n[*]\tTask 3\n")
+    print("Passenger\t| Miles")
+    print("------------------------")
+    for passenger, miles in zip(travellers["passenger"], travellers["miles"]):
+        print(f"{passenger}\t| {miles:,.1f}")
+
+
 # Get/Load data
-def get_passenger_data():
+def get_passenger_data(file_name=None):
     """ Load passenger data from csv file
+    Args:
+        file_name (str): passenger data file, defaults to the data-set's
     Returns:
         pd.DataFrame: passenger data
     """
     return pd.read_csv(
-        f"{DATA_DIR}/AComp_Passenger_data_no_error.csv",
+        file_name or f"{DATA_DIR}/{PASSENGER_DATA}",
         names=[
             "passenger_id",
             "flight_id",
@@ -207,14 +248,16 @@ def get_passenger_data():
     )
 
 
-def get_airport_data():
+def get_airport_data(file_name=None):
     """ Loads airport data from csv file
+    Args:
+        file_name (str): airport data file, defaults to the data-set's
     Returns:
         pd.DataFrame: airport data
     """
     # Load airports
     return pd.read_csv(
-        f"{DATA_DIR}/Top30_airports_LatLong.csv",
+        file_name or f"{DATA_DIR}/Top30_airports_LatLong.csv",
         names=["airport", "airport_code", "lat", "long"],
     )
 
@@ -235,72 +278,130 @@ def get_reduced_data(file_name):
     return reduced_data
 
 
+def get_valid_passenger_data(file_name, airports, executor=None):
+    """Load passenger data, quarantining rows that fail validation
+
+    Args:
+        file_name (str): passenger data file
+        airports (dict): known airports
+        executor (Executor): worker pool to validate on, validates in this
+            process if None
+    Returns:
+        pd.DataFrame: valid passenger data
+    """
+    if not VALIDATE:
+        return get_passenger_data(file_name)
+
+    valid, rejected = validator.validate(file_name, airports, executor)
+    validator.quarantine(rejected, QUARANTINE_FILE)
+    print(f"[*]\tValidated {file_name}, {len(rejected)} rows quarantined to {QUARANTINE_FILE}")
+    return valid
+
+
 # MapReduce functions
-def single_thread_mapreduce(passenger_data):
+def single_thread_mapreduce(passenger_data, coordinates=None, index_dir=None):
     """Single thread mapreduce
     
     Args:
-        passenger_data (pd.DataFrame): passenger data
+        passenger_data (pd.DataFrame): passenger data, may be dictionary encoded
+        coordinates (pd.DataFrame): airport coordinate table to join
+            flight distances from
+        index_dir (str): directory to save the passenger to flights index
+            to, not indexed if None
+    Returns:
+        list: reduced flights
     """
     # Load environment variables from .env
     load_dotenv()
     # Initialise mapreduce file names
-    mapper_data_name = os.getenv("MAPPED_DATA")
+    MAPPED_DATA_DIR = os.getenv("MAPPED_DATA_DIR")
     REDUCED_DATA_DIR = os.getenv("REDUCED_DATA_DIR")
-    # Map passenger data to flights
-    mapper._map(passenger_data, file_name=mapper_data_name)
-    # Load sorted dataframe into dataframe
-    mapped_data = pd.read_csv(mapper_data_name, header=None)
-    # Reduce dataframe
-    reducer._reduce(mapped_data, file_name=REDUCED_DATA_DIR)
+    # Map passenger data to flights sorted by flight key
+    with instrument.stage("map") as fields:
+        fields["records_in"] = len(passenger_data)
+        sorted_data = mapper._map(passenger_data, file_name=MAPPED_DATA_DIR, coordinates=coordinates)
+        fields["records_out"] = len(sorted_data)
+    # Reduce sorted flights
+    with instrument.stage("reduce") as fields:
+        fields["records_in"] = len(sorted_data)
+        reduced_data = reducer._reduce(sorted_data, file_name=REDUCED_DATA_DIR)
+        fields["records_out"] = len(reduced_data)
+
+    if index_dir is not None:
+        with instrument.stage("index"):
+            dictionaries = flight.EncodedFlight.dictionaries
+            offsets, keys = passenger_index.merge(
+                [passenger_index.index_flights(reduced_data)], len(dictionaries["passenger"].values)
+            )
+            passenger_index.save_encoded(offsets, keys, dictionaries, index_dir)
+    return reduced_data
 
 
-def multi_thread_mapreduce(passenger_data):
+def multi_thread_mapreduce(passenger_data, executor, coordinates=None, passenger_summary=None, index_dir=None):
     """Multi-thread mapreduce functions
     
     Args:
-        passenger_data (pd.DataFrame): passenger data
+        passenger_data (pd.DataFrame): passenger data, may be dictionary encoded
+        executor (Executor): worker pool to run every stage on
+        coordinates (pd.DataFrame): airport coordinate table broadcast to
+            the mappers to join flight distances from
+        passenger_summary: empty passenger summary each reducer's
+            passengers are counted into in parallel, skipped if None
+        index_dir (str): directory to save the passenger to flights index,
+            built by each reducer in parallel, to, not indexed if None
+    Returns:
+        list: reduced flights
     """
-    # Shuffle order of passenger_data
-    passenger_data = passenger_data.sample(frac=1).reset_index(drop=True)
-    print(passenger_data.head())
-    # Split passenger_data into processor count partitions
-    partitions = np.array_split(passenger_data, os.cpu_count())
-
-    # Initialise empty list of length equal to number of partitions
-    map_results = multiprocessing.Manager().list([None] * len(partitions))
-
-    # Apply mapper function to each partition
-    mapper.multithread_map(partitions, map_results)
-
-    # NOTE: Reduce all data partitions
-    # Initialise empty list of length equal to number of partitions
-    reduce_results = multiprocessing.Manager().list([None] * len(map_results))
-    # Apply multithreading reduce function to each map_result
-    reducer.multithread_reduce(map_results, reduce_results)
-
-    # Partition count is same as cpu core count
-    partitions = os.cpu_count()
-    while partitions > 1:
-        # Right bit shift to halve the value each loop until 0
-        partitions = partitions >> 1
-        # Stores processed reduce results as backup
-        temp = reduce_results
-        # Initialise empty list of length equal to number of new partitions
-        reduce_results = multiprocessing.Manager().list([None] * partitions)
-        # For each pair of lists in temp
-        combiner.multithread_combine(temp, reduce_results)
-
-        if partitions != 1:
-            # Sort each partition as to successfully reduce each list
-            sorter.multithread_sort(reduce_results, reduce_results)
-            # Execute multithread reduce function
-            reducer.multithread_reduce(reduce_results, reduce_results)
-
-    # Sort final partition's flight data by flight_id
-    reduced = sorter._sort(reduce_results)
-    # Final reduce of combined reduced partitions
-    reducer._reduce(reduced)
+    # Size partitions and reducers by estimated bytes, splitting hot flight keys
+    with instrument.stage("partition") as fields:
+        fields["records_in"] = len(passenger_data)
+        partitions, partitioner = partitioning.plan(
+            passenger_data, executor.workers, PARTITION_BYTES, SKEW_SAMPLE_ROWS
+        )
+        fields["records_out"] = len(partitioner.hot_keys)
+    print(f"[*]\t{len(partitions)} map partitions, {partitioner.partitions} reducers, "
+          f"{len(partitioner.hot_keys)} hot flight keys split")
+
+    # Apply mapper function to each partition, routing each flight to its reducer(s)
+    with instrument.stage("map") as fields:
+        fields["records_in"] = len(passenger_data)
+        map_results = mapper.multithread_map(partitions, executor, partitioner, coordinates)
+        fields["bytes_out"] = buffers.size_of(map_results)
+    # Bytes shuffled to each reducer
+    instrument.record_skew("map", [buffers.size_of(list(buckets)) for buckets in zip(*map_results)])
+
+    # NOTE: Each reducer owns its flight keys, so one parallel reduce is final
+    with instrument.stage("reduce") as fields:
+        fields["bytes_in"] = buffers.size_of(map_results)
+        reduce_results = reducer.multithread_reduce(map_results, executor)
+        fields["bytes_out"] = buffers.size_of(reduce_results)
+    instrument.record_skew("reduce", [buffers.size_of(buffer) for buffer in reduce_results])
+
+    # Summarize passengers where each reducer's flights already are
+    if passenger_summary is not None:
+        with instrument.stage("summarize"):
+            reducer.multithread_summarize(reduce_results, executor, passenger_summary)
+
+    # Index each reducer's passengers to flights, then merge the indexes
+    if index_dir is not None:
+        with instrument.stage("index"):
+            dictionaries = flight.EncodedFlight.dictionaries
+            offsets, keys = reducer.multithread_index(
+                reduce_results, executor, len(dictionaries["passenger"].values)
+            )
+            passenger_index.save_encoded(offsets, keys, dictionaries, index_dir)
+
+    # Merge hot flight keys' partial reductions, then write every
+    #   reducer's output to the reduced data file
+    # NOTE: Sorted by flight key like the single-threaded output, so the
+    #   output doesn't depend on the number of reducers
+    reduce_results = reducer.merge_split_keys(buffers.load(reduce_results), partitioner.hot_keys, passenger_data)
+    reduced = sorted(
+        (flight for flights in reduce_results for flight in flights), key=lambda flight: flight.get_flight_key()
+    )
+    reducer.save_reduced_results([reduced], os.getenv("REDUCED_DATA_DIR"))
+
+    return reduced
 
 
 # Misc functions
@@ -317,13 +418,54 @@ def init_settings():
     global MULTITHREADING
     global REDUCED_DATA_DIR
     global MAPREDUCE
+    global WORKERS
+    global COLUMNAR
+    global COLUMNAR_DATA_DIR
+    global CACHE
+    global TOP_TRAVELLERS
+    global PASSENGER_DATA
+    global VALIDATE
+    global QUARANTINE_FILE
+    global PASSENGER_RANKING
+    global TOP_PASSENGERS
+    global PARTITION_BYTES
+    global SKEW_SAMPLE_ROWS
+    global PASSENGER_INDEX
+    global PASSENGER_INDEX_DIR
+    global TASK_TIMEOUT
+    global HEARTBEAT_INTERVAL
+    global TASK_RETRIES
+    global SPECULATION_FACTOR
+    global SPECULATION_MIN_SECONDS
 
     # Load environment variables from .env
     load_dotenv()
     # Initialise settings from environment variables
     MAPREDUCE = strtobool(os.getenv("EXECUTE_MAPREDUCE"))
     MULTITHREADING = strtobool(os.getenv("MULTITHREAD"))
+    # NOTE: 0 worker processes means one per cpu core
+    WORKERS = int(os.getenv("WORKERS", "0")) or os.cpu_count()
     hadoop = strtobool(os.getenv("USE_HADOOP_OUTPUT"))
+    COLUMNAR = strtobool(os.getenv("COLUMNAR_OUTPUT", "False"))
+    COLUMNAR_DATA_DIR = os.getenv("COLUMNAR_DATA_DIR", "mapreduce_output/reduced_columnar")
+    TOP_TRAVELLERS = int(os.getenv("TOP_TRAVELLERS", "10"))
+    PASSENGER_DATA = os.getenv("PASSENGER_DATA", "AComp_Passenger_data_no_error.csv")
+    VALIDATE = strtobool(os.getenv("VALIDATE_INPUT", "False"))
+    QUARANTINE_FILE = os.getenv("QUARANTINE_FILE", "mapreduce_output/quarantine.csv")
+    PASSENGER_RANKING = os.getenv("PASSENGER_RANKING", "exact")
+    TOP_PASSENGERS = int(os.getenv("TOP_PASSENGERS", "10"))
+    PASSENGER_INDEX = strtobool(os.getenv("PASSENGER_INDEX", "False"))
+    PASSENGER_INDEX_DIR = os.getenv("PASSENGER_INDEX_DIR", "mapreduce_output/passenger_index")
+    PARTITION_BYTES = int(os.getenv("PARTITION_BYTES", str(partitioning.PARTITION_BYTES)))
+    SKEW_SAMPLE_ROWS = int(os.getenv("SKEW_SAMPLE_ROWS", str(partitioning.SAMPLE_ROWS)))
+    # NOTE: 0 disables the task timeout, and speculative execution
+    TASK_TIMEOUT = float(os.getenv("TASK_TIMEOUT", "0"))
+    HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "1"))
+    TASK_RETRIES = int(os.getenv("TASK_RETRIES", "2"))
+    SPECULATION_FACTOR = float(os.getenv("SPECULATION_FACTOR", "2"))
+    SPECULATION_MIN_SECONDS = float(os.getenv("SPECULATION_MIN_SECONDS", "1"))
+    # NOTE: Hadoop's output isn't produced by this process, so isn't cached
+    CACHE = strtobool(os.getenv("USE_CACHE", "False")) and not hadoop
 
     # NOTE: If we're using hadoop, assign different output directory
     # versus using python script
@@ -340,6 +482,75 @@ def init_settings():
             os.mkdir(folder)
 
 
+def open_stage_cache():
+    """Open the stage output cache
+
+    Returns:
+        cache.StageCache: stage output cache
+    """
+    return cache.StageCache(
+        os.getenv("CACHE_DIR", "mapreduce_output/cache"),
+        int(os.getenv("CACHE_MAX_BYTES", str(1024 ** 3))),
+    )
+
+
+def invalidate_cached(output):
+    """Drop cached runs of an output rewritten outside of main's MapReduce,
+    such as by an incremental or multi-node run
+
+    Args:
+        output (str): output file being rewritten
+    """
+    # NOTE: Entries are dropped even with the cache off, it may be turned back on
+    if os.path.isdir(os.getenv("CACHE_DIR", "mapreduce_output/cache")):
+        open_stage_cache().invalidate(output)
+
+
+def get_stage_cache(input_files):
+    """Open the stage output cache and address this run in it
+
+    Args:
+        input_files (list): passenger and airport data files the run reads
+    Returns:
+        cache.StageCache: stage output cache
+        str: cache key of this run's input, code and settings
+    """
+    stage_cache = open_stage_cache()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    code_files = [os.path.join(directory, module) for module in PIPELINE_MODULES]
+    # NOTE: Worker count and partitioning change the order flights are written in
+    settings = {
+        "multithread": bool(MULTITHREADING),
+        "workers": WORKERS,
+        "partition_bytes": PARTITION_BYTES,
+        "skew_sample_rows": SKEW_SAMPLE_ROWS,
+        "columnar": bool(COLUMNAR),
+        "validate": bool(VALIDATE),
+        "passenger_index": bool(PASSENGER_INDEX),
+    }
+    return stage_cache, stage_cache.key(input_files, code_files, settings)
+
+
+def get_passenger_summary():
+    """Empty passenger summary for the PASSENGER_RANKING mode
+
+    Returns:
+        ExactTopK or HeavyHitters summary, None to rank exact counts of
+            every passenger
+    """
+    if PASSENGER_RANKING == "topk":
+        return heavy_hitters.ExactTopK()
+    if PASSENGER_RANKING == "approximate":
+        return heavy_hitters.HeavyHitters(
+            float(os.getenv("SKETCH_EPSILON", "0.0001")),
+            float(os.getenv("SKETCH_DELTA", "0.01")),
+            int(os.getenv("SPACE_SAVING_CAPACITY", "1000")),
+        )
+    if PASSENGER_RANKING != "exact":
+        raise ValueError(f"Unknown PASSENGER_RANKING '{PASSENGER_RANKING}'")
+    return None
+
+
 def get_airports(data):
     """Data Wrangling to match airport_code to corresponding airport/lat/long
 
@@ -350,7 +561,10 @@ def get_airports(data):
         dict: airport and corresponding airports' data
     """
 
-    return {row["airport_code"]: [row["airport"], row["lat"], row["long"]] for _, row in data.iterrows()}
+    return {
+        code: [airport, lat, long]
+        for airport, code, lat, long in zip(data["airport"], data["airport_code"], data["lat"], data["long"])
+    }
 
 
 def main():
@@ -358,33 +572,135 @@ def main():
     # Clear console
     cls()
     init_settings()
-    passenger_data = get_passenger_data()
-
-    # NOTE: Executes MapReduce process on a single or multiple threads
-    if MAPREDUCE:
-        if not MULTITHREADING:
-            print("[*]\tSingle-threaded")
-            single_thread_mapreduce(passenger_data)
-
-        if MULTITHREADING:
-            print("[*]\tMulti-threaded")
-            multi_thread_mapreduce(passenger_data)
-
-    # Get reduced flight data
-    reduced = get_reduced_data(REDUCED_DATA_DIR)
+    instrument.reset()
+    passenger_file = f"{DATA_DIR}/{PASSENGER_DATA}"
+    airport_file = f"{DATA_DIR}/Top30_airports_LatLong.csv"
     # Get airport data
-    airport_data = get_airport_data()
+    airport_data = get_airport_data(airport_file)
     # Get airports from airport_data
     airports = get_airports(airport_data)
+    passenger_summary = get_passenger_summary()
+    # Passenger codes the summary counted, decoded when ranking
+    passenger_names = None
+    index_dir = PASSENGER_INDEX_DIR if PASSENGER_INDEX else None
+
+    # NOTE: With the cache, MapReduce runs exactly when this input, code
+    #   and settings have no cached outputs, whatever EXECUTE_MAPREDUCE says
+    execute = MAPREDUCE
+    if CACHE:
+        stage_cache, key = get_stage_cache([passenger_file, airport_file])
+        execute = not stage_cache.restore(key)
+        print(f"[*]\tCache {'miss' if execute else 'hit'} {key[:12]}")
+
+    # NOTE: Executes MapReduce process on a single or multiple threads
+    if execute:
+        # NOTE: Worker processes are started once and reused by every stage
+        executor = Executor(
+            WORKERS,
+            task_timeout=TASK_TIMEOUT,
+            heartbeat_interval=HEARTBEAT_INTERVAL,
+            retries=TASK_RETRIES,
+            speculation=SPECULATION_FACTOR,
+            speculation_min=SPECULATION_MIN_SECONDS,
+        )
+        with executor if MULTITHREADING else contextlib.nullcontext() as executor:
+            passenger_data = get_valid_passenger_data(passenger_file, airports, executor)
+
+            # Map airports, flight ids and passenger ids to integer codes once,
+            #   flights are decoded as they're written
+            with instrument.stage("encode") as fields:
+                fields["records_in"] = len(passenger_data)
+                passenger_data, dictionaries = encoding.encode_frame(passenger_data, airports)
+            flight.EncodedFlight.dictionaries = dictionaries
+            # Airport coordinates by airport code integer, joined map-side
+            coordinates = mileage.coordinate_table(airports, dictionaries["airport"])
+
+            if not MULTITHREADING:
+                print("[*]\tSingle-threaded")
+                reduced = single_thread_mapreduce(passenger_data, coordinates, index_dir)
+
+            if MULTITHREADING:
+                print("[*]\tMulti-threaded")
+                reduced = multi_thread_mapreduce(passenger_data, executor, coordinates, passenger_summary, index_dir)
+
+        if COLUMNAR:
+            columnar.save((reduced_flight.decode(dictionaries) for reduced_flight in reduced), COLUMNAR_DATA_DIR)
+            columnar.stamp(COLUMNAR_DATA_DIR, os.getenv("REDUCED_DATA_DIR"))
+        if PASSENGER_INDEX:
+            # NOTE: Stamped only now, the index is built before the reduced file is written
+            columnar.stamp(PASSENGER_INDEX_DIR, os.getenv("REDUCED_DATA_DIR"))
+
+        if CACHE:
+            outputs = [os.getenv("MAPPED_DATA_DIR"), os.getenv("REDUCED_DATA_DIR")]
+            outputs += [COLUMNAR_DATA_DIR] if COLUMNAR else []
+            outputs += [QUARANTINE_FILE] if VALIDATE else []
+            outputs += [PASSENGER_INDEX_DIR] if PASSENGER_INDEX else []
+            stage_cache.store(key, outputs)
+
+    # NOTE: Multithreaded reducers summarize this run's passengers as they reduce
+    summarized = execute and MULTITHREADING and passenger_summary is not None
+    with instrument.stage("aggregate"):
+        if COLUMNAR:
+            # NOTE: Convert reduced csv output, such as Hadoop's, whenever
+            #   it's not the output the columnar data was built from
+            if not columnar.is_current(COLUMNAR_DATA_DIR, REDUCED_DATA_DIR):
+                columnar.save(columnar.read_reduced(REDUCED_DATA_DIR), COLUMNAR_DATA_DIR)
+                columnar.stamp(COLUMNAR_DATA_DIR, REDUCED_DATA_DIR)
+            # Memory map reduced flight columns and aggregate them as arrays
+            reduced = columnar.load(COLUMNAR_DATA_DIR)
+            flight_counts, _, passenger_flights = aggregator.aggregate_columnar(
+                reduced, airports, passenger_summary, count_passengers=not summarized
+            )
+            # NOTE: The reducers' summary counted encoding's passenger codes,
+            #   which needn't match the columnar passenger ids
+            if summarized:
+                passenger_names = dictionaries["passenger"].values
+            else:
+                passenger_names = np.char.decode(reduced["passengers"], "ascii")
+            flight_distances, passenger_miles = mileage.aggregate_columnar(reduced, mileage.coordinate_table(airports))
+        elif execute:
+            # Count this run's reduced flights by their integer codes
+            # NOTE: Passengers aren't counted when they're read from the index,
+            #   or multithreaded reducers have already summarized them
+            flight_counts, _, passenger_flights = aggregator.aggregate_encoded(
+                reduced, dictionaries, airports, passenger_summary,
+                count_passengers=not (PASSENGER_INDEX or summarized),
+            )
+            passenger_names = dictionaries["passenger"].values
+            flight_distances, passenger_miles = mileage.aggregate_encoded(reduced, dictionaries)
+        else:
+            # Get reduced flight data
+            reduced = get_reduced_data(REDUCED_DATA_DIR)
+            # Aggregate reduced data for every task in a single pass
+            flight_counts, _, passenger_flights = aggregator.aggregate(reduced, airports, passenger_summary)
+            flight_distances, passenger_miles = mileage.aggregate(reduced, mileage.coordinate_table(airports))
 
     # Task 1
-    flight_numbers = get_total_airport_flights(reduced, airports)
+    flight_numbers = get_total_airport_flights(flight_counts)
     print_task_1_results(flight_numbers)
 
     # Task 2
-    passengers, flight_count = get_passenger_with_most_flights(reduced)
+    if PASSENGER_INDEX:
+        # NOTE: Index reduced csv output, such as Hadoop's, whenever it's
+        #   not the output the index was built from
+        if not columnar.is_current(PASSENGER_INDEX_DIR, REDUCED_DATA_DIR):
+            passenger_index.save_reduced(columnar.read_reduced(REDUCED_DATA_DIR), PASSENGER_INDEX_DIR)
+            columnar.stamp(PASSENGER_INDEX_DIR, REDUCED_DATA_DIR)
+        passengers, flight_count = get_indexed_passengers(passenger_index.PassengerIndex(PASSENGER_INDEX_DIR))
+    elif passenger_summary is None:
+        passengers, flight_count = get_passenger_with_most_flights(passenger_flights)
+    else:
+        passengers, flight_count = get_top_passengers(passenger_summary, passenger_names)
     print_task_2_results(passengers, flight_count)
 
+    # Task 3
+    travellers = get_passenger_mileage(flight_distances, passenger_miles)
+    print_task_3_results(travellers)
+
+    # Convert this job's trace to a Chrome/Perfetto trace
+    if os.getenv("TRACE_FILE"):
+        instrument.write_chrome_trace(os.getenv("TRACE_FILE"), os.getenv("CHROME_TRACE_FILE", "mapreduce_output/trace.json"))
+
 
 if __name__ == "__main__":
     main()
@@ -1,24 +1,32 @@
 #!/usr/bin/env python3
 """ Mapper function """
-import multiprocessing
+import functools
 import sys
+import zlib
 
+import numpy as np
 import pandas as pd
 
+import buffers
+import encoding
+import instrument
+import mileage
 import sorter
-from flight import Flight
+from flight import EncodedFlight, Flight
 
 
-def _map(data, ret=None, procnum=None, file_name="mapreduce_output/mapped_data.csv", hadoop_mode=False):
+def _map(data, procnum=None, file_name="mapreduce_output/mapped_data.csv", coordinates=None):
     """Reformat and map flight data
     Args:
         data (pd.Dataframe): passenger data with headers
-        ret (list): list we want to assign mapped results to during 
-            multi-threaded execution
         procnum (int): thread/process number representing the index of the partition
         file_name (str): file name to save mapped data to during 
             single-threaded execution
-        hadoop_mode (bool): if we are running mapper through hadoop
+        coordinates (pd.DataFrame): airport coordinate table to join
+            flight distances from
+    Returns:
+        list: mapped flights during multi-threaded execution, otherwise
+            sorted mapped flights
     """
 
     # If there's no processor number, it's a single threaded call
@@ -29,63 +37,156 @@ def _map(data, ret=None, procnum=None, file_name="mapreduce_output/mapped_data.c
     if type(procnum) == int:
         print("[*]\tMapper\tThread " + str(procnum))
 
-    # Convert passenger_data's dataframe to a string
-    #   each row separated by a new line
-    passenger_data = data.to_string(
-        header=False, index=False, index_names=False
-    ).split("\n")
-
-    # Separate each value in each row by a comma
-    passenger_data = [",".join(row.split()) for row in passenger_data]
-
-    # Declare flight list
-    flights = []
-
-    for row in passenger_data:
-        # Converts this row in the data to a list of variables as strings
-        elements = row.split(",")
-        # Move Passenger ID from beginning of list to last place in list
-        elements = elements[-5:] + elements[:-5]
-        # Merge flight id with airport code
-        flight_data = [elements[1] + "_" + elements[0]]
-        # Appends elements from row position 2 to flight_data
-        flight_data.extend(elements[2:])
-        # Convert transformed data to string as comma separated values
-        row = ",".join(flight_data)
-        # Initialise Flight object
-        flight = Flight(row)
-        # Print Mapper Output for this row
-        flights.append(flight)
-
-    if ret is None:
-        save_mapped_results(flights, file_name)
-        flights = pd.read_csv(file_name, header=None)
-        # # Sort mapped data by (flight id/airport) key
-        flights = sorter._sort(flights, file_name=file_name, hadoop_mode=hadoop_mode)
+    flights = map_flights(data, coordinates)
+
+    if procnum is not None:
+        return flights
+
+    save_mapped_results(flights, file_name)
+    # Sort mapped data by (airport/flight id) key
+    with instrument.stage("sort") as fields:
+        fields["records_in"] = len(flights)
+        return sorter._sort([flights])
+
+
+def map_flights(data, coordinates=None):
+    """Map passenger data to one Flight per flight key
+    Args:
+        data (pd.Dataframe): passenger data with headers
+        coordinates (pd.DataFrame): airport coordinate table to join
+            flight distances from
+    Returns:
+        list: mapped flights
+    """
+    mapped = map_frame(data)
+    passengers = mapped.pop("passengers")
+    flight_class = EncodedFlight if encoding.is_encoded(data) else Flight
+
+    # Broadcast join of the airport coordinates, one distance per flight key
+    if coordinates is not None:
+        distances = mileage.join_distances(mapped["from_airport"], mapped["to_airport"], coordinates)
     else:
-        ret[procnum] = flights
+        distances = np.full(len(mapped), np.nan)
+
+    # NOTE: Flight objects are only built once rows are grouped by flight key
+    return [
+        flight_class.from_fields(
+            flight_id, from_airport, to_airport, int(depart_time), int(flight_duration), group.tolist(), distance
+        )
+        for (flight_id, from_airport, to_airport, depart_time, flight_duration), group, distance in zip(
+            mapped.itertuples(index=False, name=None), passengers, distances.tolist()
+        )
+    ]
 
 
-def multithread_map(partitions, map_results):
+def map_frame(data):
+    """Vectorized map of passenger data to one row per flight key
+    Args:
+        data (pd.Dataframe): passenger data with headers
+    Returns:
+        pd.DataFrame: flight columns of the first row of each flight key,
+            with a passengers column of each flight key's passenger ids
+    """
+    # Group rows by key with a stable sort of the factorized keys
+    codes, _ = pd.factorize(flight_keys(data))
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+
+    mapped = data.iloc[order[np.r_[0, bounds]]] if len(data) else data.iloc[:0]
+    mapped = mapped[["flight_id", "from_airport", "to_airport", "departure_time", "flight_duration"]]
+    mapped = mapped.reset_index(drop=True)
+    mapped["passengers"] = np.split(data["passenger_id"].to_numpy()[order], bounds) if len(data) else []
+    return mapped
+
+
+def flight_keys(data):
+    """Vectorized flight key of every passenger data row
+    Args:
+        data (pd.Dataframe): passenger data with headers
+    Returns:
+        np.ndarray or pd.Series: integer keys if dictionary encoded,
+            otherwise from_airport/flight_id string keys
+    """
+    if encoding.is_encoded(data):
+        # Pack airport and flight id codes into one integer key
+        return data["from_airport"].to_numpy(np.int64) << 32 | data["flight_id"].to_numpy(np.int64)
+    # Build every from_airport/flight_id key with vectorized string ops
+    return data["from_airport"].astype(str) + "_" + data["flight_id"].astype(str)
+
+
+def map_line(line):
+    """Map a passenger data row to a tab separated flight key/value line
+    Args:
+        line (str): passenger_id,flight_id,from_airport,to_airport,
+            departure_time,flight_duration
+    Returns:
+        str: flight key and flight value separated by a tab
+    """
+    passenger_id, flight_id, from_airport, to_airport, departure_time, flight_duration = (
+        line.strip().split(",")
+    )
+    return f"{from_airport}_{flight_id}\t{to_airport},{departure_time},{flight_duration},{passenger_id}"
+
+
+def get_partition(key, partitions):
+    """Hash partitioner assigning a flight key to a reducer
+    NOTE: zlib.crc32 is used over hash() as str hashes are salted per process
+    Args:
+        key (str or int): flight key, an integer if dictionary encoded
+        partitions (int): number of reducers
+    Returns:
+        int: index of the reducer that owns this key
+    """
+    if isinstance(key, int):
+        # Flight id codes are dense, so the low bits spread keys evenly
+        return key % partitions
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+def shuffle_map(data, procnum, partitioner, coordinates=None):
+    """Map a partition and route each flight to its reducer's bucket
+    Args:
+        data (pd.Dataframe): passenger data with headers
+        procnum (int): thread/process number representing the index of the partition
+        partitioner (partitioning.SkewPartitioner): routes flights to reducers,
+            splitting hot flight keys over several
+        coordinates (pd.DataFrame): airport coordinate table to join
+            flight distances from
+    Returns:
+        list: list of mapped flights for each reducer
+    """
+    buckets = [[] for _ in range(partitioner.partitions)]
+    for flight in _map(data, procnum, coordinates=coordinates):
+        for partition, routed in partitioner.route(flight):
+            buckets[partition].append(routed)
+    return buckets
+
+
+def multithread_map(partitions, executor, partitioner, coordinates=None):
     """Multithreaded map function
     Args:
         partitions (list): list of partitions
-        map_results (list): list of lists to assign mapped results to
+        executor (Executor): worker pool to run the mapper on
+        partitioner (partitioning.SkewPartitioner): routes flights to reducers
+        coordinates (pd.DataFrame): airport coordinate table broadcast to
+            every mapper to join flight distances from
+    Returns:
+        list: partition buffers of mapped flights, one list of reducer
+            buckets per mapper
     """
-    jobs = []
-
-    for i, partition in enumerate(partitions):
-        p = multiprocessing.Process(target=_map, args=(partition,
-                                                        map_results, i))
-        jobs.append(p)
-        p.start()
+    map_results = executor.run(
+        functools.partial(shuffle_map, partitioner=partitioner, coordinates=coordinates),
+        partitions,
+        shuffle=True,
+    )
 
-    for p in jobs:
-        p.join()
-    for p in jobs:
-        p.terminate()
+    # Each mapper's buckets as one list of lists of flights
+    save_mapped_results(
+        [bucket for buckets in buffers.load(map_results, unlink=False) for bucket in buckets],
+        multithreaded=True,
+    )
 
-    save_mapped_results(map_results, multithreaded=True)
+    return map_results
 
 
 def save_mapped_results(flight_data, file_name="mapreduce_output/mapped_data.csv", multithreaded=False):
@@ -111,10 +212,10 @@ def save_mapped_results(flight_data, file_name="mapreduce_output/mapped_data.csv
 
 def main():
     """Main function"""
-    # Read system input of file to dataframe
-    data = pd.DataFrame(data=sys.stdin.read().splitlines())
-    # Execute mapper
-    _map(data, hadoop_mode=True)
+    # Map system input a line at a time, writing each mapped line as we go
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(map_line(line) + "\n")
 
 
 if __name__ == "__main__":
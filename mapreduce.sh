@@ -9,6 +9,7 @@ echo "Using Hadoop Streaming file at: $1"
 hadoop jar $1 \
 -input AComp_Passenger_data_no_error.csv \
 -mapper "mapper.py" \
+-combiner "combiner.py" \
 -reducer "reducer.py" \
 -output reduced
 
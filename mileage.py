@@ -0,0 +1,185 @@
+"""Great-circle flight distances and passenger mileage (Task 3)
+
+The airport coordinate table is small, so it's broadcast to every mapper,
+which joins it onto its flights and computes their distances with a
+vectorized haversine. Distances are then carried with each flight through
+sort and reduce, and passenger mileage is a weighted count over the
+reduced flights' passengers.
+"""
+import numpy as np
+import pandas as pd
+
+# Mean Earth radius in statute miles
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine(lat1, long1, lat2, long2):
+    """Great-circle distance between coordinates, element-wise
+
+    Args:
+        lat1 (np.ndarray): start latitudes in degrees
+        long1 (np.ndarray): start longitudes in degrees
+        lat2 (np.ndarray): end latitudes in degrees
+        long2 (np.ndarray): end longitudes in degrees
+    Returns:
+        np.ndarray: distances in miles
+    """
+    lat1, long1, lat2, long2 = (
+        np.radians(np.asarray(angles, dtype=np.float64)) for angles in (lat1, long1, lat2, long2)
+    )
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def coordinate_table(airports, dictionary=None):
+    """Airport coordinate table to broadcast to the mappers
+
+    Args:
+        airports (dict): airport codes to [airport, lat, long]
+        dictionary (encoding.Dictionary): airport dictionary, to index the
+            table by airport code integers rather than airport codes
+    Returns:
+        pd.DataFrame: lat and long columns indexed by airport
+    """
+    codes = list(airports)
+    return pd.DataFrame(
+        {
+            "lat": [airports[code][1] for code in codes],
+            "long": [airports[code][2] for code in codes],
+        },
+        index=codes if dictionary is None else dictionary.encode(codes),
+    )
+
+
+def join_distances(from_airports, to_airports, coordinates):
+    """Join airport coordinates onto flights and compute their distances
+
+    Args:
+        from_airports (iterable): airport each flight departs from
+        to_airports (iterable): airport each flight arrives at
+        coordinates (pd.DataFrame): coordinate table from coordinate_table
+    Returns:
+        np.ndarray: distance of each flight in miles, NaN where an airport
+            has no coordinates
+    """
+    start = coordinates.reindex(from_airports)
+    end = coordinates.reindex(to_airports)
+    return haversine(start["lat"], start["long"], end["lat"], end["long"])
+
+
+def passenger_miles(passenger_ids, sizes, distances, passengers):
+    """Total distance flown by each passenger
+
+    Args:
+        passenger_ids (np.ndarray): index into passengers of each flight's
+            passengers, flight after flight
+        sizes (np.ndarray): number of passengers on each flight
+        distances (np.ndarray): distance of each flight in miles
+        passengers (list): passenger of each index
+    Returns:
+        dict: passengers to miles flown
+    """
+    # NOTE: Flights between airports without coordinates add no miles
+    weights = np.repeat(np.nan_to_num(distances), sizes)
+    miles = np.bincount(passenger_ids, weights, minlength=len(passengers))
+    return dict(zip(passengers, miles.tolist()))
+
+
+def distance_frame(keys, from_airports, to_airports, distances):
+    """Per-flight distance table
+
+    Args:
+        keys (iterable): flight keys
+        from_airports (iterable): airport each flight departs from
+        to_airports (iterable): airport each flight arrives at
+        distances (np.ndarray): distance of each flight in miles
+    Returns:
+        pd.DataFrame: flight distances
+    """
+    return pd.DataFrame({
+        "flight": keys,
+        "from_airport": from_airports,
+        "to_airport": to_airports,
+        "miles": np.round(distances, 1),
+    })
+
+
+def aggregate(reduced_data, coordinates):
+    """Flight distances and passenger mileage of reduced csv data
+
+    Args:
+        reduced_data (list): reduced data rows, flight string at index 0
+        coordinates (pd.DataFrame): coordinate table indexed by airport code
+    Returns:
+        pd.DataFrame: flight distances
+        dict: passengers to miles flown
+    """
+    keys, to_airports, sizes, passengers = [], [], [], []
+    for row in reduced_data:
+        elements = row[0].split(",")
+        keys.append(elements[0])
+        to_airports.append(elements[1])
+        sizes.append(len(elements) - 4)
+        passengers.extend(elements[4:])
+
+    # Flight key is prefixed with the from airport
+    from_airports = [key.split("_", 1)[0] for key in keys]
+    distances = join_distances(from_airports, to_airports, coordinates)
+    passenger_ids, names = pd.factorize(pd.Series(passengers, dtype=object))
+    return (
+        distance_frame(keys, from_airports, to_airports, distances),
+        passenger_miles(passenger_ids, sizes, distances, names.tolist()),
+    )
+
+
+def aggregate_columnar(columns, coordinates):
+    """Flight distances and passenger mileage of columnar reduced data
+
+    Args:
+        columns (dict): column arrays loaded by columnar.load
+        coordinates (pd.DataFrame): coordinate table indexed by airport code
+    Returns:
+        pd.DataFrame: flight distances
+        dict: passengers to miles flown
+    """
+    from_airports = np.char.decode(columns["from_airport"], "ascii")
+    to_airports = np.char.decode(columns["to_airport"], "ascii")
+    keys = np.char.add(np.char.add(from_airports, "_"), np.char.decode(columns["flight_id"], "ascii"))
+    distances = join_distances(from_airports, to_airports, coordinates)
+    return (
+        distance_frame(keys, from_airports, to_airports, distances),
+        passenger_miles(
+            columns["passenger_ids"],
+            np.diff(columns["passenger_offsets"]),
+            distances,
+            np.char.decode(columns["passengers"], "ascii").tolist(),
+        ),
+    )
+
+
+def aggregate_encoded(flights, dictionaries):
+    """Flight distances and passenger mileage of dictionary encoded flights
+
+    Distances were joined onto the flights by the mappers.
+
+    Args:
+        flights (list): reduced EncodedFlight objects
+        dictionaries (dict): airport, flight and passenger dictionaries
+    Returns:
+        pd.DataFrame: flight distances
+        dict: passengers to miles flown
+    """
+    airports = dictionaries["airport"].values
+    flight_ids = dictionaries["flight"].values
+    from_airports = [airports[flight.from_airport] for flight in flights]
+    keys = [from_airport + "_" + flight_ids[flight.flight_id] for from_airport, flight in zip(from_airports, flights)]
+    to_airports = [airports[flight.to_airport] for flight in flights]
+    distances = np.fromiter((flight.distance for flight in flights), np.float64, len(flights))
+    sizes = np.fromiter((len(flight.passengers) for flight in flights), np.int64, len(flights))
+    passenger_ids = np.fromiter(
+        (passenger for flight in flights for passenger in flight.passengers), np.int64, sizes.sum()
+    )
+    return (
+        distance_frame(keys, from_airports, to_airports, distances),
+        passenger_miles(passenger_ids, sizes, distances, dictionaries["passenger"].values),
+    )
@@ -0,0 +1,137 @@
+"""Skew-aware partitioning of the parallel MapReduce pipeline
+
+The driver maps a sample of the passenger data to estimate the shuffled
+bytes of every flight key. The number of input partitions and reducers is
+sized from the estimated bytes rather than the number of workers, and hot
+flight keys, whose manifests alone would dominate a reducer, are split
+over several reducers. Each reducer then reduces its share of a hot key
+and the driver merges the partial flights after the reduce.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+import encoding
+import flight
+import mapper
+
+# Target bytes of each input partition and reducer
+PARTITION_BYTES = 64 * 1024 ** 2
+# Passenger data rows sampled to estimate flight key bytes
+SAMPLE_ROWS = 100000
+# Fraction of a reducer's bytes a single flight key may take before it's split
+HOT_KEY_SHARE = 0.5
+
+
+class SkewPartitioner:
+    """Routes flights to reducers, splitting hot flight keys
+
+    Cold flight keys are hashed to one reducer. A hot key split n ways is
+    sent to its hashed reducer and the n - 1 reducers after it, each
+    mapper splitting its passengers of the key into n parts by hash.
+
+    Attributes:
+        partitions (int): number of reducers
+        hot_keys (dict): hot flight keys to number of reducers they're split over
+    """
+
+    def __init__(self, partitions, hot_keys=None):
+        """Initialise partitioner
+
+        Args:
+            partitions (int): number of reducers
+            hot_keys (dict): hot flight keys to number of reducers they're
+                split over, no keys are split if None
+        """
+        self.partitions = partitions
+        self.hot_keys = hot_keys or {}
+
+    def route(self, mapped_flight):
+        """Reducer(s) a mapped flight is sent to
+
+        Args:
+            mapped_flight (Flight): a mapper's flight of one flight key
+        Returns:
+            list: (reducer, flight) pairs, a flight per part of a hot key
+        """
+        key = mapped_flight.get_flight_key()
+        partition = mapper.get_partition(key, self.partitions)
+        splits = self.hot_keys.get(key)
+        if not splits:
+            return [(partition, mapped_flight)]
+
+        # NOTE: Passengers are split by hash, so every mapper sends a
+        #   passenger listed twice to the same reducer, which de-duplicates it
+        parts = [[] for _ in range(splits)]
+        for passenger in mapped_flight.passengers:
+            parts[mapper.get_partition(passenger, splits)].append(passenger)
+        return [
+            (
+                (partition + split) % self.partitions,
+                type(mapped_flight).from_fields(
+                    mapped_flight.flight_id,
+                    mapped_flight.from_airport,
+                    mapped_flight.to_airport,
+                    mapped_flight.depart_time,
+                    mapped_flight.total_flight_time,
+                    passengers,
+                    mapped_flight.distance,
+                ),
+            )
+            for split, passengers in enumerate(parts)
+            if passengers
+        ]
+
+
+def estimate_key_bytes(data, sample_rows=SAMPLE_ROWS, seed=0):
+    """Estimate the shuffled bytes of every flight key from a row sample
+
+    Args:
+        data (pd.DataFrame): passenger data, may be dictionary encoded
+        sample_rows (int): number of rows to sample, every row if fewer
+        seed (int): random seed of the sample
+    Returns:
+        pd.Series: flight keys to estimated bytes
+    """
+    sample = data.sample(sample_rows, random_state=seed) if len(data) > sample_rows else data
+    if sample.empty:
+        return pd.Series(dtype=np.float64)
+
+    # Serialize the sample's mapped flights to measure bytes per row
+    flights = mapper.map_flights(sample)
+    data_bytes = flight.serialize_encoded(flights) if encoding.is_encoded(sample) else flight.serialize(flights)
+    row_bytes = len(data_bytes) / len(sample)
+
+    counts = pd.Series(mapper.flight_keys(sample)).value_counts()
+    return counts * (len(data) / len(sample) * row_bytes)
+
+
+def plan(data, workers, partition_bytes=PARTITION_BYTES, sample_rows=SAMPLE_ROWS, seed=0):
+    """Size input partitions and reducers by estimated bytes
+
+    Args:
+        data (pd.DataFrame): passenger data, may be dictionary encoded
+        workers (int): number of worker processes, the fewest partitions
+        partition_bytes (int): target bytes of each input partition and
+            reducer
+        sample_rows (int): number of rows sampled to estimate key bytes
+        seed (int): random seed of the sample
+    Returns:
+        list: input partitions of passenger data
+        SkewPartitioner: partitioner of the mapped flights
+    """
+    input_bytes = int(data.memory_usage(index=False).sum())
+    chunks = max(workers, math.ceil(input_bytes / partition_bytes))
+    partitions = [data.iloc[rows] for rows in np.array_split(np.arange(len(data)), chunks)]
+
+    key_bytes = estimate_key_bytes(data, sample_rows, seed)
+    reducers = max(workers, math.ceil(key_bytes.sum() / partition_bytes))
+    # Split keys taking more than their share of a reducer over enough
+    #   reducers to bring each part under it
+    hot_keys = {}
+    if len(key_bytes):
+        limit = key_bytes.sum() / reducers * HOT_KEY_SHARE
+        splits = np.minimum(np.ceil(key_bytes / limit), reducers).astype(np.int64)
+        hot_keys = {key: split for key, split in zip(splits.index.tolist(), splits.tolist()) if split > 1}
+    return partitions, SkewPartitioner(reducers, hot_keys)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Passenger to flights inverted index
+
+The index is stored like the columnar format, as a directory of NumPy
+.npy arrays that can be memory mapped. Passengers are sorted, and the
+flights of the passenger at index i are flight_ids[flight_offsets[i]:
+flight_offsets[i + 1]], each an index into the sorted flight keys. Each
+reducer indexes its own flights, as (passenger, flight key) pairs sorted
+by passenger, and the partial indexes are merged by scattering every
+partial's pairs into place after the partials before it.
+An index built from a reduced csv file records the file's stat like the
+columnar format, so it's rebuilt once the file changes.
+
+Usage:
+    python passenger_index.py <reduced csv file> <index directory>
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import heavy_hitters
+
+COLUMNS = [
+    "passengers",
+    "flight_offsets",
+    "flight_ids",
+    "flights",
+]
+
+
+def build_partition(passengers, flight_keys):
+    """Partial index of one partition's (passenger, flight key) pairs
+
+    Args:
+        passengers (np.ndarray): integer passenger code of each pair
+        flight_keys (np.ndarray): integer flight key of each pair
+    Returns:
+        np.ndarray: distinct passenger codes, ascending
+        np.ndarray: number of flights of each distinct passenger
+        np.ndarray: flight keys of the pairs, grouped by passenger
+    """
+    order = np.argsort(passengers, kind="stable")
+    codes, counts = np.unique(passengers[order], return_counts=True)
+    return codes, counts, flight_keys[order]
+
+
+def index_flights(flights):
+    """Partial index of reduced dictionary encoded flights
+
+    Args:
+        flights (list): reduced EncodedFlight objects
+    Returns:
+        tuple: partial index, see build_partition
+    """
+    sizes = np.fromiter((len(flight.passengers) for flight in flights), np.int64, len(flights))
+    keys = np.fromiter((flight.get_flight_key() for flight in flights), np.int64, len(flights))
+    passengers = np.fromiter(
+        (passenger for flight in flights for passenger in flight.passengers), np.int64, sizes.sum()
+    )
+    return build_partition(passengers, np.repeat(keys, sizes))
+
+
+def merge(partials, passenger_count):
+    """Merge partial indexes into CSR offsets and flight keys
+
+    Args:
+        partials (list): partial indexes from build_partition
+        passenger_count (int): number of passenger codes
+    Returns:
+        np.ndarray: offsets of each passenger's flights, passenger_count + 1 long
+        np.ndarray: flight keys grouped by passenger
+    """
+    counts = np.zeros(passenger_count, dtype=np.int64)
+    for codes, code_counts, _ in partials:
+        counts[codes] += code_counts
+    offsets = np.zeros(passenger_count + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    # NOTE: Each partial's pairs go after the earlier partials' pairs of
+    #   the same passenger, so the merge is one scatter per partial
+    keys = np.empty(offsets[-1], dtype=np.int64)
+    cursor = offsets[:-1].copy()
+    for codes, code_counts, partial_keys in partials:
+        starts = np.repeat(np.cumsum(code_counts) - code_counts, code_counts)
+        owners = np.repeat(codes, code_counts)
+        keys[cursor[owners] + np.arange(len(partial_keys)) - starts] = partial_keys
+        cursor[codes] += code_counts
+    return offsets, keys
+
+
+def save(offsets, keys, passengers, flight_names, directory):
+    """Save a merged index
+
+    Args:
+        offsets (np.ndarray): offsets of each passenger's flights
+        keys (np.ndarray): integer flight keys grouped by passenger
+        passengers (list): passenger id of each passenger code, sorted
+        flight_names (callable): flight key strings of integer flight keys
+        directory (str): directory to write index arrays to
+    """
+    flights, flight_ids = np.unique(keys, return_inverse=True)
+    columns = {
+        "passengers": np.array(passengers, dtype="S"),
+        "flight_offsets": offsets,
+        "flight_ids": flight_ids.astype(np.int32),
+        "flights": np.array(flight_names(flights), dtype="S"),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(directory, name + ".npy"), column)
+
+
+def save_encoded(offsets, keys, dictionaries, directory):
+    """Save a merged index of dictionary encoded flights, decoding its ids
+
+    Args:
+        offsets (np.ndarray): offsets of each passenger code's flights
+        keys (np.ndarray): packed integer flight keys grouped by passenger
+        dictionaries (dict): airport, flight and passenger dictionaries
+        directory (str): directory to write index arrays to
+    """
+    airports = np.array(dictionaries["airport"].values, dtype=object)
+    flight_ids = np.array(dictionaries["flight"].values, dtype=object)
+    save(
+        offsets,
+        keys,
+        dictionaries["passenger"].values,
+        lambda flights: (airports[flights >> 32] + "_" + flight_ids[flights & 0xFFFFFFFF]).tolist(),
+        directory,
+    )
+
+
+def save_reduced(flights, directory):
+    """Index reduced flights with string ids, such as a reduced csv file's
+
+    Args:
+        flights (iterable): reduced Flight objects
+        directory (str): directory to write index arrays to
+    """
+    keys, passengers = [], []
+    for flight in flights:
+        key = flight.get_flight_key()
+        for passenger in flight.passengers:
+            keys.append(key)
+            passengers.append(passenger)
+
+    # Dictionary encode passengers and flight keys, both sorted
+    passenger_codes, passenger_names = pd.factorize(pd.Series(passengers, dtype=object), sort=True)
+    key_codes, key_names = pd.factorize(pd.Series(keys, dtype=object), sort=True)
+    offsets, flight_keys = merge([build_partition(passenger_codes, key_codes)], len(passenger_names))
+    save(offsets, flight_keys, passenger_names.tolist(), lambda codes: key_names[codes].tolist(), directory)
+
+
+class PassengerIndex:
+    """Memory mapped passenger to flights index
+
+    Attributes:
+        passengers (np.ndarray): sorted passenger ids
+        flight_offsets (np.ndarray): offsets of each passenger's flights
+        flight_ids (np.ndarray): index into flights of each passenger's flights
+        flights (np.ndarray): sorted flight keys
+    """
+
+    def __init__(self, directory):
+        """Memory map an index
+
+        Args:
+            directory (str): directory of index arrays
+        """
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+
+    def __len__(self):
+        """Returns:
+            int: number of passengers
+        """
+        return len(self.passengers)
+
+    def code(self, passenger):
+        """Index of a passenger id
+
+        Args:
+            passenger (str): passenger id
+        Returns:
+            int: passenger index, None if not indexed
+        """
+        name = passenger.encode("ascii")
+        code = int(np.searchsorted(self.passengers, name))
+        return code if code < len(self.passengers) and self.passengers[code] == name else None
+
+    def itinerary(self, passenger):
+        """Flights taken by a passenger, read from the passenger's slice
+
+        Args:
+            passenger (str): passenger id
+        Returns:
+            list: flight keys, in key order
+        """
+        code = self.code(passenger)
+        if code is None:
+            return []
+        ids = np.sort(self.flight_ids[self.flight_offsets[code]:self.flight_offsets[code + 1]])
+        return np.char.decode(self.flights[ids], "ascii").tolist()
+
+    def flight_counts(self):
+        """Number of flights of every passenger
+
+        Returns:
+            np.ndarray: flights of each passenger, by passenger index
+        """
+        return np.diff(self.flight_offsets)
+
+    def top(self, k):
+        """Passengers with the most flights, from the offsets alone
+
+        Args:
+            k (int): number of passengers
+        Returns:
+            list: (passenger, flights) pairs, highest count first, with
+                every passenger tied with the k-th
+        """
+        counts = self.flight_counts()
+        if not len(counts):
+            return []
+        threshold = np.partition(counts, -min(k, len(counts)))[-min(k, len(counts))]
+        candidates = np.flatnonzero(counts >= threshold)
+        names = np.char.decode(self.passengers[candidates], "ascii").tolist()
+        return heavy_hitters.top_k(dict(zip(names, counts[candidates].tolist())), k)
+
+
+def main():
+    """Index a reduced csv file"""
+    save_reduced(columnar.read_reduced(sys.argv[1]), sys.argv[2])
+    columnar.stamp(sys.argv[2], sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,236 @@
 #!/usr/bin/env python3
 """ Reduce sorted mapped data """
-import multiprocessing
+import functools
+import itertools
 import sys
 
+import numpy as np
 import pandas as pd
 
+import buffers
+import instrument
+import mapper
+import passenger_index
+import sorter
 from flight import Flight
 
 
-def _reduce(flights, ret=None, procnum=-1, file_name="mapreduce_output/reduced_data.csv", hadoop_mode=False):
+def read_flights(lines):
+    """Parse tab separated key/value lines to flights, a line at a time
+
+    Args:
+        lines (iterable): mapped key/value lines
+    Yields:
+        Flight: flight of each line
+    """
+    for line in lines:
+        if line.strip():
+            yield Flight(line.replace("\t", ",", 1))
+
+
+def stream_reduce(flights):
+    """Merge consecutive flights sharing a flight key
+
+    Only the flight currently being merged is held in memory, each
+    reduced flight is yielded as soon as its key group ends.
+
+    Args:
+        flights (iterable): flights sorted by flight key
+    Yields:
+        Flight: reduced flight for each flight key
+    """
+    for _, group in itertools.groupby(flights, key=lambda flight: flight.get_flight_key()):
+        flight = next(group)
+        for duplicate in group:
+            flight.merge(duplicate)
+        yield flight
+
+
+def _reduce(flights, procnum=-1, file_name="mapreduce_output/reduced_data.csv"):
     """Condense flight_id
 
     Args:
-        sorted_data (pd.DataFrame): mapped data
+        flights (list): sorted mapped flights
+        procnum (int): thread/process number representing the index of the partition
+    Returns:
+        list: reduced flights
     """
     if procnum == -1:
         print("[*]\tSingle Thread Reducer")
     else:
         print("[*]\tReduce\tThread " + str(procnum))
 
-    last_flight = None
-    last_flight_key = None
-    reduced_data = []
-
     # NOTE: Reduce logic relies on flight data being alphabetically sorted
     #  Otherwise the partitions aren't actually being reduced
-    for flight in flights:
-        # NOTE: Check if last flight checked is the same as current flight
-        # If last flight is same as current flight
-        if last_flight_key != flight.get_flight_key():
-            if last_flight is not None:
-                # Append last checked flight populated with passengers to reduced data
-                reduced_data.append(last_flight)
-            # Set new flight key
-            last_flight = flight
-            # Ensure the last flight key is set to current flight
-            last_flight_key = flight.get_flight_key()
-        else:
-            # If last flight is current flight add passenger to last flight's passenger_list
-            for passenger in flight.passenger_list:
-                last_flight.add_passenger(passenger)
-
-    # Add final flight to reduced_data
-    if last_flight_key == flight.get_flight_key():
-        reduced_data.append(last_flight)
-
-    # If we're executing reduce on a single thread
-    if ret is None:
-        # Write reduced data to file
-        with open(file_name, "w", encoding="utf-8") as file:
-            for flight in reduced_data:
-                file.write(str(flight)+"\n")
-        # Check if file being executed via hadoop
-        if hadoop_mode:
-            # Write reduced data to stdout
-            print(*reduced_data, sep="\n")
-    else:
-        # Assign reduced data 
-        ret[procnum] = reduced_data
+    reduced_data = list(stream_reduce(flights))
+
+    # If we're executing reduce on multiple threads
+    if procnum != -1:
+        # Return reduced data to the executor
+        return reduced_data
+
+    # Write reduced data to file
+    with open(file_name, "w", encoding="utf-8") as file:
+        for flight in reduced_data:
+            file.write(str(flight)+"\n")
 
+    return reduced_data
 
-def multithread_reduce(mapped_data, ret):
+
+def shuffle_reduce(partitions, procnum):
+    """Sort and reduce one reducer's bucket from every mapper
+
+    Args:
+        partitions (list): this reducer's list of mapped flights from each mapper
+        procnum (int): thread/process number representing the reducer
+    Returns:
+        list: reduced flights
+    """
+    flights = [flight for partition in partitions for flight in partition]
+    # NOTE: A reducer may not have been assigned any flight keys
+    if not flights:
+        return []
+    return _reduce(sorter._sort(flights, procnum), procnum)
+
+
+def multithread_reduce(map_results, executor):
     """ Multithreaded Reduce
+    NOTE: Each reducer owns every flight key hashed to it, so only the flight
+    keys split over several reducers need merging after, see merge_split_keys
     Args:
-        mapped_data (list): list of mapped/semi-reduced data
-        ret (list): list of reduce results
+        map_results (list): partition buffers of each mapper's reducer buckets
+        executor (Executor): worker pool to run the reducer on
+    Returns:
+        list: partition buffers of reduced flights
     """
-    jobs = []
+    # Gather each reducer's bucket from every mapper
+    shuffled = [list(buckets) for buckets in zip(*map_results)]
+    return executor.run(shuffle_reduce, shuffled)
 
-    for i, partition in enumerate(mapped_data):
-        p = multiprocessing.Process(target=_reduce, args=(partition, ret, i))
-        jobs.append(p)
-        p.start()
 
-    for p in jobs:
-        p.join()
+def merge_split_keys(reduce_results, hot_keys, data=None):
+    """Merge the partial reductions of flight keys split over reducers
 
-    for p in jobs:
-        p.terminate()
+    Args:
+        reduce_results (list): reduced flights of each reducer
+        hot_keys (dict): flight keys split over several reducers
+        data (pd.DataFrame): mapped passenger data, to put each merged
+            flight's passengers back in input order, skipped if None
+    Returns:
+        list: reduced flights of each reducer, each split key merged into
+            its first partial flight
+    """
+    if not hot_keys:
+        return reduce_results
+
+    merged = {}
+    results = []
+    for flights in reduce_results:
+        kept = []
+        for flight in flights:
+            key = flight.get_flight_key()
+            if key not in hot_keys:
+                kept.append(flight)
+            elif key in merged:
+                merged[key].merge(flight)
+            else:
+                merged[key] = flight
+                kept.append(flight)
+        results.append(kept)
+
+    # NOTE: Partials hold the passengers of each hash split, so merging
+    #   them orders passengers by reducer rather than as they were read
+    if data is not None and merged:
+        keys = np.asarray(mapper.flight_keys(data))
+        rows = np.isin(keys, list(merged))
+        for key, passengers in pd.Series(data["passenger_id"].to_numpy()[rows]).groupby(keys[rows], sort=False):
+            flight = merged[key]
+            flight.passengers = dict.fromkeys(
+                passenger for passenger in pd.unique(passengers.to_numpy()).tolist() if passenger in flight.passengers
+            )
+    return results
+
+
+def summarize(partition, procnum, summary):
+    """Count a reducer's passengers into a passenger summary
+
+    Args:
+        partition (PartitionBuffer): reduced flights, left in shared memory
+        procnum (int): thread/process number representing the reducer
+        summary: empty mergeable summary, such as heavy_hitters.HeavyHitters
+    Returns:
+        summary of the reducer's passengers
+    """
+    with instrument.stage("summarize", procnum) as fields:
+        flights = buffers.load(partition, unlink=False)
+        passengers = list(itertools.chain.from_iterable(flight.passengers for flight in flights))
+        fields["records_in"] = len(passengers)
+        summary.update(np.array(passengers))
+    return summary
+
+
+def multithread_summarize(reduce_results, executor, summary):
+    """Summarize every reducer's passengers in parallel and merge them
+
+    Args:
+        reduce_results (list): partition buffers of reduced flights
+        executor (Executor): worker pool to summarize on
+        summary: empty mergeable summary, merged into and returned
+    Returns:
+        summary of every reducer's passengers
+    """
+    # NOTE: Each worker is sent its own copy of the empty summary
+    for reducer_summary in executor.map(functools.partial(summarize, summary=summary), reduce_results):
+        summary.merge(reducer_summary)
+    return summary
+
+
+def index_passengers(partition, procnum):
+    """Index a reducer's passengers to their flights
+
+    Args:
+        partition (PartitionBuffer): reduced encoded flights, left in shared memory
+        procnum (int): thread/process number representing the reducer
+    Returns:
+        tuple: partial passenger index, see passenger_index.build_partition
+    """
+    with instrument.stage("index", procnum) as fields:
+        flights = buffers.load(partition, unlink=False)
+        fields["records_in"] = len(flights)
+        return passenger_index.index_flights(flights)
+
+
+def multithread_index(reduce_results, executor, passenger_count):
+    """Index every reducer's passengers in parallel and merge the indexes
+
+    Args:
+        reduce_results (list): partition buffers of reduced encoded flights
+        executor (Executor): worker pool to index on
+        passenger_count (int): number of passenger codes
+    Returns:
+        np.ndarray: offsets of each passenger's flights
+        np.ndarray: flight keys grouped by passenger
+    """
+    return passenger_index.merge(executor.map(index_passengers, reduce_results), passenger_count)
+
+
+def save_reduced_results(reduce_results, file_name="mapreduce_output/reduced_data.csv"):
+    """Save reduced results to file
+    Args:
+        reduce_results (list): list of lists of reduced flights
+        file_name (str): file name to save reduced data to
+    """
+    with open(file_name, "w", encoding="utf-8") as file:
+        for flights in reduce_results:
+            for flight in flights:
+                file.write(str(flight) + "\n")
 
 
 def main():
     """Main function"""
-    # Read system input of file to dataframe
-    data = pd.DataFrame(data=sys.stdin.read().splitlines())
-    # Execute mapper
-    _reduce(data, hadoop_mode=True)
+    # Reduce sorted system input a key group at a time, writing each flight as we go
+    for flight in stream_reduce(read_flights(sys.stdin)):
+        sys.stdout.write(str(flight) + "\n")
 
 
 if __name__ == "__main__":
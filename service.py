@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""Resident query service over reduced flight data
+
+The reduced output is loaded once into in-memory indexes and queried over
+local HTTP, so a question doesn't rerun the whole job. The reduced file is
+polled and the indexes rebuilt, then swapped in, whenever a new reduced
+output is published.
+
+Every response is JSON:
+    GET /                                   loaded file and index sizes
+    GET /airports                           flights from every airport
+    GET /airports/<airport>                 flights from an airport
+    GET /passengers/top?n=<n>               top n passengers by flights
+    GET /passengers/<passenger>/flights     a passenger's flights
+    GET /routes/<from airport>/<to airport> flights between two airports
+    GET /airports/<airport>/departures?start=<t1>&end=<t2>
+                                            flights departing an airport
+                                            within an epoch time window
+    GET /airborne?at=<t>                    aircraft airborne at a time
+    GET /airborne?start=<t1>&end=<t2>       aircraft airborne over a window
+
+Usage:
+    python service.py
+"""
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from dotenv import load_dotenv
+
+import aggregator
+import columnar
+import main as mapreduce
+import time_index
+from main import get_airport_data, get_airports, init_settings
+
+
+class FlightIndex:
+    """Reduced flights indexed by airport, passenger and route
+
+    Attributes:
+        file_name (str): reduced csv file the index was loaded from
+        stat (tuple): modification time and size of the file when loaded
+        flights (dict): flight keys to reduced flights
+        airport_flights (dict): airports to number of flights from them
+        passenger_flights (dict): passengers to keys of their flights
+        routes (dict): (from airport, to airport) to flight keys
+        ranked (list): (passenger, flights) pairs, most flights first
+        departures (time_index.DepartureIndex): flights by departure time
+    """
+
+    def __init__(self, flights, airports, file_name=None, stat=None):
+        """Index reduced flights
+
+        Args:
+            flights (iterable): reduced flights
+            airports (list): list of airports
+            file_name (str): reduced csv file the flights were read from
+            stat (tuple): modification time and size of the file
+        """
+        self.file_name = file_name
+        self.stat = stat
+        self.flights = {}
+        self.airport_flights = dict.fromkeys(airports, 0)
+        self.passenger_flights = {}
+        self.routes = {}
+
+        for flight in flights:
+            key = flight.get_flight_key()
+            self.flights[key] = flight
+            if flight.from_airport in self.airport_flights:
+                self.airport_flights[flight.from_airport] += 1
+            self.routes.setdefault((flight.from_airport, flight.to_airport), []).append(key)
+            for passenger in flight.passengers:
+                self.passenger_flights.setdefault(passenger, []).append(key)
+
+        # NOTE: Ranked once per load, top-N queries are slices
+        counts = {passenger: len(keys) for passenger, keys in self.passenger_flights.items()}
+        ranked = aggregator.rank(counts, ["passenger", "flights"])
+        self.ranked = list(zip(ranked["passenger"].tolist(), ranked["flights"].tolist()))
+        self.departures = time_index.DepartureIndex.from_flights(self.flights.values())
+
+    @classmethod
+    def load(cls, file_name, airports):
+        """Load and index a reduced csv file
+
+        Args:
+            file_name (str): reduced csv file
+            airports (list): list of airports
+        Returns:
+            FlightIndex: index of the file's flights
+        """
+        stat = file_stat(file_name)
+        return cls(columnar.read_reduced(file_name), airports, file_name, stat)
+
+    def describe(self, flight_key):
+        """JSON-serializable details of a flight
+
+        Args:
+            flight_key (str): flight key
+        Returns:
+            dict: flight details
+        """
+        flight = self.flights[flight_key]
+        return {
+            "flight": flight_key,
+            "from_airport": flight.from_airport,
+            "to_airport": flight.to_airport,
+            "departure_time": flight.depart_time,
+            "flight_duration": flight.total_flight_time,
+            "passengers": len(flight.passengers),
+        }
+
+
+def file_stat(file_name):
+    """Modification time and size of a file
+
+    Args:
+        file_name (str): file to stat
+    Returns:
+        tuple: modification time in ns and size, None if missing
+    """
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def query(index, path, params):
+    """Answer a query from an index
+
+    Args:
+        index (FlightIndex): reduced flight index
+        path (str): request path
+        params (dict): query string parameters to lists of values
+    Returns:
+        int: HTTP status
+        JSON-serializable response body
+    """
+    for pattern, handler in ROUTES:
+        match = pattern.fullmatch(path.rstrip("/") or "/")
+        if match:
+            return handler(index, params, *match.groups())
+    return 404, {"error": f"unknown query {path}"}
+
+
+def get_status(index, params):
+    """Loaded file and index sizes"""
+    return 200, {
+        "file": index.file_name,
+        "flights": len(index.flights),
+        "passengers": len(index.passenger_flights),
+        "routes": len(index.routes),
+    }
+
+
+def get_airports_flights(index, params):
+    """Flights from every airport, most flights first"""
+    return 200, [
+        {"airport": airport, "flights": flights}
+        for airport, flights in sorted(index.airport_flights.items(), key=lambda item: (-item[1], item[0]))
+    ]
+
+
+def get_airport_flights(index, params, airport):
+    """Flights from an airport"""
+    if airport not in index.airport_flights:
+        return 404, {"error": f"unknown airport {airport}"}
+    return 200, {"airport": airport, "flights": index.airport_flights[airport]}
+
+
+def get_top_passengers(index, params):
+    """Top n passengers by flights, n defaults to 10"""
+    try:
+        n = int(params.get("n", ["10"])[0])
+    except ValueError:
+        n = -1
+    if n < 0:
+        return 400, {"error": "n must be a non-negative integer"}
+    return 200, [{"passenger": passenger, "flights": flights} for passenger, flights in index.ranked[:n]]
+
+
+def get_passenger_flights(index, params, passenger):
+    """A passenger's flights"""
+    if passenger not in index.passenger_flights:
+        return 404, {"error": f"unknown passenger {passenger}"}
+    return 200, [index.describe(key) for key in index.passenger_flights[passenger]]
+
+
+def get_route_flights(index, params, from_airport, to_airport):
+    """Flights between two airports"""
+    return 200, [index.describe(key) for key in index.routes.get((from_airport, to_airport), [])]
+
+
+def get_departures(index, params, airport):
+    """Flights departing an airport between start and end epoch times"""
+    try:
+        start, end = int(params["start"][0]), int(params["end"][0])
+    except (KeyError, ValueError):
+        return 400, {"error": "start and end must be epoch times"}
+    return 200, [
+        {"flight": key, "departure_time": departure}
+        for key, departure in index.departures.departing(airport, start, end)
+    ]
+
+
+def get_airborne(index, params):
+    """Aircraft airborne at a time, or at every change over a window"""
+    try:
+        if "at" in params:
+            return 200, {"at": int(params["at"][0]), "airborne": index.departures.airborne(int(params["at"][0]))}
+        times, airborne = index.departures.airborne_between(int(params["start"][0]), int(params["end"][0]))
+    except (KeyError, ValueError):
+        return 400, {"error": "at, or start and end, must be epoch times"}
+    return 200, {"times": times.tolist(), "airborne": airborne.tolist(), "peak": int(airborne.max())}
+
+
+# Query path patterns and their handlers, called with the path's groups
+ROUTES = [
+    (re.compile(r"/"), get_status),
+    (re.compile(r"/airports"), get_airports_flights),
+    (re.compile(r"/airports/([^/]+)"), get_airport_flights),
+    (re.compile(r"/airports/([^/]+)/departures"), get_departures),
+    (re.compile(r"/airborne"), get_airborne),
+    (re.compile(r"/passengers/top"), get_top_passengers),
+    (re.compile(r"/passengers/([^/]+)/flights"), get_passenger_flights),
+    (re.compile(r"/routes/([^/]+)/([^/]+)"), get_route_flights),
+]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """HTTP handler answering queries from the server's current index"""
+
+    def do_GET(self):
+        """Answer a GET query"""
+        url = urlsplit(self.path)
+        # NOTE: The index is swapped whole on reload, so read it once
+        status, body = query(self.server.index, url.path, parse_qs(url.query))
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Don't log every request"""
+
+
+class QueryServer(ThreadingHTTPServer):
+    """HTTP server holding the current flight index
+
+    Attributes:
+        index (FlightIndex): index queries are answered from
+        airports (list): list of airports
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, index, airports):
+        """Initialise server
+
+        Args:
+            address (tuple): host and port to listen on
+            index (FlightIndex): initial index
+            airports (list): list of airports
+        """
+        super().__init__(address, QueryHandler)
+        self.index = index
+        self.airports = airports
+
+    def watch(self, interval):
+        """Rebuild the index whenever the reduced file is republished
+
+        Args:
+            interval (float): seconds between polls of the reduced file
+        """
+        previous = self.index.stat
+        while True:
+            time.sleep(interval)
+            stat = file_stat(self.index.file_name)
+            # NOTE: Only reload once the file has stopped changing, so a
+            #   reduced output still being written isn't loaded
+            if stat is not None and stat != self.index.stat and stat == previous:
+                try:
+                    self.index = FlightIndex.load(self.index.file_name, self.airports)
+                    print(f"[*]\tReloaded {self.index.file_name}, {len(self.index.flights)} flights")
+                except (OSError, ValueError) as error:
+                    print(f"[*]\tKeeping previous index, reload failed: {error}")
+            previous = stat
+
+
+def main():
+    """Main function"""
+    init_settings()
+    load_dotenv()
+    # NOTE: Resolved by init_settings, Hadoop's output if USE_HADOOP_OUTPUT
+    reduced_file = mapreduce.REDUCED_DATA_DIR
+
+    airports = list(get_airports(get_airport_data()))
+    index = FlightIndex.load(reduced_file, airports)
+    host = os.getenv("SERVICE_HOST", "127.0.0.1")
+    port = int(os.getenv("SERVICE_PORT", "8000"))
+
+    with QueryServer((host, port), index, airports) as server:
+        threading.Thread(
+            target=server.watch, args=(float(os.getenv("SERVICE_RELOAD_INTERVAL", "1")),), daemon=True
+        ).start()
+        print(f"[*]\tServing {reduced_file} on http://{host}:{port}, {len(index.flights)} flights")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
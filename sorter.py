@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 """Sorter function for mapped data"""
+import heapq
+import os
 import sys
-import flight
-import multiprocessing
-import pandas as pd
-from pandas.api.types import CategoricalDtype
+import tempfile
 
-def _sort(data, ret=None, procnum=None, file_name="mapreduce_output/sorted_data.csv", hadoop_mode=False):
+# Default memory ceiling for in-memory sort runs, in bytes
+SORT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+
+def _sort(data, procnum=None, file_name="mapreduce_output/sorted_data.csv"):
     """Sort list of flight objects in alphabetical order
 
     Args:
         data (list): Mapped flight partition
+        procnum (int): thread/process number representing the index of the partition
+    Returns:
+        list: sorted flights
     """
     # If there's no processor number, it's a single threaded call
     if procnum is None:
@@ -22,38 +28,13 @@ def _sort(data, ret=None, procnum=None, file_name="mapreduce_output/sorted_data.
     if type(procnum) == int:
         print("[*]\tSorter\tThread " + str(procnum))
 
-    # get list of unique flight ids from flights in data
-    # Combine each list in reduce_results
-    data = [str(item) for item in data]
-    # Convert data to dataframe
-    data = pd.DataFrame(data)
-
-    flights = list({entry.split(',')[0] for entry in data[0].values})
-
-    # print("[*]\tSorter")
-    order = CategoricalDtype(
-        flights.sort(),
-        ordered=True
-    )
-
-    # Convert data key to categorical dtype
-    data[0] = data[0].astype(order)
-    # Sort mapped dataframe by key
-    data.sort_values(0, inplace=True, ascending=True)
+    # Stable sort of flights by (airport/flight id) key
+    # NOTE: Called per flight, dictionary encoded flights have integer keys
+    data = sorted(data, key=lambda item: item.get_flight_key())
 
-    # Convert sorted  to list
-    data = data[0].tolist()
-    # Convert list of flight strings to flight objects
-    data = [flight.Flight(row) for row in data]
-
-    if hadoop_mode:
-        # Write sorted dataframe to stdout
-        print(data.to_string(index=False, header=False))
-
-    if ret is not None:
-        # Write sorted flight data to list
-        ret[procnum] = data
-        return
+    if procnum is not None:
+        # Return sorted flight data to the executor
+        return data
 
     # Save list to file
     with open(file_name, 'w') as f:
@@ -63,32 +44,81 @@ def _sort(data, ret=None, procnum=None, file_name="mapreduce_output/sorted_data.
     return data
 
 
-def multithread_sort(partitions, ret):
-    """Multithreaded sort function
+def get_key(line):
+    """Flight key of a tab separated key/value line
+
     Args:
-        partitions (list): list of partitions
-        ret (list): list of lists to assign mapped results to
+        line (str): mapped line
+    Returns:
+        str: flight key
     """
-    jobs = []
+    return line.split("\t", 1)[0]
+
 
-    for i, partition in enumerate(partitions):
-        p = multiprocessing.Process(target=_sort, args=(partition,
-                                                        ret, i))
-        jobs.append(p)
-        p.start()
+def spill(run, directory=None):
+    """Sort a run of lines and write it to a temporary file
 
-    for p in jobs:
-        p.join()
-    for p in jobs:
-        p.terminate()
+    Args:
+        run (list): newline terminated lines
+        directory (str): directory to write the temporary file to
+    Returns:
+        file: temporary file of sorted lines, rewound to the start
+    """
+    run.sort(key=get_key)
+    file = tempfile.TemporaryFile("w+", encoding="utf-8", dir=directory)
+    file.writelines(run)
+    file.seek(0)
+    return file
+
+
+def external_sort(lines, memory_limit=SORT_MEMORY_LIMIT, directory=None):
+    """Sort lines by flight key, spilling sorted runs to disk
+
+    Lines are sorted in runs of at most memory_limit bytes, each run is
+    spilled to a temporary file and the runs are k-way merged lazily, so
+    inputs larger than memory can be sorted. Lines with equal keys keep
+    their input order.
+
+    Args:
+        lines (iterable): tab separated key/value lines
+        memory_limit (int): memory ceiling of an in-memory run, in bytes
+        directory (str): directory to spill runs to
+    Yields:
+        str: newline terminated lines in flight key order
+    """
+    runs = []
+    run = []
+    run_size = 0
+    try:
+        for line in lines:
+            if not line.strip():
+                continue
+            line = line.rstrip("\n") + "\n"
+            run.append(line)
+            run_size += sys.getsizeof(line)
+            if run_size >= memory_limit:
+                runs.append(spill(run, directory))
+                run = []
+                run_size = 0
+
+        # NOTE: Input that fits in a single run is never written to disk
+        run.sort(key=get_key)
+        if not runs:
+            yield from run
+            return
+        if run:
+            runs.append(spill(run, directory))
+        yield from heapq.merge(*runs, key=get_key)
+    finally:
+        for file in runs:
+            file.close()
 
 
 def main():
     """Main function"""
-    # Read system input of file to dataframe
-    data = pd.DataFrame(data=sys.stdin.read().splitlines())
-    # Execute mapper
-    _sort(data, hadoop_mode=True)
+    # Sort tab separated key/value lines from system input by flight key
+    memory_limit = int(os.getenv("SORT_MEMORY_LIMIT", SORT_MEMORY_LIMIT))
+    sys.stdout.writelines(external_sort(sys.stdin, memory_limit))
 
 
 if __name__ == "__main__":
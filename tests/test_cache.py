@@ -0,0 +1,103 @@
+"""Content-addressed stage output cache"""
+import os
+
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def run(tmp_path):
+    """Input, code and outputs of a run, with a reduced file and columnar directory"""
+    paths = {name: tmp_path / name for name in ("passengers.csv", "mapper.py", "reduced_data.csv", "columnar")}
+    paths["passengers.csv"].write_text("UES9151GS5,SQU6245R,DEN,FRA,1420564460,1049\n")
+    paths["mapper.py"].write_text("# mapper\n")
+    paths["reduced_data.csv"].write_text("DEN_SQU6245R,FRA,1420564460,1049,UES9151GS5\n")
+    paths["columnar"].mkdir()
+    (paths["columnar"] / "flight_id.npy").write_bytes(b"SQU6245R")
+    return {name: str(path) for name, path in paths.items()}
+
+
+@pytest.fixture
+def stage_cache(tmp_path):
+    """Cache far larger than any run's outputs"""
+    return cache.StageCache(str(tmp_path / "cache"), 1024 ** 2)
+
+
+def key_of(stage_cache, run, **settings):
+    """Cache key of the run with settings overridden"""
+    return stage_cache.key([run["passengers.csv"]], [run["mapper.py"]], {"workers": 1, **settings})
+
+
+def test_key_changes_with_input_code_and_settings(stage_cache, run):
+    key = key_of(stage_cache, run)
+    assert key == key_of(stage_cache, run)
+    assert key != key_of(stage_cache, run, workers=2)
+    with open(run["mapper.py"], "a") as file:
+        file.write("# changed\n")
+    assert key != key_of(stage_cache, run)
+
+
+def test_miss_then_hit_restores_removed_outputs(stage_cache, run):
+    key = key_of(stage_cache, run)
+    outputs = [run["reduced_data.csv"], run["columnar"]]
+    assert not stage_cache.restore(key)
+    stage_cache.store(key, outputs)
+
+    os.remove(run["reduced_data.csv"])
+    os.remove(os.path.join(run["columnar"], "flight_id.npy"))
+    assert stage_cache.restore(key)
+    with open(run["reduced_data.csv"]) as file:
+        assert file.read() == "DEN_SQU6245R,FRA,1420564460,1049,UES9151GS5\n"
+    with open(os.path.join(run["columnar"], "flight_id.npy"), "rb") as file:
+        assert file.read() == b"SQU6245R"
+    # Outputs left by the restore match the entry, so still hit
+    assert stage_cache.restore(key)
+
+
+def test_outputs_rewritten_since_are_never_overwritten(stage_cache, run):
+    key = key_of(stage_cache, run)
+    stage_cache.store(key, [run["reduced_data.csv"]])
+    with open(run["reduced_data.csv"], "a") as file:
+        file.write("JFK_XXQ4064B,FRA,1420563917,802,UES9151GS5\n")
+
+    assert not stage_cache.restore(key)
+    with open(run["reduced_data.csv"]) as file:
+        assert "JFK_XXQ4064B" in file.read()
+
+
+def test_another_cached_runs_outputs_are_restored_over(stage_cache, run):
+    first = key_of(stage_cache, run)
+    stage_cache.store(first, [run["reduced_data.csv"]])
+    second = key_of(stage_cache, run, workers=2)
+    with open(run["reduced_data.csv"], "w") as file:
+        file.write("ATL_XOY7948U,LHR,1420564038,877,CXN7304ER2\n")
+    stage_cache.store(second, [run["reduced_data.csv"]])
+
+    assert stage_cache.restore(first)
+    with open(run["reduced_data.csv"]) as file:
+        assert file.read().startswith("DEN_SQU6245R")
+
+
+def test_invalidate_drops_entries_with_the_output(stage_cache, run):
+    key = key_of(stage_cache, run)
+    stage_cache.store(key, [run["reduced_data.csv"]])
+    other = key_of(stage_cache, run, workers=2)
+    stage_cache.store(other, [run["columnar"]])
+
+    stage_cache.invalidate(os.path.relpath(run["reduced_data.csv"]))
+    assert not os.path.isdir(os.path.join(stage_cache.directory, key))
+    assert os.path.isdir(os.path.join(stage_cache.directory, other))
+
+
+def test_least_recently_used_entries_are_evicted(stage_cache, run):
+    keys = [key_of(stage_cache, run, workers=workers) for workers in range(3)]
+    for age, key in enumerate(keys):
+        stage_cache.store(key, [run["reduced_data.csv"]])
+        # NOTE: Entry mtimes order their use, set apart for coarse clocks
+        os.utime(os.path.join(stage_cache.directory, key), (age, age))
+    stage_cache.restore(keys[0])
+
+    stage_cache.max_bytes = 2 * cache.size_of(os.path.join(stage_cache.directory, keys[0]))
+    stage_cache.evict()
+    assert sorted(os.listdir(stage_cache.directory)) == sorted([keys[0], keys[2]])
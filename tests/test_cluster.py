@@ -0,0 +1,90 @@
+"""Multi-node coordinator and TCP workers, run on loopback in this process"""
+import os
+import socket
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cluster
+import encoding
+import flight
+import mapper
+import partitioning
+import reducer
+from conftest import ROOT
+
+AUTHKEY = b"cluster-tests"
+PASSENGERS = os.path.join(ROOT, "data", "AComp_Passenger_data_no_error.csv")
+COLUMNS = ["passenger_id", "flight_id", "from_airport", "to_airport", "departure_time", "flight_duration"]
+
+
+def free_address():
+    """Loopback address with a port nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()
+
+
+@pytest.fixture
+def workers():
+    """Coordinator with two worker threads registered"""
+    address = free_address()
+    nodes = [cluster.Worker(address, AUTHKEY) for _ in range(2)]
+    threads = [threading.Thread(target=node.serve, daemon=True) for node in nodes]
+    for thread in threads:
+        thread.start()
+    with cluster.Coordinator(address, AUTHKEY, len(nodes), task_timeout=60) as coordinator:
+        yield coordinator, nodes
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive()
+
+
+def test_mapreduce_matches_reducing_in_one_process(workers):
+    coordinator, _ = workers
+    data = pd.read_csv(PASSENGERS, names=COLUMNS)
+    encoded, dictionaries = encoding.encode_frame(data)
+    flight.EncodedFlight.dictionaries = dictionaries
+    # NOTE: Small reducers give several reducers and split hot keys, the
+    #   input is mapped in fewer partitions so every fetch stays quick
+    _, partitioner = partitioning.plan(encoded, 2, partition_bytes=256)
+    assert partitioner.partitions > 2 and partitioner.hot_keys
+    partitions = [encoded.iloc[rows] for rows in np.array_split(np.arange(len(encoded)), 4)]
+
+    reduce_results = coordinator.mapreduce(partitions, partitioner)
+    reduce_results = reducer.merge_split_keys(reduce_results, partitioner.hot_keys, encoded)
+    reduced = sorted(
+        (reduced_flight for flights in reduce_results for reduced_flight in flights),
+        key=lambda reduced_flight: reduced_flight.get_flight_key(),
+    )
+
+    # map_flights groups every row of a flight key, passengers in input order
+    expected = sorted(mapper.map_flights(data), key=lambda mapped: mapped.get_flight_key())
+    assert [str(reduced_flight.decode(dictionaries)) for reduced_flight in reduced] == list(map(str, expected))
+
+
+def test_failed_task_fails_the_job(workers):
+    coordinator, _ = workers
+    with pytest.raises(RuntimeError, match="failed missing task 0"):
+        coordinator.run([("missing", 0)])
+
+
+def test_shuffle_connections_need_the_key(workers):
+    _, nodes = workers
+    nodes[0]._buckets[0] = [b"bucket"]
+    with pytest.raises(AuthenticationError):
+        Client(nodes[0].shuffle_address, authkey=b"wrong")
+    # A rejected client doesn't stop the worker serving others
+    assert nodes[1]._fetch(nodes[0].shuffle_address, 0, 0) == b"bucket"
+
+
+def test_only_loopback_hosts_are_loopback():
+    assert cluster.is_loopback("127.0.0.1")
+    assert cluster.is_loopback("localhost")
+    assert not cluster.is_loopback("192.0.2.1")
+    assert not cluster.is_loopback("no such host.invalid")
+    assert cluster.parse_address("10.0.0.5:6000") == ("10.0.0.5", 6000)
@@ -0,0 +1,61 @@
+"""Columnar reduced flight format"""
+import os
+
+import numpy as np
+import pytest
+
+import columnar
+from flight import Flight
+
+REDUCED = [
+    "ATL_XOY7948U,LHR,1420564038,877,CXN7304ER2,UES9151GS5\n",
+    "DEN_SQU6245R,FRA,1420564460,1049,UES9151GS5\n",
+    "JFK_XXQ4064B,FRA,1420563917,802,EZC9678QI6,CXN7304ER2,HGO4350KK1\n",
+]
+
+
+@pytest.fixture
+def reduced_file(tmp_path):
+    file_name = tmp_path / "reduced_data.csv"
+    file_name.write_text("".join(REDUCED), encoding="utf-8")
+    return str(file_name)
+
+
+def test_round_trip_keeps_every_field(reduced_file, tmp_path):
+    directory = str(tmp_path / "columnar")
+    columnar.save(columnar.read_reduced(reduced_file), directory)
+    columns = columnar.load(directory)
+
+    assert columns["from_airport"].tolist() == [b"ATL", b"DEN", b"JFK"]
+    assert columns["flight_id"].tolist() == [b"XOY7948U", b"SQU6245R", b"XXQ4064B"]
+    assert columns["to_airport"].tolist() == [b"LHR", b"FRA", b"FRA"]
+    assert columns["depart_time"].tolist() == [1420564038, 1420564460, 1420563917]
+    assert columns["total_flight_time"].tolist() == [877, 1049, 802]
+    # Each flight's passengers are its CSR slice of the passenger dictionary
+    offsets, ids, names = columns["passenger_offsets"], columns["passenger_ids"], columns["passengers"]
+    passengers = [names[ids[start:end]].astype(str).tolist() for start, end in zip(offsets[:-1], offsets[1:])]
+    assert passengers == [list(Flight(line).passengers) for line in REDUCED]
+
+
+def test_columns_are_memory_mapped_and_fixed_width(reduced_file, tmp_path):
+    directory = str(tmp_path / "columnar")
+    columnar.save(columnar.read_reduced(reduced_file), directory)
+    for name, column in columnar.load(directory).items():
+        assert isinstance(column, np.memmap), name
+        assert column.dtype != object, name
+    # Passengers are stored once however many flights they took
+    assert len(columnar.load(directory)["passengers"]) == 4
+
+
+def test_stamp_tracks_the_reduced_file(reduced_file, tmp_path):
+    directory = str(tmp_path / "columnar")
+    assert not columnar.is_current(directory, reduced_file)
+    columnar.save(columnar.read_reduced(reduced_file), directory)
+    columnar.stamp(directory, reduced_file)
+    assert columnar.is_current(directory, reduced_file)
+
+    with open(reduced_file, "a", encoding="utf-8") as file:
+        file.write("PEK_ABC1234D,LHR,1420565000,600,UES9151GS5\n")
+    assert not columnar.is_current(directory, reduced_file)
+    os.remove(reduced_file)
+    assert not columnar.is_current(directory, reduced_file)
@@ -0,0 +1,28 @@
+"""Hadoop combiner pre-aggregation"""
+import combiner
+
+# Sorted mapper output of one map task, a passenger booked twice on ATL_AAA1111A
+MAPPED = [
+    "ATL_AAA1111A\tLHR,1420564038,877,UES9151GS5\n",
+    "ATL_AAA1111A\tLHR,1420564038,877,EZC9678QI6\n",
+    "ATL_AAA1111A\tLHR,1420564038,877,UES9151GS5\n",
+    "JFK_BBB2222B\tLAX,1420563917,302,EZC9678QI6\n",
+]
+
+
+def test_combine_merges_each_key_group_once():
+    assert list(combiner.combine(MAPPED)) == [
+        "ATL_AAA1111A\tLHR,1420564038,877,UES9151GS5,EZC9678QI6",
+        "JFK_BBB2222B\tLAX,1420563917,302,EZC9678QI6",
+    ]
+
+
+def test_combine_output_is_valid_reducer_input():
+    # NOTE: Hadoop may run the combiner any number of times, so combining
+    #   combined output must change nothing
+    once = list(combiner.combine(MAPPED))
+    assert list(combiner.combine(line + "\n" for line in once)) == once
+
+
+def test_combine_skips_blank_lines():
+    assert list(combiner.combine(["\n", MAPPED[3], "  \n"])) == ["JFK_BBB2222B\tLAX,1420563917,302,EZC9678QI6"]
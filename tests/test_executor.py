@@ -0,0 +1,103 @@
+"""Worker pool retries, timeouts and speculative execution"""
+import os
+import time
+
+import pytest
+
+from executor import Executor
+
+
+def square(value, procnum):
+    """Square of a task's value"""
+    return value * value
+
+
+def fail_first(marker, procnum):
+    """Raises on the first attempt of each task, then succeeds"""
+    if _first_attempt(marker, procnum):
+        raise ValueError(f"task {procnum} failed")
+    return procnum
+
+
+def die_first(marker, procnum):
+    """Kills its worker on the first attempt of each task"""
+    if _first_attempt(marker, procnum):
+        os._exit(1)
+    return procnum
+
+
+def hang_first(marker, procnum):
+    """Hangs on the first attempt of task 0"""
+    if procnum == 0 and _first_attempt(marker, procnum):
+        time.sleep(600)
+    return procnum
+
+
+def straggle_first(marker, procnum):
+    """Task 0's first attempt runs far longer than the other tasks"""
+    if procnum == 0 and _first_attempt(marker, procnum):
+        time.sleep(600)
+    time.sleep(0.05)
+    return procnum
+
+
+def always_fail(value, procnum):
+    """Raises on every attempt"""
+    raise ValueError("always fails")
+
+
+def _first_attempt(marker, procnum):
+    """Whether this is a task's first attempt, across worker processes"""
+    try:
+        os.close(os.open(f"{marker}.{procnum}", os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return False
+    return True
+
+
+@pytest.fixture
+def marker(tmp_path):
+    """Prefix of the files recording each task's first attempt"""
+    return str(tmp_path / "attempted")
+
+
+def test_results_are_in_task_order():
+    with Executor(2, speculation=0) as executor:
+        assert executor.map(square, list(range(10))) == [value * value for value in range(10)]
+        # Workers are reused by the next stage
+        assert executor.map(square, [3]) == [9]
+
+
+def test_failed_attempts_are_retried(marker, capsys):
+    with Executor(2, speculation=0) as executor:
+        assert executor.map(fail_first, [marker] * 3) == [0, 1, 2]
+    assert capsys.readouterr().out.count("Retrying task") == 3
+
+
+def test_attempts_on_dead_workers_are_retried(marker):
+    with Executor(2, heartbeat_interval=0.1, speculation=0) as executor:
+        assert executor.map(die_first, [marker] * 2) == [0, 1]
+
+
+def test_attempts_past_the_timeout_are_killed_and_retried(marker, capsys):
+    started = time.time()
+    with Executor(2, task_timeout=1, heartbeat_interval=0.1, speculation=0) as executor:
+        assert executor.map(hang_first, [marker] * 2) == [0, 1]
+    assert time.time() - started < 30
+    assert "TimeoutError" in capsys.readouterr().out
+
+
+def test_stage_fails_once_out_of_retries():
+    with Executor(1, retries=1, speculation=0) as executor:
+        with pytest.raises(RuntimeError, match="failed 2 times") as raised:
+            executor.map(always_fail, [None])
+    assert isinstance(raised.value.__cause__, ValueError)
+
+
+def test_stragglers_are_speculated(marker, capsys):
+    started = time.time()
+    with Executor(2, heartbeat_interval=0.1, speculation=2, speculation_min=0.5) as executor:
+        assert executor.map(straggle_first, [marker] * 6) == list(range(6))
+    # The straggler's duplicate finished, its first attempt was abandoned
+    assert time.time() - started < 30
+    assert "Speculating task 0" in capsys.readouterr().out
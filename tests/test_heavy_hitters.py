@@ -0,0 +1,60 @@
+"""Top-K and approximate heavy-hitter passenger ranking"""
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import heavy_hitters
+
+
+@pytest.fixture(scope="module")
+def flights():
+    """Passenger codes of a Zipf-skewed set of flights, split over three reducers"""
+    rng = np.random.default_rng(7)
+    codes = rng.zipf(1.5, 20000)
+    return np.array_split(codes[codes < 5000], 3)
+
+
+def test_top_k_includes_ties_with_the_kth_count():
+    counts = {"UES9151GS5": 3, "EZC9678QI6": 2, "CXN7304ER2": 2, "HGO4350KK1": 1}
+    assert heavy_hitters.top_k(counts, 2) == [("UES9151GS5", 3), ("CXN7304ER2", 2), ("EZC9678QI6", 2)]
+    assert heavy_hitters.top_k(counts, 10) == sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def test_top_k_of_nothing_is_empty():
+    assert heavy_hitters.top_k({"UES9151GS5": 3}, 0) == []
+    assert heavy_hitters.top_k({}, 3) == []
+
+
+def test_merged_exact_summaries_match_one_summary(flights):
+    merged = heavy_hitters.ExactTopK()
+    for reducer_flights in flights:
+        summary = heavy_hitters.ExactTopK()
+        summary.update(reducer_flights)
+        merged.merge(summary)
+    counts = Counter(np.concatenate(flights).tolist())
+    assert merged.counts == counts
+    assert merged.top(5) == heavy_hitters.top_k(counts, 5)
+
+
+def test_heavy_hitters_overestimate_within_the_error(flights):
+    merged = heavy_hitters.HeavyHitters(epsilon=1e-3, capacity=200)
+    for reducer_flights in flights:
+        summary = heavy_hitters.HeavyHitters(epsilon=1e-3, capacity=200)
+        # NOTE: Lists are buffered, arrays counted at once, both are summaries' input
+        summary.update(reducer_flights.tolist())
+        merged.merge(summary)
+
+    counts = Counter(np.concatenate(flights).tolist())
+    top = merged.top(5)
+    assert [item for item, _ in top] == [item for item, _ in heavy_hitters.top_k(counts, 5)]
+    for item, estimate in top:
+        assert counts[item] <= estimate <= counts[item] + merged.error()
+
+
+def test_count_min_sketch_never_underestimates():
+    sketch = heavy_hitters.CountMinSketch(epsilon=0.01, delta=0.01)
+    items = np.array(["UES9151GS5", "EZC9678QI6", "UES9151GS5", "CXN7304ER2"])
+    sketch.update(items)
+    assert (sketch.estimate(np.array(["UES9151GS5", "EZC9678QI6"])) >= [2, 1]).all()
+    assert sketch.total == 4
@@ -0,0 +1,134 @@
+"""Incremental merging of passenger data deltas"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+import incremental
+from conftest import ROOT
+
+# Reduced output of a full run
+REDUCED = [
+    "ATL_XOY7948U,LHR,1420564038,877,CXN7304ER2,UES9151GS5\n",
+    "DEN_SQU6245R,FRA,1420564460,1049,UES9151GS5\n",
+]
+# A day's new bookings, one already known, one on a known flight, one on a new flight
+DELTA = [
+    ("CXN7304ER2", "XOY7948U", "ATL", "LHR", 1420564038, 877),
+    ("HGO4350KK1", "SQU6245R", "DEN", "FRA", 1420564460, 1049),
+    ("UES9151GS5", "XXQ4064B", "JFK", "FRA", 1420563917, 802),
+]
+AIRPORTS = ["ATL", "DEN", "FRA", "JFK", "LHR"]
+
+
+def delta_frame(rows):
+    """Passenger data of delta rows, as get_passenger_data loads it"""
+    return pd.DataFrame(
+        rows, columns=["passenger_id", "flight_id", "from_airport", "to_airport", "departure_time", "flight_duration"]
+    )
+
+
+@pytest.fixture
+def reduced_file(tmp_path):
+    file_name = tmp_path / "reduced_data.csv"
+    file_name.write_text("".join(REDUCED), encoding="utf-8")
+    return str(file_name)
+
+
+@pytest.fixture
+def state(tmp_path, reduced_file):
+    with incremental.IncrementalState(str(tmp_path / "state.sqlite")) as state:
+        state.seed(reduced_file)
+        yield state
+
+
+def test_seed_aggregates_the_reduced_file(state, reduced_file):
+    assert state.is_current(reduced_file)
+    assert state.flight_counts(AIRPORTS) == {"ATL": 1, "DEN": 1, "FRA": 0, "JFK": 0, "LHR": 0}
+    assert state.passenger_counts(AIRPORTS) == {"ATL": 0, "DEN": 0, "FRA": 1, "JFK": 0, "LHR": 2}
+    assert state.passengers_with_most_flights() == (["UES9151GS5"], 2)
+
+
+def test_delta_only_re_reduces_the_keys_it_changes(state):
+    assert incremental.apply_delta(state, delta_frame(DELTA)) == 2
+    assert state.flight_counts(AIRPORTS)["JFK"] == 1
+    assert state.passenger_counts(AIRPORTS) == {"ATL": 0, "DEN": 0, "FRA": 3, "JFK": 0, "LHR": 2}
+    assert state.passengers_with_most_flights() == (["UES9151GS5"], 3)
+    # Reapplying the same delta changes nothing
+    assert incremental.apply_delta(state, delta_frame(DELTA)) == 0
+    assert state.passengers_with_most_flights() == (["UES9151GS5"], 3)
+
+
+def test_export_writes_merged_flights_in_key_order(state, reduced_file):
+    incremental.apply_delta(state, delta_frame(DELTA))
+    state.export(reduced_file)
+    with open(reduced_file, encoding="utf-8") as file:
+        assert file.readlines() == [
+            REDUCED[0],
+            "DEN_SQU6245R,FRA,1420564460,1049,UES9151GS5,HGO4350KK1\n",
+            "JFK_XXQ4064B,FRA,1420563917,802,UES9151GS5\n",
+        ]
+    assert not os.path.exists(reduced_file + ".partial")
+
+
+def test_reseeding_replaces_the_state(state, reduced_file):
+    incremental.apply_delta(state, delta_frame(DELTA))
+    state.seed(reduced_file)
+    assert state.flight_counts(AIRPORTS)["JFK"] == 0
+    assert state.passengers_with_most_flights() == (["UES9151GS5"], 2)
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch, reduced_file):
+    """Point incremental.py's settings at a scratch directory"""
+    monkeypatch.chdir(tmp_path)
+    for name, value in {
+        "DATA_DIR": os.path.join(ROOT, "data"),
+        "TASK_RESULT_DIR": str(tmp_path / "task_results"),
+        "USE_HADOOP_OUTPUT": "False",
+        "REDUCED_DATA_DIR": reduced_file,
+        "INCREMENTAL_STATE_FILE": str(tmp_path / "state.sqlite"),
+        "CACHE_DIR": str(tmp_path / "cache"),
+        "VALIDATE_INPUT": "True",
+        "QUARANTINE_FILE": str(tmp_path / "quarantine.csv"),
+    }.items():
+        monkeypatch.setenv(name, value)
+    delta_file = tmp_path / "delta.csv"
+    delta_file.write_text(
+        "".join(",".join(map(str, row)) + "\n" for row in DELTA) + "UES9151GS5,XXQ4064B,JFK\n", encoding="utf-8"
+    )
+    return str(delta_file)
+
+
+def run(monkeypatch, *args):
+    """Run incremental.py with command line arguments"""
+    monkeypatch.setattr(sys, "argv", ["incremental.py", *args])
+    incremental.main()
+
+
+def test_deltas_are_only_exported_when_asked(settings, monkeypatch, reduced_file):
+    run(monkeypatch, settings)
+    with open(reduced_file, encoding="utf-8") as file:
+        assert file.readlines() == REDUCED
+
+    run(monkeypatch, "--export")
+    with open(reduced_file, encoding="utf-8") as file:
+        assert "JFK_XXQ4064B,FRA,1420563917,802,UES9151GS5\n" in file.readlines()
+    # The short row was quarantined rather than merged
+    quarantined = pd.read_csv(os.environ["QUARANTINE_FILE"])
+    assert quarantined["line"].tolist() == [4]
+    assert quarantined["file"].tolist() == [settings]
+
+
+def test_a_new_full_run_reseeds_the_state(settings, monkeypatch, reduced_file, capsys):
+    run(monkeypatch, "--export", settings)
+    # A full run rewrites the reduced file without the delta
+    with open(reduced_file, "w", encoding="utf-8") as file:
+        file.writelines(REDUCED[:1])
+    capsys.readouterr()
+
+    run(monkeypatch, "--export")
+    assert "Seeding state" in capsys.readouterr().out
+    with open(reduced_file, encoding="utf-8") as file:
+        assert file.readlines() == REDUCED[:1]
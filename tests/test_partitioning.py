@@ -0,0 +1,53 @@
+"""Skew-aware partitioning and merging of split hot flight keys"""
+import numpy as np
+import pandas as pd
+
+import encoding
+import flight
+import mapper
+import partitioning
+import reducer
+
+
+def skewed_data():
+    """One flight carrying most passengers among a few small ones"""
+    rng = np.random.default_rng(5)
+    hot = [(f"PAX{number:04d}AA{number % 10}", "HOT0001A", "ATL", "LHR", 1420564038, 877) for number in range(2000)]
+    cold = [
+        (f"PAX{number:04d}AA{number % 10}", f"CLD{number:04d}B", "DEN", "FRA", 1420564460, 1049)
+        for number in range(40)
+    ]
+    rows = hot + cold
+    order = rng.permutation(len(rows))
+    return pd.DataFrame(
+        [rows[row] for row in order],
+        columns=["passenger_id", "flight_id", "from_airport", "to_airport", "departure_time", "flight_duration"],
+    )
+
+
+def test_hot_keys_are_split_and_merged_in_input_order():
+    data = skewed_data()
+    encoded, dictionaries = encoding.encode_frame(data)
+    flight.EncodedFlight.dictionaries = dictionaries
+    partitions, partitioner = partitioning.plan(encoded, 4, partition_bytes=4096)
+    assert len(partitioner.hot_keys) == 1
+    assert list(partitioner.hot_keys.values())[0] > 1
+
+    buckets = [mapper.shuffle_map(partition, procnum, partitioner) for procnum, partition in enumerate(partitions)]
+    reduce_results = [
+        reducer.shuffle_reduce([bucket[reducer_index] for bucket in buckets], reducer_index)
+        for reducer_index in range(partitioner.partitions)
+    ]
+    # The hot flight is reduced in parts on several reducers
+    assert sum(
+        any(reduced.decode(dictionaries).flight_id == "HOT0001A" for reduced in flights) for flights in reduce_results
+    ) > 1
+
+    merged = reducer.merge_split_keys(reduce_results, partitioner.hot_keys, encoded)
+    reduced = {
+        decoded.get_flight_key(): decoded
+        for decoded in (reduced.decode(dictionaries) for flights in merged for reduced in flights)
+    }
+    assert len(reduced) == 41
+    for mapped in mapper.map_flights(data):
+        assert list(reduced[mapped.get_flight_key()].passengers) == list(mapped.passengers)
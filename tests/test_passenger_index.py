@@ -0,0 +1,52 @@
+"""Passenger to flights inverted index"""
+import numpy as np
+
+import passenger_index
+from flight import Flight
+
+REDUCED = [
+    Flight("ATL_XOY7948U,LHR,1420564038,877,CXN7304ER2,UES9151GS5"),
+    Flight("DEN_SQU6245R,FRA,1420564460,1049,UES9151GS5,HGO4350KK1"),
+    Flight("JFK_XXQ4064B,FRA,1420563917,802,UES9151GS5,CXN7304ER2"),
+]
+
+
+def test_reduced_flights_index_every_passengers_itinerary(tmp_path):
+    passenger_index.save_reduced(REDUCED, tmp_path)
+    index = passenger_index.PassengerIndex(tmp_path)
+
+    assert len(index) == 3
+    assert index.itinerary("UES9151GS5") == ["ATL_XOY7948U", "DEN_SQU6245R", "JFK_XXQ4064B"]
+    assert index.itinerary("CXN7304ER2") == ["ATL_XOY7948U", "JFK_XXQ4064B"]
+    assert index.itinerary("HGO4350KK1") == ["DEN_SQU6245R"]
+    assert index.itinerary("EZC9678QI6") == []
+    assert index.top(1) == [("UES9151GS5", 3)]
+    assert index.top(0) == []
+
+
+def test_merged_partials_match_indexing_every_pair_at_once():
+    rng = np.random.default_rng(3)
+    passengers = rng.integers(0, 50, 2000)
+    flight_keys = rng.integers(0, 1 << 40, 2000)
+    whole = passenger_index.merge([passenger_index.build_partition(passengers, flight_keys)], 50)
+
+    # NOTE: Reducers see disjoint pairs in any split, each passenger's
+    #   flights are kept in reducer order
+    bounds = [0, 300, 1100, 1101, 2000]
+    partials = [
+        passenger_index.build_partition(passengers[start:end], flight_keys[start:end])
+        for start, end in zip(bounds, bounds[1:])
+    ]
+    offsets, keys = passenger_index.merge(partials, 50)
+
+    np.testing.assert_array_equal(offsets, whole[0])
+    np.testing.assert_array_equal(keys, whole[1])
+    for passenger in (0, 17, 49):
+        expected = flight_keys[passengers == passenger]
+        np.testing.assert_array_equal(keys[offsets[passenger]:offsets[passenger + 1]], expected)
+
+
+def test_passengers_without_flights_have_empty_slices():
+    offsets, keys = passenger_index.merge([passenger_index.build_partition(np.array([2, 2]), np.array([7, 9]))], 4)
+    assert offsets.tolist() == [0, 0, 0, 2, 2]
+    assert keys.tolist() == [7, 9]
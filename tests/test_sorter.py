@@ -0,0 +1,61 @@
+"""External merge sort with spilling"""
+import random
+
+import sorter
+
+
+def mapped_lines(count, seed=0):
+    """Mapped lines over a few flight keys in random order, each value
+    recording the line's input position"""
+    rng = random.Random(seed)
+    keys = [f"{airport}_XOY{number:04d}U" for airport in ("ATL", "DEN", "LHR") for number in range(5)]
+    return [f"{rng.choice(keys)}\tLHR,1420564038,877,{position}\n" for position in range(count)]
+
+
+def counting_spills(monkeypatch):
+    """Record the size of every run sorter.spill writes to disk"""
+    spilled = []
+    spill = sorter.spill
+
+    def record(run, directory=None):
+        spilled.append(len(run))
+        return spill(run, directory)
+
+    monkeypatch.setattr(sorter, "spill", record)
+    return spilled
+
+
+def _by_key(lines):
+    """Group sorted lines by flight key"""
+    groups = {}
+    for line in lines:
+        groups.setdefault(sorter.get_key(line), []).append(line)
+    return groups
+
+
+def test_small_input_is_sorted_in_memory(monkeypatch):
+    spilled = counting_spills(monkeypatch)
+    lines = mapped_lines(50)
+    assert list(sorter.external_sort(lines)) == sorted(lines, key=sorter.get_key)
+    assert spilled == []
+
+
+def test_input_over_the_memory_limit_spills_and_merges(monkeypatch, tmp_path):
+    spilled = counting_spills(monkeypatch)
+    lines = mapped_lines(1000)
+    # NOTE: sorted is stable, so equal keys stay in input order in both
+    assert list(sorter.external_sort(lines, memory_limit=4096, directory=tmp_path)) == sorted(lines, key=sorter.get_key)
+    assert len(spilled) > 1
+    assert sum(spilled) == len(lines)
+
+
+def test_merge_keeps_input_order_of_equal_keys():
+    lines = mapped_lines(500, seed=1)
+    for key_lines in _by_key(sorter.external_sort(lines, memory_limit=1024)).values():
+        positions = [int(line.rsplit(",", 1)[1]) for line in key_lines]
+        assert positions == sorted(positions)
+
+
+def test_blank_lines_are_dropped_and_newlines_added():
+    assert list(sorter.external_sort(["b\tx", "\n", "a\ty\n"], memory_limit=1)) == ["a\ty\n", "b\tx\n"]
+
@@ -0,0 +1,72 @@
+"""Departure time index and airborne sweep-line"""
+import numpy as np
+import pytest
+
+import columnar
+import time_index
+from flight import Flight
+
+
+@pytest.fixture(scope="module")
+def flights():
+    """Random flights over a few airports, with shared departure and arrival times"""
+    rng = np.random.default_rng(11)
+    airports = ["ATL", "DEN", "LHR"]
+    return [
+        Flight.from_fields(f"XOY{number:04d}U", str(rng.choice(airports)), "FRA",
+                           1420560000 + 60 * int(rng.integers(0, 200)), int(rng.integers(1, 120)), ["UES9151GS5"])
+        for number in range(300)
+    ]
+
+
+def airborne_at(flights, time):
+    """Brute-force count of flights in the air at a time"""
+    return sum(
+        flight.depart_time <= time < flight.depart_time + flight.total_flight_time * time_index.DURATION_SECONDS
+        for flight in flights
+    )
+
+
+def test_departing_matches_a_scan(flights):
+    index = time_index.DepartureIndex.from_flights(flights)
+    start, end = 1420563000, 1420566000
+    for airport in ("ATL", "DEN", "LHR"):
+        expected = sorted(
+            (flight.depart_time, flight.get_flight_key()) for flight in flights
+            if flight.from_airport == airport and start <= flight.depart_time <= end
+        )
+        departing = index.departing(airport, start, end)
+        assert [time for _, time in departing] == [time for time, _ in expected]
+        assert sorted(departing, key=lambda pair: (pair[1], pair[0])) == [(key, time) for time, key in expected]
+    assert index.departing("PEK", start, end) == []
+
+
+def test_airborne_counts_departures_but_not_arrivals_at_a_time():
+    index = time_index.DepartureIndex.from_flights([
+        Flight("ATL_XOY7948U,LHR,1000,2,UES9151GS5"),
+        Flight("LHR_SQU6245R,ATL,1120,1,UES9151GS5"),
+    ])
+    assert index.airborne(999) == 0
+    assert index.airborne(1000) == 1
+    # The first lands as the second departs
+    assert index.airborne(1120) == 1
+    assert index.airborne(1180) == 0
+
+
+def test_airborne_between_steps_at_every_change(flights):
+    index = time_index.DepartureIndex.from_flights(flights)
+    times, airborne = index.airborne_between(1420562000, 1420570000)
+    assert times[0] == 1420562000
+    assert (np.diff(times) > 0).all()
+    for time, count in zip(times.tolist(), airborne.tolist()):
+        assert count == airborne_at(flights, time)
+        # Constant until the next change
+        assert airborne_at(flights, time + 1) == count or time + 1 in times
+
+
+def test_columnar_and_flight_indexes_agree(flights, tmp_path):
+    columnar.save(flights, tmp_path)
+    from_columns = time_index.DepartureIndex.from_columns(columnar.load(tmp_path))
+    from_flights = time_index.DepartureIndex.from_flights(flights)
+    assert from_columns.departing("DEN", 1420560000, 1420570000) == from_flights.departing("DEN", 1420560000, 1420570000)
+    np.testing.assert_array_equal(from_columns.event_airborne, from_flights.event_airborne)
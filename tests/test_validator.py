@@ -0,0 +1,68 @@
+"""Ingest validation and quarantine"""
+import os
+
+import pandas as pd
+import pytest
+
+import validator
+
+DIRTY = os.path.join(os.path.dirname(__file__), "data", "dirty_passengers.csv")
+AIRPORTS = ["ATL", "CLT", "DEN", "FRA", "JFK", "LHR", "MIA", "ORD", "PEK"]
+
+
+class SerialExecutor:
+    """Stands in for Executor.map, running every chunk in this process"""
+
+    def __init__(self, workers):
+        """Args:
+            workers (int): number of chunks to split the file into
+        """
+        self.workers = workers
+
+    def map(self, func, partitions):
+        """Run func(partition, procnum) over each partition in order"""
+        return [func(partition, procnum) for procnum, partition in enumerate(partitions)]
+
+
+def test_rejects_each_bad_row_with_its_reasons():
+    valid, rejected = validator.validate(DIRTY, AIRPORTS)
+
+    assert valid["flight_id"].tolist() == ["SQU6245R", "XXQ4064B", "WSK1289Z", "XOY7948U"]
+    assert valid["departure_time"].dtype.kind == "i"
+    assert rejected["line"].tolist() == [3, 4, 5, 6, 8]
+    assert rejected["reasons"].tolist() == [
+        "passenger_id not XXXnnnnXXn",
+        "to_airport unknown airport",
+        "departure_time not n",
+        "expected 6 fields",
+        "expected 6 fields",
+    ]
+    assert rejected["row"].iloc[1] == "EZC9678QI6,SOH3431A,ORD,XXX,1420563649,250"
+
+
+@pytest.mark.parametrize("workers", [2, 3, 5])
+def test_chunked_validation_matches_one_chunk(workers):
+    valid, rejected = validator.validate(DIRTY, AIRPORTS)
+    chunked_valid, chunked_rejected = validator.validate(DIRTY, AIRPORTS, SerialExecutor(workers))
+    pd.testing.assert_frame_equal(chunked_valid.reset_index(drop=True), valid.reset_index(drop=True))
+    # NOTE: Chunks without rejected rows may concat to a different string dtype
+    pd.testing.assert_frame_equal(chunked_rejected, rejected, check_dtype=False)
+
+
+def test_chunk_ranges_split_on_line_boundaries():
+    with open(DIRTY, "rb") as file:
+        content = file.read()
+    ranges = validator.chunk_ranges(DIRTY, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(content)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert content[end - 1:end] == b"\n"
+
+
+def test_quarantine_writes_rejected_rows(tmp_path):
+    _, rejected = validator.validate(DIRTY, AIRPORTS)
+    file_name = tmp_path / "quarantine.csv"
+    validator.quarantine(rejected, file_name)
+    quarantined = pd.read_csv(file_name, keep_default_na=False)
+    assert quarantined.columns.tolist() == ["line", "reasons", "row"]
+    assert quarantined["row"].tolist() == rejected["row"].tolist()
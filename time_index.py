@@ -0,0 +1,138 @@
+"""Departure time index and time window queries over reduced flights
+
+Each origin airport's departure times are kept as a sorted NumPy epoch
+array, so the flights departing an airport within a window are found by
+binary search, in O(log n + k) for k flights in the window. Departures
+and arrivals are also merged into one sorted sweep-line of events with
+the number of aircraft airborne after each, so the airborne count at a
+time, or its every change within a window, is read the same way.
+"""
+import numpy as np
+
+# Flight durations are in minutes, departure times in epoch seconds
+DURATION_SECONDS = 60
+
+
+class DepartureIndex:
+    """Reduced flights indexed by origin airport and departure time
+
+    A flight is airborne from its departure time up to, but not
+    including, its arrival time.
+
+    Attributes:
+        airports (dict): origin airports to (sorted departure times, flight
+            keys in departure order)
+        departures (np.ndarray): every departure time, sorted
+        arrivals (np.ndarray): every arrival time, sorted
+        event_times (np.ndarray): distinct departure and arrival times, sorted
+        event_airborne (np.ndarray): aircraft airborne from each event time
+    """
+
+    def __init__(self, from_airports, keys, depart_times, flight_times):
+        """Index flights
+
+        Args:
+            from_airports (np.ndarray): origin airport of each flight
+            keys (np.ndarray): flight key of each flight
+            depart_times (np.ndarray): departure epoch time of each flight
+            flight_times (np.ndarray): duration of each flight in minutes
+        """
+        from_airports = np.asarray(from_airports)
+        keys = np.asarray(keys)
+        depart_times = np.asarray(depart_times, dtype=np.int64)
+        arrive_times = depart_times + np.asarray(flight_times, dtype=np.int64) * DURATION_SECONDS
+
+        # Sort by airport then departure time, and slice out each airport
+        order = np.lexsort((depart_times, from_airports))
+        airports, starts = np.unique(from_airports[order], return_index=True)
+        self.airports = {
+            airport: (depart_times[rows], keys[rows])
+            for airport, rows in zip(airports.tolist(), np.split(order, starts[1:]))
+        }
+
+        # Sweep-line of +1 departure and -1 arrival events
+        self.departures = np.sort(depart_times)
+        self.arrivals = np.sort(arrive_times)
+        times = np.concatenate([depart_times, arrive_times])
+        deltas = np.concatenate([np.ones(len(depart_times), np.int64), -np.ones(len(arrive_times), np.int64)])
+        order = np.argsort(times, kind="stable")
+        airborne = np.cumsum(deltas[order])
+        # NOTE: Every event at a time applies at once, keep the count after the last
+        self.event_times, last = np.unique(times[order][::-1], return_index=True)
+        self.event_airborne = airborne[::-1][last]
+
+    @classmethod
+    def from_flights(cls, flights):
+        """Index reduced flights
+
+        Args:
+            flights (iterable): reduced Flight objects
+        Returns:
+            DepartureIndex: index of the flights
+        """
+        flights = list(flights)
+        return cls(
+            np.array([flight.from_airport for flight in flights], dtype=object),
+            np.array([flight.get_flight_key() for flight in flights], dtype=object),
+            np.fromiter((flight.depart_time for flight in flights), np.int64, len(flights)),
+            np.fromiter((flight.total_flight_time for flight in flights), np.int64, len(flights)),
+        )
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Index columnar reduced flights
+
+        Args:
+            columns (dict): column arrays loaded by columnar.load
+        Returns:
+            DepartureIndex: index of the flights
+        """
+        from_airports = np.char.decode(columns["from_airport"], "ascii")
+        keys = np.char.add(np.char.add(from_airports, "_"), np.char.decode(columns["flight_id"], "ascii"))
+        return cls(from_airports, keys, columns["depart_time"], columns["total_flight_time"])
+
+    def departing(self, airport, start, end):
+        """Flights departing an airport within a window
+
+        Args:
+            airport (str): origin airport
+            start (int): window start epoch time, inclusive
+            end (int): window end epoch time, inclusive
+        Returns:
+            list: (flight key, departure time) pairs in departure order
+        """
+        if airport not in self.airports:
+            return []
+        times, keys = self.airports[airport]
+        lo = np.searchsorted(times, start, side="left")
+        hi = np.searchsorted(times, end, side="right")
+        return list(zip(keys[lo:hi].tolist(), times[lo:hi].tolist()))
+
+    def airborne(self, time):
+        """Number of aircraft airborne at a time
+
+        Args:
+            time (int): epoch time
+        Returns:
+            int: flights departed at or before the time and not yet arrived
+        """
+        departed = np.searchsorted(self.departures, time, side="right")
+        arrived = np.searchsorted(self.arrivals, time, side="right")
+        return int(departed - arrived)
+
+    def airborne_between(self, start, end):
+        """Number of aircraft airborne over a window, at every change
+
+        Args:
+            start (int): window start epoch time
+            end (int): window end epoch time, inclusive
+        Returns:
+            np.ndarray: the window start then every event time within it
+            np.ndarray: aircraft airborne from each of those times
+        """
+        lo = np.searchsorted(self.event_times, start, side="right")
+        hi = np.searchsorted(self.event_times, end, side="right")
+        return (
+            np.concatenate([[start], self.event_times[lo:hi]]),
+            np.concatenate([[self.airborne(start)], self.event_airborne[lo:hi]]),
+        )
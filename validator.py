@@ -0,0 +1,153 @@
+"""Ingest validation and quarantine of passenger data
+
+Every field of every row is checked against the data-set formats in the
+README with vectorized regular expressions, each worker reading and
+checking its own byte range of the file. Rows failing any check are
+written to a quarantine file with the reasons they were rejected, so
+dirty passenger data can be fed straight into the MapReduce process.
+"""
+import csv
+import functools
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+COLUMNS = [
+    "passenger_id",
+    "flight_id",
+    "from_airport",
+    "to_airport",
+    "departure_time",
+    "flight_duration",
+]
+# README format and pattern of each free-form field
+FORMATS = {
+    "passenger_id": ("XXXnnnnXXn", r"[A-Z]{3}[0-9]{4}[A-Z]{2}[0-9]"),
+    "flight_id": ("XXXnnnnX", r"[A-Z]{3}[0-9]{4}[A-Z]"),
+    "departure_time": ("n", r"[0-9]+"),
+    "flight_duration": ("n", r"[0-9]+"),
+}
+# Fields that must be one of the airport data's airport codes
+AIRPORT_COLUMNS = ["from_airport", "to_airport"]
+
+
+def chunk_ranges(file_name, chunks):
+    """Split a file into byte ranges of whole lines
+
+    Args:
+        file_name (str): file to split
+        chunks (int): number of ranges
+    Returns:
+        list: (start, end) byte offsets of each range
+    """
+    size = os.path.getsize(file_name)
+    bounds = [0]
+    with open(file_name, "rb") as file:
+        for chunk in range(1, chunks):
+            # Move each bound forward to the start of the next line
+            file.seek(max(size * chunk // chunks, bounds[-1]))
+            file.readline()
+            bounds.append(min(file.tell(), size))
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def validate_chunk(chunk, procnum, file_name, airport_codes):
+    """Validate the passenger data rows in a byte range of a file
+
+    Args:
+        chunk (tuple): (start, end) byte offsets of whole lines
+        procnum (int): thread/process number representing the index of the chunk
+        file_name (str): passenger data csv file
+        airport_codes (frozenset): known airport codes
+    Returns:
+        pd.DataFrame: valid rows as passenger data
+        pd.DataFrame: line number within the chunk, reasons and row of
+            each rejected row
+        int: number of lines in the chunk
+    """
+    with instrument.stage("validate", procnum) as fields:
+        # NOTE: Each worker reads its own range, rows aren't pickled to it
+        start, end = chunk
+        with open(file_name, "rb") as file:
+            file.seek(start)
+            lines = pd.Series(file.read(end - start).decode("utf-8", errors="replace").splitlines(), dtype=object)
+        fields["records_in"] = len(lines)
+
+        # Only rows with every field are parsed, with the C csv parser
+        complete = (lines.str.count(",") == len(COLUMNS) - 1).to_numpy()
+        data = pd.read_csv(
+            io.StringIO("\n".join(lines[complete])),
+            header=None,
+            names=COLUMNS,
+            dtype=str,
+            na_filter=False,
+            quoting=csv.QUOTE_NONE,
+            skip_blank_lines=False,
+        )
+
+        invalid = {
+            column: ~data[column].str.fullmatch(pattern).to_numpy(bool)
+            for column, (_, pattern) in FORMATS.items()
+        }
+        for column in AIRPORT_COLUMNS:
+            invalid[column] = ~data[column].isin(airport_codes).to_numpy()
+
+        # Join the reason for every failed check, a column at a time
+        reasons = np.full(len(data), "", dtype=object)
+        for column in COLUMNS:
+            label = f"{column} unknown airport" if column in AIRPORT_COLUMNS else f"{column} not {FORMATS[column][0]}"
+            reasons = reasons + np.where(invalid[column], label + "; ", "")
+        rejected = reasons != ""
+
+        line_reasons = np.full(len(lines), f"expected {len(COLUMNS)} fields", dtype=object)
+        line_reasons[complete] = pd.Series(reasons, dtype=object).str.rstrip("; ").to_numpy()
+        quarantined = line_reasons != ""
+
+        valid = data[~rejected].astype({"departure_time": np.int64, "flight_duration": np.int64})
+        rejected_rows = pd.DataFrame({
+            "line": np.flatnonzero(quarantined) + 1,
+            "reasons": line_reasons[quarantined],
+            "row": lines[quarantined].to_numpy(),
+        })
+        fields["records_out"] = len(valid)
+    return valid, rejected_rows, len(lines)
+
+
+def validate(file_name, airports, executor=None):
+    """Validate a passenger data file, in parallel if given an executor
+
+    Args:
+        file_name (str): passenger data csv file
+        airports (iterable): known airport codes
+        executor (Executor): worker pool to validate chunks on, validates
+            in this process if None
+    Returns:
+        pd.DataFrame: valid rows as passenger data, in file order
+        pd.DataFrame: line number, reasons and row of each rejected row
+    """
+    func = functools.partial(validate_chunk, file_name=file_name, airport_codes=frozenset(airports))
+    if executor is None:
+        results = [func((0, os.path.getsize(file_name)), 0)]
+    else:
+        results = executor.map(func, chunk_ranges(file_name, executor.workers))
+
+    valid, rejected, line_counts = zip(*results)
+    # Offset each chunk's line numbers by the lines of the chunks before it
+    for rows, offset in zip(rejected, np.cumsum([0, *line_counts[:-1]])):
+        rows["line"] += offset
+    return pd.concat(valid, ignore_index=True), pd.concat(rejected, ignore_index=True)
+
+
+def quarantine(rejected, file_name):
+    """Write rejected rows and the reasons they were rejected
+
+    Args:
+        rejected (pd.DataFrame): rejected rows from validate
+        file_name (str): quarantine csv file
+    """
+    rejected.to_csv(file_name, index=False)